@@ -431,6 +431,12 @@ TRANSACTIONS_MANAGED = False
 DEFAULT_TABLESPACE = ''
 DEFAULT_INDEX_TABLESPACE = ''
 
+# Number of lazy loads of a relation, or of queries of the same shape, above
+# which the N+1 queries detector reports them, and whether it prefetches
+# foreign keys accessed in a loop. See django/db/nplusone.py.
+NPLUSONE_THRESHOLD = 2
+NPLUSONE_AUTO_PREFETCH = False
+
 # Default X-Frame-Options header value
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
@@ -273,7 +273,7 @@ class SQLDateCompiler(compiler.SQLDateCompiler, GeoSQLCompiler):
     `GeoQuery.resolve_columns` is used for spatial values.
     See #14648, #16757.
     """
-    def results_iter(self):
+    def results_iter(self, chunk_size=None):
         if self.connection.ops.oracle:
             from django.db.models.fields import DateTimeField
             fields = [DateTimeField()]
@@ -281,16 +281,20 @@ class SQLDateCompiler(compiler.SQLDateCompiler, GeoSQLCompiler):
             needs_string_cast = self.connection.features.needs_datetime_string_cast
 
         offset = len(self.query.extra_select)
-        for rows in self.execute_sql(MULTI):
-            for row in rows:
-                date = row[offset]
-                if self.connection.ops.oracle:
-                    date = self.resolve_columns(row, fields)[offset]
-                elif needs_string_cast:
-                    date = typecast_date(str(date))
-                if isinstance(date, datetime.datetime):
-                    date = date.date()
-                yield date
+        results = self.execute_sql(MULTI, chunk_size=chunk_size)
+        try:
+            for rows in results:
+                for row in rows:
+                    date = row[offset]
+                    if self.connection.ops.oracle:
+                        date = self.resolve_columns(row, fields)[offset]
+                    elif needs_string_cast:
+                        date = typecast_date(str(date))
+                    if isinstance(date, datetime.datetime):
+                        date = date.date()
+                    yield date
+        finally:
+            compiler.close_results(results)
 
 
 class SQLDateTimeCompiler(compiler.SQLDateTimeCompiler, GeoSQLCompiler):
@@ -299,7 +303,7 @@ class SQLDateTimeCompiler(compiler.SQLDateTimeCompiler, GeoSQLCompiler):
     `GeoQuery.resolve_columns` is used for spatial values.
     See #14648, #16757.
     """
-    def results_iter(self):
+    def results_iter(self, chunk_size=None):
         if self.connection.ops.oracle:
             from django.db.models.fields import DateTimeField
             fields = [DateTimeField()]
@@ -307,16 +311,20 @@ class SQLDateTimeCompiler(compiler.SQLDateTimeCompiler, GeoSQLCompiler):
             needs_string_cast = self.connection.features.needs_datetime_string_cast
 
         offset = len(self.query.extra_select)
-        for rows in self.execute_sql(MULTI):
-            for row in rows:
-                datetime = row[offset]
-                if self.connection.ops.oracle:
-                    datetime = self.resolve_columns(row, fields)[offset]
-                elif needs_string_cast:
-                    datetime = typecast_timestamp(str(datetime))
-                # Datetimes are artificially returned in UTC on databases that
-                # don't support time zone. Restore the zone used in the query.
-                if settings.USE_TZ:
-                    datetime = datetime.replace(tzinfo=None)
-                    datetime = timezone.make_aware(datetime, self.query.tzinfo)
-                yield datetime
+        results = self.execute_sql(MULTI, chunk_size=chunk_size)
+        try:
+            for rows in results:
+                for row in rows:
+                    datetime = row[offset]
+                    if self.connection.ops.oracle:
+                        datetime = self.resolve_columns(row, fields)[offset]
+                    elif needs_string_cast:
+                        datetime = typecast_timestamp(str(datetime))
+                    # Datetimes are artificially returned in UTC on databases that
+                    # don't support time zone. Restore the zone used in the query.
+                    if settings.USE_TZ:
+                        datetime = datetime.replace(tzinfo=None)
+                        datetime = timezone.make_aware(datetime, self.query.tzinfo)
+                    yield datetime
+        finally:
+            compiler.close_results(results)
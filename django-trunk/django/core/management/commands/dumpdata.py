@@ -147,7 +147,9 @@ class Command(BaseCommand):
                     queryset = objects.using(using).order_by(model._meta.pk.name)
                     if primary_keys:
                         queryset = queryset.filter(pk__in=primary_keys)
-                    for obj in queryset.iterator():
+                    # Stream the objects, with a server-side cursor if
+                    # possible, instead of loading them at once.
+                    for obj in queryset.iterator(chunk_size='auto'):
                         yield obj
 
         try:
@@ -1,7 +1,11 @@
 import collections
+import json
 from math import ceil
 
+from django.core.exceptions import ValidationError
 from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 
 class InvalidPage(Exception):
@@ -16,6 +20,10 @@ class EmptyPage(InvalidPage):
     pass
 
 
+class InvalidCursor(InvalidPage):
+    pass
+
+
 class Paginator(object):
 
     def __init__(self, object_list, per_page, orphans=0,
@@ -159,3 +167,149 @@ class Page(collections.Sequence):
         if self.number == self.paginator.num_pages:
             return self.paginator.count
         return self.number * self.paginator.per_page
+
+
+class CursorPaginator(object):
+    """
+    Paginates a QuerySet on the values of its ordering fields (keyset
+    pagination) rather than on offsets.
+
+    Pages are addressed by opaque cursors instead of page numbers, so no
+    COUNT query is needed, deep pages cost the same as the first one and
+    rows inserted while paginating neither shift nor duplicate results.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pk',)):
+        self.per_page = int(per_page)
+        self.model = queryset.model
+        self.ordering = tuple(ordering)
+        self.fields = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                field = self.model._meta.pk
+            else:
+                field = self.model._meta.get_field(name)
+            self.fields.append((field, descending))
+        self.queryset = queryset.order_by(*self.ordering)
+
+    def page(self, cursor=None):
+        """
+        Returns a CursorPage for the given cursor, or the first page if the
+        cursor is empty.
+        """
+        if cursor:
+            position, backwards = self.decode_cursor(cursor)
+        else:
+            position, backwards = None, False
+        objects = list(self.get_objects(position, backwards, self.per_page + 1))
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if backwards:
+            objects.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = position is not None, has_more
+        return self._get_page(objects, self, has_previous, has_next)
+
+    def _get_page(self, *args, **kwargs):
+        """
+        Returns an instance of a single page.
+
+        This hook can be used by subclasses to use an alternative to the
+        standard :cls:`CursorPage` object.
+        """
+        return CursorPage(*args, **kwargs)
+
+    def get_objects(self, position, backwards, limit):
+        """
+        Returns at most ``limit`` objects following ``position`` (or
+        preceding it, nearest first, if ``backwards`` is True).
+
+        This hook can be used by subclasses to paginate something other than
+        the QuerySet given to the constructor.
+        """
+        queryset = self.queryset
+        if backwards:
+            queryset = queryset.reverse()
+        if position is not None:
+            queryset = queryset.filter(self._position_filter(position, backwards))
+        return queryset[:limit]
+
+    def _position_filter(self, position, backwards):
+        """
+        Builds the Q object matching the rows strictly after ``position``
+        in the pagination order (or before it if ``backwards`` is True):
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        from django.db.models import Q
+        query = Q()
+        for i, (field, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != backwards else 'gt'
+            filters = dict((previous.attname, value)
+                           for (previous, _), value in zip(self.fields[:i], position))
+            filters['%s__%s' % (field.attname, lookup)] = position[i]
+            query |= Q(**filters)
+        return query
+
+    def encode_cursor(self, obj, backwards):
+        values = [force_text(field.value_to_string(obj)) for field, _ in self.fields]
+        data = json.dumps([int(backwards)] + values, separators=(',', ':'))
+        return force_text(urlsafe_base64_encode(force_bytes(data)))
+
+    def decode_cursor(self, cursor):
+        """
+        Returns the ``(position, backwards)`` pair encoded in ``cursor``.
+        """
+        try:
+            data = json.loads(force_text(urlsafe_base64_decode(force_text(cursor))))
+            if not isinstance(data, list):
+                raise ValueError
+            backwards, values = bool(data[0]), data[1:]
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = tuple(field.to_python(value)
+                             for (field, _), value in zip(self.fields, values))
+        except (TypeError, ValueError, IndexError, ValidationError):
+            raise InvalidCursor('That cursor is not valid')
+        return position, backwards
+
+
+class CursorPage(collections.Sequence):
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+
+    def __repr__(self):
+        return '<CursorPage of %s objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        if not isinstance(index, (slice,) + six.integer_types):
+            raise TypeError
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_cursor(self):
+        if not self.has_next():
+            raise InvalidCursor('That page is the last one')
+        return self.paginator.encode_cursor(self.object_list[-1], backwards=False)
+
+    def previous_cursor(self):
+        if not self.has_previous():
+            raise InvalidCursor('That page is the first one')
+        return self.paginator.encode_cursor(self.object_list[0], backwards=True)
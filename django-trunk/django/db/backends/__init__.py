@@ -40,6 +40,10 @@ class BaseDatabaseWrapper(object):
         self.settings_dict = settings_dict
         self.alias = alias
         self.use_debug_cursor = None
+        # SQL of the queries compiled on this connection, reused by the
+        # queries of the same shape. Disabled by default.
+        cache_size = settings_dict.get('COMPILED_SQL_CACHE_SIZE', 0)
+        self.compiled_sql_cache = utils.CompiledSQLCache(cache_size) if cache_size else None
 
         # Savepoint management related attributes
         self.savepoint_state = 0
@@ -157,12 +161,24 @@ class BaseDatabaseWrapper(object):
         Creates a cursor, opening a connection if necessary.
         """
         self.validate_thread_sharing()
+        return self._prepare_cursor(self._cursor())
+
+    def chunked_cursor(self):
+        """
+        Returns a cursor for reading a large result set in chunks: a
+        server-side cursor on the backends supporting them, a regular cursor
+        otherwise.
+        """
+        return self.cursor()
+
+    def _prepare_cursor(self, cursor):
+        """
+        Wraps a cursor of the backend, logging its queries if needed.
+        """
         if (self.use_debug_cursor or
                 (self.use_debug_cursor is None and settings.DEBUG)):
-            cursor = self.make_debug_cursor(self._cursor())
-        else:
-            cursor = utils.CursorWrapper(self._cursor(), self)
-        return cursor
+            return self.make_debug_cursor(cursor)
+        return utils.CursorWrapper(cursor, self)
 
     def commit(self):
         """
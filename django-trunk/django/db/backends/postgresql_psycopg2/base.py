@@ -3,6 +3,7 @@ PostgreSQL database backend for Django.
 
 Requires psycopg 2: http://initd.org/projects/psycopg2
 """
+import itertools
 
 from django.conf import settings
 from django.db.backends import (BaseDatabaseFeatures, BaseDatabaseWrapper,
@@ -17,6 +18,7 @@ from django.db.utils import InterfaceError
 from django.utils.encoding import force_str
 from django.utils.functional import cached_property
 from django.utils.safestring import SafeText, SafeBytes
+from django.utils.six.moves import _thread as thread
 from django.utils.timezone import utc
 
 try:
@@ -97,6 +99,8 @@ class DatabaseWrapper(BaseDatabaseWrapper):
         RC = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
         self.isolation_level = opts.get('isolation_level', RC)
 
+        self._named_cursor_ids = itertools.count(1)
+
         self.features = DatabaseFeatures(self)
         self.ops = DatabaseOperations(self)
         self.client = DatabaseClient(self)
@@ -156,11 +160,27 @@ class DatabaseWrapper(BaseDatabaseWrapper):
                 if not self.get_autocommit():
                     self.connection.commit()
 
-    def create_cursor(self):
-        cursor = self.connection.cursor()
+    def create_cursor(self, name=None):
+        if name:
+            # Outside of a transaction, the cursor must be WITH HOLD to
+            # survive the commit ending its DECLARE.
+            cursor = self.connection.cursor(name, withhold=self.autocommit)
+        else:
+            cursor = self.connection.cursor()
         cursor.tzinfo_factory = utc_tzinfo_factory if settings.USE_TZ else None
         return cursor
 
+    def chunked_cursor(self):
+        # Server-side cursors don't survive transaction pooling, e.g. by
+        # pgbouncer; DISABLE_SERVER_SIDE_CURSORS falls back to regular ones.
+        if self.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+            return self.cursor()
+        self.validate_thread_sharing()
+        self.ensure_connection()
+        name = '_django_curs_%d_%d' % (thread.get_ident(), next(self._named_cursor_ids))
+        with self.wrap_database_errors:
+            return self._prepare_cursor(self.create_cursor(name))
+
     def _set_isolation_level(self, isolation_level):
         assert isolation_level in range(1, 5)     # Use set_autocommit for level = 0
         if self.psycopg2_version >= (2, 4, 2):
@@ -4,9 +4,11 @@ import datetime
 import decimal
 import hashlib
 import logging
+from collections import OrderedDict
 from time import time
 
 from django.conf import settings
+from django.db import nplusone
 from django.utils.encoding import force_bytes
 from django.utils.timezone import utc
 
@@ -82,6 +84,9 @@ class CursorDebugWrapper(CursorWrapper):
         finally:
             stop = time()
             duration = stop - start
+            detector = nplusone.get_detector()
+            if detector is not None:
+                detector.executed(self.db.alias, sql)
             sql = self.db.ops.last_executed_query(self.cursor, sql, params)
             self.db.queries.append({
                 'sql': sql,
@@ -111,6 +116,47 @@ class CursorDebugWrapper(CursorWrapper):
             )
 
 
+class CompiledSQLCache(object):
+    """
+    A least recently used cache of the SQL of the queries compiled on a
+    connection, keyed by Query.get_fingerprint(). Connections are used by
+    one thread at a time, so it isn't locked.
+
+    Entries are kept in an OrderedDict from the least to the most recently
+    used, so that a hit moves its entry to the end and a miss evicts the
+    first one, both in constant time.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        try:
+            # OrderedDict has no move_to_end() on Python 2
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.max_size:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
 ###############################################
 # Converters from database (string) to Python #
 ###############################################
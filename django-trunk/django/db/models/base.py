@@ -1455,6 +1455,83 @@ def get_absolute_url(opts, func, self, *args, **kwargs):
 # MISC #
 ########
 
+# (model, attnames) -> function building instances from rows, see
+# get_row_loader().
+_row_loaders = {}
+
+
+def get_row_loader(model, attnames=None):
+    """
+    Returns a function taking a sequence of values of the fields named by
+    ``attnames`` -- all the concrete fields of ``model`` by default -- and the
+    alias of the database they were read from, and returning the instance of
+    ``model`` loaded from these values.
+
+    Unless ``model`` overrides ``__init__()`` or pre_init or post_init have
+    receivers for it, the instances are created without calling
+    ``__init__()``: the values are stored directly in their ``__dict__``, or
+    set through the descriptors of the fields that have one. The attributes
+    of these functions are computed once for each model and field set.
+    """
+    if (six.get_unbound_function(model.__init__) is not six.get_unbound_function(Model.__init__) or
+            signals.pre_init.has_listeners(model) or signals.post_init.has_listeners(model)):
+        if attnames is None:
+            def load(values, using):
+                obj = model(*values)
+                obj._state.db = using
+                obj._state.adding = False
+                return obj
+        else:
+            def load(values, using):
+                obj = model(**dict(zip(attnames, values)))
+                obj._state.db = using
+                obj._state.adding = False
+                return obj
+        return load
+
+    try:
+        return _row_loaders[model, attnames]
+    except KeyError:
+        pass
+
+    names = attnames
+    if names is None:
+        names = tuple(field.attname for field in model._meta.concrete_fields)
+    # Fields whose class attribute is a data descriptor (FileField, fields
+    # using SubfieldBase, ...) must be set through it.
+    setters = []
+    for i, name in enumerate(names):
+        for klass in model.__mro__:
+            if name in klass.__dict__:
+                if hasattr(klass.__dict__[name], '__set__'):
+                    setters.append((i, name))
+                break
+    new = model.__new__
+
+    if not setters:
+        def load(values, using):
+            obj = new(model)
+            obj.__dict__.update(zip(names, values))
+            obj._state = state = ModelState(using)
+            state.adding = False
+            return obj
+    else:
+        set_names = set(name for _, name in setters)
+        plain = [(i, name) for i, name in enumerate(names) if name not in set_names]
+
+        def load(values, using):
+            obj = new(model)
+            obj._state = state = ModelState(using)
+            state.adding = False
+            obj.__dict__.update((name, values[i]) for i, name in plain)
+            for i, name in setters:
+                setattr(obj, name, values[i])
+            return obj
+
+    _row_loaders[model, attnames] = load
+    return load
+
+
 
 def simple_class_factory(model, attrs):
     """
@@ -4,7 +4,7 @@ from operator import attrgetter
 
 from django.apps import apps
 from django.core import checks
-from django.db import connection, connections, router, transaction
+from django.db import connection, connections, nplusone, router, transaction
 from django.db.backends import utils
 from django.db.models import signals, Q
 from django.db.models.deletion import SET_NULL, SET_DEFAULT, CASCADE
@@ -410,6 +410,9 @@ class SingleRelatedObjectDescriptor(six.with_metaclass(RenameRelatedObjectDescri
             related_pk = instance._get_pk_val()
             if related_pk is None:
                 rel_obj = None
+            elif nplusone.lazy_load(instance, self.related.get_accessor_name()):
+                # Prefetched along with the other instances of its queryset.
+                return self.__get__(instance, instance_type)
             else:
                 params = {}
                 for lh_field, rh_field in self.related.field.related_fields:
@@ -557,6 +560,9 @@ class ReverseSingleRelatedObjectDescriptor(six.with_metaclass(RenameRelatedObjec
             val = self.field.get_local_related_value(instance)
             if None in val:
                 rel_obj = None
+            elif nplusone.lazy_load(instance, self.field.name):
+                # Prefetched along with the other instances of its queryset.
+                return self.__get__(instance, instance_type)
             else:
                 params = dict(
                     (rh_field.attname, getattr(instance, lh_field.attname))
@@ -672,6 +678,7 @@ def create_foreign_related_manager(superclass, rel_field, rel_model):
                     if val is None or (val == '' and empty_strings_as_null):
                         return qs.none()
                 qs._known_related_objects = {rel_field: {self.instance.pk: self.instance}}
+                nplusone.lazy_load(self.instance, rel_field.related.get_accessor_name(), single=False)
                 return qs
 
         def get_prefetch_queryset(self, instances, queryset=None):
@@ -875,6 +882,13 @@ def create_many_related_manager(superclass, rel):
                 qs._add_hints(instance=self.instance)
                 if self._db:
                     qs = qs.using(self._db)
+                detector = nplusone.get_detector()
+                if detector is not None:
+                    if self.reverse:
+                        name = self.model._meta.get_field(self.query_field_name).related.get_accessor_name()
+                    else:
+                        name = self.prefetch_cache_name
+                    detector.lazy_load(self.instance, name, single=False)
                 return qs._next_is_sticky().filter(**self.core_filters)
 
         def get_prefetch_queryset(self, instances, queryset=None):
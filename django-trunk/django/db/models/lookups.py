@@ -73,6 +73,10 @@ class Transform(RegisterLookupMixin):
     def get_group_by_cols(self):
         return self.lhs.get_group_by_cols()
 
+    def get_fingerprint(self):
+        # The SQL of a custom transform may depend on anything.
+        return None
+
 
 class Lookup(RegisterLookupMixin):
     lookup_name = None
@@ -130,6 +134,14 @@ class Lookup(RegisterLookupMixin):
             cols.extend(self.rhs.get_group_by_cols())
         return cols
 
+    def get_fingerprint(self):
+        """
+        Returns a hashable value identifying the SQL of this lookup apart
+        from its parameters, or None if the SQL may depend on the value (see
+        Query.get_fingerprint()). Custom lookups aren't fingerprinted.
+        """
+        return None
+
     def as_sql(self, qn, connection):
         raise NotImplementedError
 
@@ -155,6 +167,19 @@ class BuiltinLookup(Lookup):
     def get_rhs_op(self, connection, rhs):
         return connection.operators[self.lookup_name] % rhs
 
+    def get_fingerprint(self):
+        if not self.rhs_is_direct_value() or not hasattr(self.lhs, 'get_fingerprint'):
+            return None
+        lhs = self.lhs.get_fingerprint()
+        if lhs is None:
+            return None
+        # A list of values has a placeholder per value.
+        if isinstance(self.rhs, (list, tuple, set, frozenset)):
+            rhs = len(self.rhs)
+        else:
+            rhs = None
+        return (self.__class__, lhs, rhs)
+
 
 default_lookups = {}
 
@@ -309,6 +334,13 @@ class DateLookup(BuiltinLookup):
     def get_rhs_op(self, connection, rhs):
         return '= %s' % rhs
 
+    def get_fingerprint(self):
+        fingerprint = super(DateLookup, self).get_fingerprint()
+        if fingerprint is None or not settings.USE_TZ:
+            return fingerprint
+        # Some backends put the name of the time zone in the SQL.
+        return fingerprint + (timezone.get_current_timezone_name(),)
+
 
 class Month(DateLookup):
     lookup_name = 'month'
@@ -355,6 +387,12 @@ class IsNull(BuiltinLookup):
             return "%s IS NULL" % sql, params
         else:
             return "%s IS NOT NULL" % sql, params
+
+    def get_fingerprint(self):
+        fingerprint = super(IsNull, self).get_fingerprint()
+        if fingerprint is None:
+            return None
+        return fingerprint + (bool(self.rhs),)
 default_lookups['isnull'] = IsNull
 
 
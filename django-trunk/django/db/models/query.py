@@ -2,19 +2,22 @@
 The main QuerySet implementation. This provides the public API for the ORM.
 """
 
-from collections import deque
+import array
+from collections import deque, OrderedDict
 import copy
+import datetime
+import itertools
 import sys
 
 from django.conf import settings
 from django.core import exceptions
-from django.db import connections, router, transaction, IntegrityError
+from django.db import connections, nplusone, router, transaction, IntegrityError
 from django.db.models.constants import LOOKUP_SEP
 from django.db.models.fields import AutoField, Empty
 from django.db.models.query_utils import (Q, select_related_descend,
     deferred_class_factory, InvalidQuery)
 from django.db.models.deletion import Collector
-from django.db.models.sql.constants import CURSOR
+from django.db.models.sql.constants import CURSOR, GET_ITERATOR_CHUNK_SIZE, MULTI
 from django.db.models import sql
 from django.utils.functional import partition
 from django.utils import six
@@ -202,11 +205,16 @@ class QuerySet(object):
     # METHODS THAT DO DATABASE QUERIES #
     ####################################
 
-    def iterator(self):
+    def iterator(self, chunk_size=None):
         """
         An iterator over the results from applying this QuerySet to the
         database.
+
+        chunk_size is the number of rows fetched from the database at a
+        time, or 'auto' to adapt it to the rows; when it is given, a
+        server-side cursor is used if the database supports them.
         """
+        from django.db.models.base import get_row_loader
         fill_cache = False
         if connections[self.db].features.supports_select_related:
             fill_cache = self.query.select_related
@@ -262,47 +270,92 @@ class QuerySet(object):
         if fill_cache:
             klass_info = get_klass_info(model, max_depth=max_depth,
                                         requested=requested, only_load=only_load)
-        for row in compiler.results_iter():
-            if fill_cache:
-                obj, _ = get_cached_row(row, index_start, db, klass_info,
-                                        offset=len(aggregate_select))
-            else:
-                # Omit aggregates in object creation.
-                row_data = row[index_start:aggregate_start]
-                if skip:
-                    obj = model_cls(**dict(zip(init_list, row_data)))
+        elif skip:
+            load = get_row_loader(model_cls, tuple(init_list))
+        else:
+            load = get_row_loader(model)
+        results = compiler.results_iter(chunk_size=chunk_size)
+        try:
+            for row in results:
+                if fill_cache:
+                    obj, _ = get_cached_row(row, index_start, db, klass_info,
+                                            offset=len(aggregate_select))
                 else:
-                    obj = model(*row_data)
-
-                # Store the source database of the object
-                obj._state.db = db
-                # This object came from the database; it's not being added.
-                obj._state.adding = False
-
-            if extra_select:
-                for i, k in enumerate(extra_select):
-                    setattr(obj, k, row[i])
-
-            # Add the aggregates to the model
-            if aggregate_select:
-                for i, aggregate in enumerate(aggregate_select):
-                    setattr(obj, aggregate, row[i + aggregate_start])
-
-            # Add the known related objects to the model, if there are any
-            if self._known_related_objects:
-                for field, rel_objs in self._known_related_objects.items():
-                    # Avoid overwriting objects loaded e.g. by select_related
-                    if hasattr(obj, field.get_cache_name()):
-                        continue
-                    pk = getattr(obj, field.get_attname())
-                    try:
-                        rel_obj = rel_objs[pk]
-                    except KeyError:
-                        pass               # may happen in qs1 | qs2 scenarios
-                    else:
-                        setattr(obj, field.name, rel_obj)
+                    # Omit aggregates in object creation. The object is marked
+                    # as coming from the database db.
+                    obj = load(row[index_start:aggregate_start], db)
+
+                if extra_select:
+                    for i, k in enumerate(extra_select):
+                        setattr(obj, k, row[i])
+
+                # Add the aggregates to the model
+                if aggregate_select:
+                    for i, aggregate in enumerate(aggregate_select):
+                        setattr(obj, aggregate, row[i + aggregate_start])
+
+                # Add the known related objects to the model, if there are any
+                if self._known_related_objects:
+                    for field, rel_objs in self._known_related_objects.items():
+                        # Avoid overwriting objects loaded e.g. by select_related
+                        if hasattr(obj, field.get_cache_name()):
+                            continue
+                        pk = getattr(obj, field.get_attname())
+                        try:
+                            rel_obj = rel_objs[pk]
+                        except KeyError:
+                            pass               # may happen in qs1 | qs2 scenarios
+                        else:
+                            setattr(obj, field.name, rel_obj)
 
-            yield obj
+                yield obj
+        finally:
+            results.close()
+
+    def to_arrays(self, *fields, **kwargs):
+        """
+        Returns an OrderedDict mapping the names of the fields, as for
+        values_list(), to the columns of their values: an array.array for
+        integer, boolean and float fields without NULLs, a list otherwise, or
+        a NumPy array with numpy=True.
+
+        Rows are fetched chunk_size at a time ('auto' by default, see
+        iterator()) and spread over the columns chunk by chunk, so no tuple is
+        kept per row.
+        """
+        use_numpy = kwargs.pop('numpy', False)
+        chunk_size = kwargs.pop('chunk_size', 'auto')
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments to to_arrays: %s'
+                    % (list(kwargs),))
+        if use_numpy:
+            # Fail before running the query if NumPy isn't installed.
+            import numpy  # NOQA
+
+        clone = self.values_list(*fields)
+        extra_names = list(clone.query.extra_select)
+        aggregate_names = list(clone.query.aggregate_select)
+        names = extra_names + clone.field_names + aggregate_names
+        model_fields = dict(zip(clone.field_names, [info.field for info in clone.query.select]))
+        columns = [ResultColumn(model_fields.get(name)) for name in names]
+
+        compiler = clone.query.get_compiler(using=clone.db)
+        if aggregate_names or hasattr(compiler, 'resolve_columns'):
+            # The values are converted row by row by results_iter().
+            results = compiler.results_iter(chunk_size=chunk_size)
+            chunks = iter(lambda: list(itertools.islice(results, GET_ITERATOR_CHUNK_SIZE)), [])
+        else:
+            chunks = compiler.execute_sql(MULTI, chunk_size=chunk_size)
+        for rows in chunks:
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+
+        columns = dict(zip(names, columns))
+        if clone._fields:
+            names = list(clone._fields) + [f for f in aggregate_names if f not in clone._fields]
+        return OrderedDict(
+            (name, columns[name].to_numpy() if use_numpy else columns[name].values)
+            for name in names)
 
     def aggregate(self, *args, **kwargs):
         """
@@ -962,6 +1015,9 @@ class QuerySet(object):
     def _fetch_all(self):
         if self._result_cache is None:
             self._result_cache = list(self.iterator())
+            detector = nplusone.get_detector()
+            if detector is not None:
+                detector.fetched(self, self._result_cache)
         if self._prefetch_related_lookups and not self._prefetch_done:
             self._prefetch_related_objects()
 
@@ -1067,7 +1123,7 @@ class ValuesQuerySet(QuerySet):
     def defer(self, *fields):
         raise NotImplementedError("ValuesQuerySet does not implement defer()")
 
-    def iterator(self):
+    def iterator(self, chunk_size=None):
         # Purge any extra columns that haven't been explicitly asked for
         extra_names = list(self.query.extra_select)
         field_names = self.field_names
@@ -1075,8 +1131,12 @@ class ValuesQuerySet(QuerySet):
 
         names = extra_names + field_names + aggregate_names
 
-        for row in self.query.get_compiler(self.db).results_iter():
-            yield dict(zip(names, row))
+        results = self.query.get_compiler(self.db).results_iter(chunk_size=chunk_size)
+        try:
+            for row in results:
+                yield dict(zip(names, row))
+        finally:
+            results.close()
 
     def delete(self):
         # values().delete() doesn't work currently - make sure it raises an
@@ -1195,33 +1255,37 @@ class ValuesQuerySet(QuerySet):
 
 
 class ValuesListQuerySet(ValuesQuerySet):
-    def iterator(self):
-        if self.flat and len(self._fields) == 1:
-            for row in self.query.get_compiler(self.db).results_iter():
-                yield row[0]
-        elif not self.query.extra_select and not self.query.aggregate_select:
-            for row in self.query.get_compiler(self.db).results_iter():
-                yield tuple(row)
-        else:
-            # When extra(select=...) or an annotation is involved, the extra
-            # cols are always at the start of the row, and we need to reorder
-            # the fields to match the order in self._fields.
-            extra_names = list(self.query.extra_select)
-            field_names = self.field_names
-            aggregate_names = list(self.query.aggregate_select)
-
-            names = extra_names + field_names + aggregate_names
-
-            # If a field list has been specified, use it. Otherwise, use the
-            # full list of fields, including extras and aggregates.
-            if self._fields:
-                fields = list(self._fields) + [f for f in aggregate_names if f not in self._fields]
+    def iterator(self, chunk_size=None):
+        results = self.query.get_compiler(self.db).results_iter(chunk_size=chunk_size)
+        try:
+            if self.flat and len(self._fields) == 1:
+                for row in results:
+                    yield row[0]
+            elif not self.query.extra_select and not self.query.aggregate_select:
+                for row in results:
+                    yield tuple(row)
             else:
-                fields = names
+                # When extra(select=...) or an annotation is involved, the extra
+                # cols are always at the start of the row, and we need to reorder
+                # the fields to match the order in self._fields.
+                extra_names = list(self.query.extra_select)
+                field_names = self.field_names
+                aggregate_names = list(self.query.aggregate_select)
+
+                names = extra_names + field_names + aggregate_names
+
+                # If a field list has been specified, use it. Otherwise, use the
+                # full list of fields, including extras and aggregates.
+                if self._fields:
+                    fields = list(self._fields) + [f for f in aggregate_names if f not in self._fields]
+                else:
+                    fields = names
 
-            for row in self.query.get_compiler(self.db).results_iter():
-                data = dict(zip(names, row))
-                yield tuple(data[f] for f in fields)
+                for row in results:
+                    data = dict(zip(names, row))
+                    yield tuple(data[f] for f in fields)
+        finally:
+            results.close()
 
     def _clone(self, *args, **kwargs):
         clone = super(ValuesListQuerySet, self)._clone(*args, **kwargs)
@@ -1232,8 +1296,8 @@ class ValuesListQuerySet(ValuesQuerySet):
 
 
 class DateQuerySet(QuerySet):
-    def iterator(self):
-        return self.query.get_compiler(self.db).results_iter()
+    def iterator(self, chunk_size=None):
+        return self.query.get_compiler(self.db).results_iter(chunk_size=chunk_size)
 
     def _setup_query(self):
         """
@@ -1257,8 +1321,8 @@ class DateQuerySet(QuerySet):
 
 
 class DateTimeQuerySet(QuerySet):
-    def iterator(self):
-        return self.query.get_compiler(self.db).results_iter()
+    def iterator(self, chunk_size=None):
+        return self.query.get_compiler(self.db).results_iter(chunk_size=chunk_size)
 
     def _setup_query(self):
         """
@@ -1282,6 +1346,97 @@ class DateTimeQuerySet(QuerySet):
         return c
 
 
+# The array.array typecodes of the columns of QuerySet.to_arrays(), by
+# internal type of the field.
+ARRAY_TYPECODES = {
+    'AutoField': 'l',
+    'BigIntegerField': 'l',
+    'BooleanField': 'b',
+    'FloatField': 'd',
+    'IntegerField': 'l',
+    'PositiveIntegerField': 'l',
+    'PositiveSmallIntegerField': 'l',
+    'SmallIntegerField': 'l',
+}
+
+
+def get_internal_type(field):
+    """
+    Returns the internal type of field, or of the field it points to for a
+    foreign key, or None for columns without a field.
+    """
+    if field is None:
+        return None
+    internal_type = field.get_internal_type()
+    if internal_type in ('ForeignKey', 'OneToOneField'):
+        return get_internal_type(field.related_field)
+    return internal_type
+
+
+class ResultColumn(object):
+    """
+    The values of a column of the results of QuerySet.to_arrays().
+    """
+    def __init__(self, field):
+        self.internal_type = get_internal_type(field)
+        typecode = ARRAY_TYPECODES.get(self.internal_type)
+        self.values = array.array(typecode) if typecode else []
+
+    def extend(self, values):
+        if isinstance(self.values, array.array):
+            size = len(self.values)
+            try:
+                self.values.extend(values)
+                return
+            except (TypeError, OverflowError):
+                # NULLs or values out of the range of the typecode. extend()
+                # keeps the values it added before failing.
+                del self.values[size:]
+                self.values = self.values.tolist()
+        self.values.extend(values)
+
+    def to_numpy(self):
+        import numpy
+        values = self.values
+        if isinstance(values, array.array):
+            column = numpy.frombuffer(values, dtype=values.typecode)
+            return column.astype(bool) if values.typecode == 'b' else column
+        if self.internal_type in ARRAY_TYPECODES:
+            # NULLs become NaN.
+            return numpy.array(values, dtype=float)
+        if self.internal_type in ('DateField', 'DateTimeField'):
+            return self.dates_to_numpy()
+        column = numpy.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+
+    def dates_to_numpy(self):
+        """
+        Converts dates or datetimes, in UTC if USE_TZ is True; NULLs become
+        NaT. NumPy converts date and datetime objects one by one, slowly:
+        each value is turned into a number of days or microseconds since the
+        epoch instead, in a single pass read by one numpy.fromiter() call.
+        That pass still runs in Python, like the database adapter creating
+        the objects, so a column of dates remains slower to convert than
+        one of numbers.
+        """
+        import numpy
+        nat = numpy.iinfo(numpy.int64).min
+        if self.internal_type == 'DateField':
+            epoch = datetime.date(1970, 1, 1).toordinal()
+            # Also fits the datetimes of the backends without a date type.
+            numbers = (nat if value is None else value.toordinal() - epoch
+                       for value in self.values)
+            unit = 'D'
+        else:
+            epoch = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc if settings.USE_TZ else None)
+            deltas = (None if value is None else value - epoch for value in self.values)
+            numbers = (nat if delta is None else (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+                       for delta in deltas)
+            unit = 'us'
+        return numpy.fromiter(numbers, numpy.int64, len(self.values)).astype('datetime64[%s]' % unit)
+
+
 def get_klass_info(klass, max_depth=0, cur_depth=0, requested=None,
                    only_load=None, from_parent=None):
     """
@@ -1389,12 +1544,14 @@ def get_klass_info(klass, max_depth=0, cur_depth=0, requested=None,
                 klass_info = get_klass_info(o.model, max_depth=max_depth, cur_depth=cur_depth + 1,
                                             requested=next, only_load=only_load, from_parent=parent)
                 reverse_related_fields.append((o.field, klass_info))
+    from django.db.models.base import get_row_loader
     if field_names:
         pk_idx = field_names.index(klass._meta.pk.attname)
     else:
         pk_idx = klass._meta.pk_index()
+    load = get_row_loader(klass, tuple(field_names) or None)
 
-    return klass, field_names, field_count, related_fields, reverse_related_fields, pk_idx
+    return klass, field_names, field_count, related_fields, reverse_related_fields, pk_idx, load
 
 
 def get_cached_row(row, index_start, using, klass_info, offset=0,
@@ -1420,7 +1577,7 @@ def get_cached_row(row, index_start, using, klass_info, offset=0,
     """
     if klass_info is None:
         return None
-    klass, field_names, field_count, related_fields, reverse_related_fields, pk_idx = klass_info
+    klass, field_names, field_count, related_fields, reverse_related_fields, pk_idx, load = klass_info
 
     fields = row[index_start:index_start + field_count]
     # If the pk column is None (or the equivalent '' in the case the
@@ -1430,18 +1587,16 @@ def get_cached_row(row, index_start, using, klass_info, offset=0,
         (connections[using].features.interprets_empty_strings_as_nulls and
          fields[pk_idx] == '')):
         obj = None
-    elif field_names:
+    elif field_names and parent_data:
+        field_names = list(field_names)
         fields = list(fields)
         for rel_field, value in parent_data:
             field_names.append(rel_field.attname)
             fields.append(value)
-        obj = klass(**dict(zip(field_names, fields)))
+        from django.db.models.base import get_row_loader
+        obj = get_row_loader(klass, tuple(field_names))(fields, using)
     else:
-        obj = klass(*fields)
-    # If an object was retrieved, set the database state.
-    if obj:
-        obj._state.db = using
-        obj._state.adding = False
+        obj = load(fields, using)
 
     # Instantiate related fields
     index_end = index_start + field_count + offset
@@ -1904,23 +2059,25 @@ def prefetch_one_level(instances, prefetcher, lookup, level):
         rel_attr_val = rel_obj_attr(rel_obj)
         rel_obj_cache.setdefault(rel_attr_val, []).append(rel_obj)
 
-    for obj in instances:
-        instance_attr_val = instance_attr(obj)
-        vals = rel_obj_cache.get(instance_attr_val, [])
-        to_attr, as_attr = lookup.get_current_to_attr(level)
-        if single:
-            val = vals[0] if vals else None
-            to_attr = to_attr if as_attr else cache_name
-            setattr(obj, to_attr, val)
-        else:
-            if as_attr:
-                setattr(obj, to_attr, vals)
+    # The related managers would report the caching as lazy loads.
+    with nplusone.suspended():
+        for obj in instances:
+            instance_attr_val = instance_attr(obj)
+            vals = rel_obj_cache.get(instance_attr_val, [])
+            to_attr, as_attr = lookup.get_current_to_attr(level)
+            if single:
+                val = vals[0] if vals else None
+                to_attr = to_attr if as_attr else cache_name
+                setattr(obj, to_attr, val)
             else:
-                # Cache in the QuerySet.all().
-                qs = getattr(obj, to_attr).all()
-                qs._result_cache = vals
-                # We don't want the individual qs doing prefetch_related now,
-                # since we have merged this into the current work.
-                qs._prefetch_done = True
-                obj._prefetched_objects_cache[cache_name] = qs
+                if as_attr:
+                    setattr(obj, to_attr, vals)
+                else:
+                    # Cache in the QuerySet.all().
+                    qs = getattr(obj, to_attr).all()
+                    qs._result_cache = vals
+                    # We don't want the individual qs doing prefetch_related now,
+                    # since we have merged this into the current work.
+                    qs._prefetch_done = True
+                    obj._prefetched_objects_cache[cache_name] = qs
     return all_related_objects, additional_lookups
@@ -1,4 +1,6 @@
 import datetime
+import sys
+import time
 
 from django.conf import settings
 from django.core.exceptions import FieldError
@@ -7,7 +9,8 @@ from django.db.models.constants import LOOKUP_SEP
 from django.db.models.expressions import ExpressionNode
 from django.db.models.query_utils import select_related_descend, QueryWrapper
 from django.db.models.sql.constants import (CURSOR, SINGLE, MULTI, NO_RESULTS,
-        ORDER_DIR, GET_ITERATOR_CHUNK_SIZE, SelectInfo)
+        ORDER_DIR, GET_ITERATOR_CHUNK_SIZE, ADAPTIVE_CHUNK_TIME,
+        ADAPTIVE_CHUNK_MAX_BYTES, SelectInfo)
 from django.db.models.sql.datastructures import EmptyResultSet
 from django.db.models.sql.expressions import SQLEvaluator
 from django.db.models.sql.query import get_order_dir, Query
@@ -90,6 +93,18 @@ class SQLCompiler(object):
         if with_limits and self.query.low_mark == self.query.high_mark:
             return '', ()
 
+        cache = self.connection.compiled_sql_cache
+        cache_key = None
+        if cache is not None and not with_col_aliases:
+            # The fingerprint must be taken before pre_sql_setup() changes
+            # the query.
+            fingerprint = self.query.get_fingerprint()
+            if fingerprint is not None:
+                cache_key = (fingerprint, with_limits)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return self.as_cached_sql(*cached)
+
         self.pre_sql_setup()
         # After executing the query, we must get rid of any joins the query
         # setup created. So, take note of alias counts before the query ran.
@@ -171,7 +186,26 @@ class SQLCompiler(object):
         # Finally do cleanup - get rid of the joins we created above.
         self.query.reset_refcounts(self.refcounts_before)
 
-        return ' '.join(result), tuple(params)
+        sql = ' '.join(result)
+        # Only the SQL whose parameters all come from the where clause can
+        # be reused with the parameters of another query.
+        if cache_key is not None and len(params) == len(w_params):
+            cache.set(cache_key, (sql, list(self.ordering_aliases), list(self.query.related_select_cols)))
+        return sql, tuple(params)
+
+    def as_cached_sql(self, sql, ordering_aliases, related_select_cols):
+        """
+        Returns the SQL found in the compiled SQL cache with the parameters
+        of this query, and sets up the state results_iter() expects from
+        as_sql().
+        """
+        self.ordering_aliases = ordering_aliases
+        # Known related_select_cols save pre_sql_setup() the walk of the
+        # select_related() models.
+        self.query.related_select_cols = list(related_select_cols)
+        self.pre_sql_setup()
+        where, params = self.compile(self.query.where)
+        return sql, tuple(params)
 
     def as_nested_sql(self):
         """
@@ -689,61 +723,67 @@ class SQLCompiler(object):
         self.query.deferred_to_data(columns, self.query.deferred_to_columns_cb)
         return columns
 
-    def results_iter(self):
+    def results_iter(self, chunk_size=None):
         """
         Returns an iterator over the results from executing this query.
+
+        See execute_sql() for chunk_size.
         """
         resolve_columns = hasattr(self, 'resolve_columns')
         fields = None
         has_aggregate_select = bool(self.query.aggregate_select)
-        for rows in self.execute_sql(MULTI):
-            for row in rows:
-                if has_aggregate_select:
-                    loaded_fields = self.query.get_loaded_field_names().get(self.query.model, set()) or self.query.select
-                    aggregate_start = len(self.query.extra_select) + len(loaded_fields)
-                    aggregate_end = aggregate_start + len(self.query.aggregate_select)
-                if resolve_columns:
-                    if fields is None:
-                        # We only set this up here because
-                        # related_select_cols isn't populated until
-                        # execute_sql() has been called.
-
-                        # We also include types of fields of related models that
-                        # will be included via select_related() for the benefit
-                        # of MySQL/MySQLdb when boolean fields are involved
-                        # (#15040).
-
-                        # This code duplicates the logic for the order of fields
-                        # found in get_columns(). It would be nice to clean this up.
-                        if self.query.select:
-                            fields = [f.field for f in self.query.select]
-                        elif self.query.default_cols:
-                            fields = self.query.get_meta().concrete_fields
-                        else:
-                            fields = []
-                        fields = fields + [f.field for f in self.query.related_select_cols]
-
-                        # If the field was deferred, exclude it from being passed
-                        # into `resolve_columns` because it wasn't selected.
-                        only_load = self.deferred_to_columns()
-                        if only_load:
-                            fields = [f for f in fields if f.model._meta.db_table not in only_load or
-                                      f.column in only_load[f.model._meta.db_table]]
-                        if has_aggregate_select:
-                            # pad None in to fields for aggregates
-                            fields = fields[:aggregate_start] + [
-                                None for x in range(0, aggregate_end - aggregate_start)
-                            ] + fields[aggregate_start:]
-                    row = self.resolve_columns(row, fields)
-
-                if has_aggregate_select:
-                    row = tuple(row[:aggregate_start]) + tuple(
-                        self.query.resolve_aggregate(value, aggregate, self.connection)
-                        for (alias, aggregate), value
-                        in zip(self.query.aggregate_select.items(), row[aggregate_start:aggregate_end])
-                    ) + tuple(row[aggregate_end:])
-
-                yield row
+        results = self.execute_sql(MULTI, chunk_size=chunk_size)
+        try:
+            for rows in results:
+                for row in rows:
+                    if has_aggregate_select:
+                        loaded_fields = self.query.get_loaded_field_names().get(self.query.model, set()) or self.query.select
+                        aggregate_start = len(self.query.extra_select) + len(loaded_fields)
+                        aggregate_end = aggregate_start + len(self.query.aggregate_select)
+                    if resolve_columns:
+                        if fields is None:
+                            # We only set this up here because
+                            # related_select_cols isn't populated until
+                            # execute_sql() has been called.
+
+                            # We also include types of fields of related models that
+                            # will be included via select_related() for the benefit
+                            # of MySQL/MySQLdb when boolean fields are involved
+                            # (#15040).
+
+                            # This code duplicates the logic for the order of fields
+                            # found in get_columns(). It would be nice to clean this up.
+                            if self.query.select:
+                                fields = [f.field for f in self.query.select]
+                            elif self.query.default_cols:
+                                fields = self.query.get_meta().concrete_fields
+                            else:
+                                fields = []
+                            fields = fields + [f.field for f in self.query.related_select_cols]
+
+                            # If the field was deferred, exclude it from being passed
+                            # into `resolve_columns` because it wasn't selected.
+                            only_load = self.deferred_to_columns()
+                            if only_load:
+                                fields = [f for f in fields if f.model._meta.db_table not in only_load or
+                                          f.column in only_load[f.model._meta.db_table]]
+                            if has_aggregate_select:
+                                # pad None in to fields for aggregates
+                                fields = fields[:aggregate_start] + [
+                                    None for x in range(0, aggregate_end - aggregate_start)
+                                ] + fields[aggregate_start:]
+                        row = self.resolve_columns(row, fields)
+
+                    if has_aggregate_select:
+                        row = tuple(row[:aggregate_start]) + tuple(
+                            self.query.resolve_aggregate(value, aggregate, self.connection)
+                            for (alias, aggregate), value
+                            in zip(self.query.aggregate_select.items(), row[aggregate_start:aggregate_end])
+                        ) + tuple(row[aggregate_end:])
+
+                    yield row
+        finally:
+            close_results(results)
 
     def has_results(self):
         """
@@ -755,7 +795,7 @@ class SQLCompiler(object):
         self.query.set_extra_mask(['a'])
         return bool(self.execute_sql(SINGLE))
 
-    def execute_sql(self, result_type=MULTI):
+    def execute_sql(self, result_type=MULTI, chunk_size=None):
         """
         Run the query against the database and returns the result(s). The
         return value is a single data item if result_type is SINGLE, or an
@@ -767,9 +807,20 @@ class SQLCompiler(object):
         subclasses such as InsertQuery). It's possible, however, that no query
         is needed, as the filters describe an empty set. In that case, None is
         returned, to avoid any unnecessary database interaction.
+
+        With MULTI, chunk_size is the number of rows fetched at a time, or
+        'auto' to adapt it to the size of the rows and the time taken to
+        fetch them. When it is given, the rows are read from the cursor
+        returned by the chunked_cursor() method of the connection, a
+        server-side cursor on the backends supporting them. By default,
+        GET_ITERATOR_CHUNK_SIZE rows are fetched at a time from a regular
+        cursor.
         """
         if not result_type:
             result_type = NO_RESULTS
+        if chunk_size is not None and chunk_size != 'auto':
+            if not isinstance(chunk_size, six.integer_types) or chunk_size <= 0:
+                raise ValueError("chunk_size must be a strictly positive integer or 'auto'.")
         try:
             sql, params = self.as_sql()
             if not sql:
@@ -780,7 +831,11 @@ class SQLCompiler(object):
             else:
                 return
 
-        cursor = self.connection.cursor()
+        if result_type == MULTI and chunk_size is not None:
+            cursor = self.connection.chunked_cursor()
+        else:
+            cursor = self.connection.cursor()
+            chunk_size = GET_ITERATOR_CHUNK_SIZE
         try:
             cursor.execute(sql, params)
         except Exception:
@@ -806,10 +861,10 @@ class SQLCompiler(object):
         # The MULTI case.
         if self.ordering_aliases:
             result = order_modified_iter(cursor, len(self.ordering_aliases),
-                    self.connection.features.empty_fetchmany_value)
+                    self.connection.features.empty_fetchmany_value, chunk_size)
         else:
             result = cursor_iter(cursor,
-                self.connection.features.empty_fetchmany_value)
+                self.connection.features.empty_fetchmany_value, chunk_size)
         if not self.connection.features.can_use_chunked_reads:
             try:
                 # If we are using non-chunked reads, we return the same data
@@ -1087,7 +1142,7 @@ class SQLAggregateCompiler(SQLCompiler):
 
 
 class SQLDateCompiler(SQLCompiler):
-    def results_iter(self):
+    def results_iter(self, chunk_size=None):
         """
         Returns an iterator over the results from executing this query.
         """
@@ -1100,20 +1155,24 @@ class SQLDateCompiler(SQLCompiler):
             needs_string_cast = self.connection.features.needs_datetime_string_cast
 
         offset = len(self.query.extra_select)
-        for rows in self.execute_sql(MULTI):
-            for row in rows:
-                date = row[offset]
-                if resolve_columns:
-                    date = self.resolve_columns(row, fields)[offset]
-                elif needs_string_cast:
-                    date = typecast_date(str(date))
-                if isinstance(date, datetime.datetime):
-                    date = date.date()
-                yield date
+        results = self.execute_sql(MULTI, chunk_size=chunk_size)
+        try:
+            for rows in results:
+                for row in rows:
+                    date = row[offset]
+                    if resolve_columns:
+                        date = self.resolve_columns(row, fields)[offset]
+                    elif needs_string_cast:
+                        date = typecast_date(str(date))
+                    if isinstance(date, datetime.datetime):
+                        date = date.date()
+                    yield date
+        finally:
+            close_results(results)
 
 
 class SQLDateTimeCompiler(SQLCompiler):
-    def results_iter(self):
+    def results_iter(self, chunk_size=None):
         """
         Returns an iterator over the results from executing this query.
         """
@@ -1126,39 +1185,88 @@ class SQLDateTimeCompiler(SQLCompiler):
             needs_string_cast = self.connection.features.needs_datetime_string_cast
 
         offset = len(self.query.extra_select)
-        for rows in self.execute_sql(MULTI):
-            for row in rows:
-                datetime = row[offset]
-                if resolve_columns:
-                    datetime = self.resolve_columns(row, fields)[offset]
-                elif needs_string_cast:
-                    datetime = typecast_timestamp(str(datetime))
-                # Datetimes are artificially returned in UTC on databases that
-                # don't support time zone. Restore the zone used in the query.
-                if settings.USE_TZ:
-                    if datetime is None:
-                        raise ValueError("Database returned an invalid value "
-                                         "in QuerySet.datetimes(). Are time zone "
-                                         "definitions for your database and pytz installed?")
-                    datetime = datetime.replace(tzinfo=None)
-                    datetime = timezone.make_aware(datetime, self.query.tzinfo)
-                yield datetime
-
-
-def cursor_iter(cursor, sentinel):
+        results = self.execute_sql(MULTI, chunk_size=chunk_size)
+        try:
+            for rows in results:
+                for row in rows:
+                    datetime = row[offset]
+                    if resolve_columns:
+                        datetime = self.resolve_columns(row, fields)[offset]
+                    elif needs_string_cast:
+                        datetime = typecast_timestamp(str(datetime))
+                    # Datetimes are artificially returned in UTC on databases that
+                    # don't support time zone. Restore the zone used in the query.
+                    if settings.USE_TZ:
+                        if datetime is None:
+                            raise ValueError("Database returned an invalid value "
+                                             "in QuerySet.datetimes(). Are time zone "
+                                             "definitions for your database and pytz installed?")
+                        datetime = datetime.replace(tzinfo=None)
+                        datetime = timezone.make_aware(datetime, self.query.tzinfo)
+                    yield datetime
+        finally:
+            close_results(results)
+
+
+def fetch_chunks(cursor, sentinel, chunk_size=GET_ITERATOR_CHUNK_SIZE):
+    """
+    Yields blocks of chunk_size rows from a cursor. If chunk_size is 'auto',
+    blocks start at GET_ITERATOR_CHUNK_SIZE rows and double while fetching
+    one takes less than ADAPTIVE_CHUNK_TIME, as long as they take less than
+    ADAPTIVE_CHUNK_MAX_BYTES; they are halved when fetching one takes more
+    than twice that time. Large blocks save round trips to the database on
+    server-side cursors, and Python calls on the others.
+    """
+    if chunk_size != 'auto':
+        for rows in iter((lambda: cursor.fetchmany(chunk_size)), sentinel):
+            yield rows
+        return
+    size = GET_ITERATOR_CHUNK_SIZE
+    max_size = None
+    while True:
+        start = time.time()
+        rows = cursor.fetchmany(size)
+        elapsed = time.time() - start
+        if rows == sentinel:
+            return
+        yield rows
+        if max_size is None:
+            # The width of the rows is estimated from the first one.
+            row_bytes = sys.getsizeof(rows[0]) + sum(sys.getsizeof(value) for value in rows[0])
+            max_size = max(ADAPTIVE_CHUNK_MAX_BYTES // row_bytes, GET_ITERATOR_CHUNK_SIZE)
+        if elapsed < ADAPTIVE_CHUNK_TIME:
+            size = min(size * 2, max_size)
+        elif elapsed > 2 * ADAPTIVE_CHUNK_TIME:
+            size = max(size // 2, GET_ITERATOR_CHUNK_SIZE)
+
+
+def close_results(results):
+    """
+    Closes an iterator returned by execute_sql(MULTI), and so its cursor,
+    when the iteration over the rows stops early. A generator only closes
+    the ones it reads from when they are garbage collected, which isn't
+    immediate on every implementation of Python, and a server-side cursor
+    stays open on the connection until then -- past the end of the
+    transaction if it was declared WITH HOLD.
+    """
+    close = getattr(results, 'close', None)
+    if close is not None:
+        close()
+
+
+def cursor_iter(cursor, sentinel, chunk_size=GET_ITERATOR_CHUNK_SIZE):
     """
     Yields blocks of rows from a cursor and ensures the cursor is closed when
     done.
     """
     try:
-        for rows in iter((lambda: cursor.fetchmany(GET_ITERATOR_CHUNK_SIZE)),
-                sentinel):
+        for rows in fetch_chunks(cursor, sentinel, chunk_size):
             yield rows
     finally:
         cursor.close()
 
 
-def order_modified_iter(cursor, trim, sentinel):
+def order_modified_iter(cursor, trim, sentinel, chunk_size=GET_ITERATOR_CHUNK_SIZE):
     """
     Yields blocks of rows from a cursor. We use this iterator in the special
     case when extra output columns have been added to support ordering
@@ -1166,8 +1274,7 @@ def order_modified_iter(cursor, trim, sentinel):
     the results, since they're only needed to make the SQL valid.
     """
     try:
-        for rows in iter((lambda: cursor.fetchmany(GET_ITERATOR_CHUNK_SIZE)),
-                sentinel):
+        for rows in fetch_chunks(cursor, sentinel, chunk_size):
             yield [r[:-trim] for r in rows]
     finally:
         cursor.close()
@@ -19,6 +19,12 @@ QUERY_TERMS = set([
 # Larger values are slightly faster at the expense of more storage space.
 GET_ITERATOR_CHUNK_SIZE = 100
 
+# With iterator(chunk_size='auto'), chunks start at GET_ITERATOR_CHUNK_SIZE
+# rows and double while fetching one takes less than ADAPTIVE_CHUNK_TIME
+# seconds, up to ADAPTIVE_CHUNK_MAX_BYTES of rows.
+ADAPTIVE_CHUNK_TIME = 0.1
+ADAPTIVE_CHUNK_MAX_BYTES = 4 * 1024 * 1024
+
 # Namedtuples for sql.* internal use.
 
 # Join lists (indexes into the tuples that are values in the alias_map
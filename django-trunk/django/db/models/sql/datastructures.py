@@ -21,6 +21,9 @@ class Col(object):
     def get_group_by_cols(self):
         return [(self.alias, self.target.column)]
 
+    def get_fingerprint(self):
+        return (self.__class__, self.alias, self.target.column, self.source)
+
     def get_lookup(self, name):
         return self.output_type.get_lookup(name)
 
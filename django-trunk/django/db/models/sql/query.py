@@ -231,6 +231,54 @@ class Query(object):
         """
         return self.model._meta
 
+    def get_fingerprint(self):
+        """
+        Returns a hashable value identifying the SQL of this query apart from
+        its parameters: two queries with the same fingerprint compile to the
+        same SQL, only the parameters differ. Used by the compiled SQL cache
+        of the connections.
+
+        Returns None for the queries whose SQL may depend on their values or
+        on anything not covered here: extra(), aggregates, subqueries, F()
+        expressions, custom lookups, select_for_update(), ...
+        """
+        if (self.compiler != 'SQLCompiler' or self._extra or self.extra_tables or
+                self.extra_order_by or self._aggregates or self.group_by is not None or
+                self.having.children or self.select_for_update or self.related_select_cols):
+            return None
+        if not all(isinstance(col, tuple) for col, _ in self.select):
+            return None
+        if not all(isinstance(field, six.string_types) for field in self.order_by):
+            return None
+        where = self.where.get_fingerprint()
+        if where is None:
+            return None
+
+        def freeze(select_related):
+            if isinstance(select_related, dict):
+                return tuple(sorted((name, freeze(value)) for name, value in select_related.items()))
+            return select_related
+
+        return (
+            self.model,
+            tuple(self.select),
+            self.default_cols,
+            tuple((alias, self.alias_map[alias], self.alias_refcount[alias]) for alias in self.tables),
+            frozenset(self.included_inherited_models.items()),
+            where,
+            tuple(self.order_by),
+            self.default_ordering,
+            self.standard_ordering,
+            self.distinct,
+            tuple(self.distinct_fields),
+            self.low_mark,
+            self.high_mark,
+            freeze(self.select_related),
+            self.max_depth,
+            frozenset(self.deferred_loading[0]),
+            self.deferred_loading[1],
+        )
+
     def clone(self, klass=None, memo=None, **kwargs):
         """
         Creates a copy of the current instance. The 'kwargs' parameter can be
@@ -154,6 +154,22 @@ class WhereNode(tree.Node):
                 sql_string = '(%s)' % sql_string
         return sql_string, result_params
 
+    def get_fingerprint(self):
+        """
+        Returns a hashable value identifying the SQL of this node apart from
+        its parameters, or None if the SQL may depend on the values of the
+        children (see Query.get_fingerprint()).
+        """
+        children = []
+        for child in self.children:
+            if not hasattr(child, 'get_fingerprint'):
+                return None
+            fingerprint = child.get_fingerprint()
+            if fingerprint is None:
+                return None
+            children.append(fingerprint)
+        return (self.__class__, self.connector, self.negated, tuple(children))
+
     def get_group_by_cols(self):
         cols = []
         for child in self.children:
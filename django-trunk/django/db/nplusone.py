@@ -0,0 +1,301 @@
+"""
+Detection of N+1 queries.
+
+The N+1 queries pattern fetches a list of objects with one query, then runs
+one more query per object, typically by accessing a relation which wasn't
+fetched with select_related() or prefetch_related() in a loop.
+
+While an NPlusOneDetector is active in a thread:
+
+* querysets register the model instances they fetch,
+* the related descriptors and managers report the relations they load
+  lazily, one instance at a time,
+* CursorDebugWrapper reports the queries it runs, with their SQL before the
+  parameters are interpolated, i.e. their shape.
+
+The lazy loads of a relation of the instances of the same queryset, and the
+queries of the same shape run from the same line of code, are counted. The
+ones seen more than ``threshold`` times are reported, with the line of code
+where the queryset was evaluated, where the relation was accessed and the
+select_related() or prefetch_related() call that would load it with the
+queryset. Relations of instances which were themselves loaded lazily are
+reported from the first queryset, e.g. ``select_related('user__profile')``
+on a queryset of tweets for ``tweet.user.profile``.
+
+With ``auto_prefetch``, the first lazy load of a foreign key or one-to-one
+relation of an instance loads it for all the instances of its queryset at
+once with prefetch_related_objects(). Many-to-many and reverse foreign key
+relations are only reported, as it can't be known whether all their objects
+will be used.
+"""
+from __future__ import unicode_literals
+
+import os
+import sys
+import weakref
+from contextlib import contextmanager
+from threading import local
+
+from django.conf import settings
+from django.db import connections
+from django.utils import six
+from django.utils.encoding import python_2_unicode_compatible
+
+
+_local = local()
+
+DJANGO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_detector():
+    """
+    Returns the detector active in the current thread, or None.
+    """
+    return getattr(_local, 'detector', None)
+
+
+def lazy_load(instance, name, single=True):
+    """
+    Reports the lazy load of the relation ``name`` of ``instance`` to the
+    active detector, if any. Returns True if the detector prefetched it,
+    i.e. the relation is now cached on the instance.
+    """
+    detector = get_detector()
+    return detector is not None and detector.lazy_load(instance, name, single)
+
+
+@contextmanager
+def suspended():
+    """
+    Deactivates the active detector, if any, in the ``with`` block.
+    """
+    detector = get_detector()
+    _local.detector = None
+    try:
+        yield
+    finally:
+        _local.detector = detector
+
+
+_django_files = {}
+
+
+def is_django_file(filename):
+    try:
+        return _django_files[filename]
+    except KeyError:
+        result = _django_files[filename] = os.path.abspath(filename).startswith(DJANGO_DIR + os.sep)
+        return result
+
+
+def get_call_site():
+    """
+    Returns the innermost line of code outside of Django in the stack, as
+    "path:line in function", followed by the name of the innermost template
+    being rendered, if any.
+    """
+    template = None
+    frame = sys._getframe(1)
+    while frame is not None and is_django_file(frame.f_code.co_filename):
+        if template is None and frame.f_code.co_name in ('_render', 'instrumented_test_render'):
+            template = getattr(frame.f_locals.get('self'), 'name', None)
+        frame = frame.f_back
+    if frame is None:
+        site = '(Django)'
+    else:
+        site = '%s:%d in %s' % (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+    if template is not None:
+        site = '%s (template %s)' % (site, template)
+    return site
+
+
+class ResultGroup(object):
+    """
+    Instances fetched by the same queryset. ``parent`` is the group and the
+    name of the relation whose lazy load fetched them, if any.
+    """
+    def __init__(self, model, instances, fetched_at, parent=None):
+        self.model = model
+        self.instances = [weakref.ref(instance) for instance in instances]
+        self.fetched_at = fetched_at
+        self.parent = parent
+        self.prefetched = set()
+
+    def get_origin(self, name):
+        """
+        Returns the first group of the chain of lazy loads leading to the
+        relation ``name`` of this group, and the path of the relation from it.
+        """
+        group, path = self, [name]
+        while group.parent is not None:
+            group, parent_name = group.parent
+            path.insert(0, parent_name)
+        return group, '__'.join(path)
+
+
+@python_2_unicode_compatible
+class Finding(object):
+    """
+    Repeated lazy loads of a relation, or repeated queries of the same shape.
+    """
+    def __init__(self, model=None, path=None, single=True, fetched_at=None, sql=None, site=None):
+        self.model = model
+        self.path = path
+        self.single = single
+        self.fetched_at = fetched_at
+        # where the relation was first accessed, or the query run
+        self.site = site
+        self.sql = sql
+        self.count = 0
+        self.queries = 0
+        self.prefetched = False
+
+    @property
+    def suggestion(self):
+        if self.path is None:
+            return None
+        return "%s('%s')" % ('select_related' if self.single else 'prefetch_related', self.path)
+
+    def __str__(self):
+        if self.path is None:
+            return '%d queries of the same shape at %s:\n    %s' % (self.count, self.site, self.sql)
+        lines = ['%d lazy loads of %s.%s, accessed at %s' % (
+            self.count, self.model._meta.object_name, self.path, self.site)]
+        if self.fetched_at is not None:
+            lines.append('    queryset evaluated at %s' % self.fetched_at)
+        if self.prefetched:
+            lines.append('    prefetched automatically, use %s' % self.suggestion)
+        else:
+            lines.append('    %d queries, use %s' % (self.queries, self.suggestion))
+        return '\n'.join(lines)
+
+
+class NPlusOneDetector(object):
+    """
+    Detects N+1 queries in the current thread while it's active, i.e. between
+    start() and stop(), or in a ``with`` block. ``threshold`` and
+    ``auto_prefetch`` default to settings.NPLUSONE_THRESHOLD and
+    settings.NPLUSONE_AUTO_PREFETCH.
+    """
+    def __init__(self, threshold=None, auto_prefetch=None):
+        self.threshold = settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        self.auto_prefetch = settings.NPLUSONE_AUTO_PREFETCH if auto_prefetch is None else auto_prefetch
+        # id() of an instance => (weak reference to the instance, ResultGroup)
+        self.groups = {}
+        self.findings = {}
+        # the Finding of the lazy load whose query is expected next
+        self.loading = None
+        # the group and relation of the lazy load whose results are expected
+        # next, to be the parent of their group
+        self.parent = None
+
+    def start(self):
+        self.previous = get_detector()
+        self.use_debug_cursors = []
+        # Only the debug cursor reports the queries.
+        for connection in connections.all():
+            self.use_debug_cursors.append((connection, connection.use_debug_cursor))
+            connection.use_debug_cursor = True
+        _local.detector = self
+        return self
+
+    def stop(self):
+        if get_detector() is self:
+            _local.detector = self.previous
+        for connection, use_debug_cursor in self.use_debug_cursors:
+            connection.use_debug_cursor = use_debug_cursor
+        # Stopping again does nothing.
+        self.use_debug_cursors = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_group(self, instance):
+        ref, group = self.groups.get(id(instance), (None, None))
+        # ids are reused once instances are garbage collected
+        return group if ref is not None and ref() is instance else None
+
+    def fetched(self, queryset, instances):
+        """
+        Registers the instances fetched by ``queryset``.
+        """
+        from django.db.models.base import Model
+        parent, self.parent = self.parent, None
+        if not instances or not isinstance(instances[0], Model):
+            return
+        group = ResultGroup(queryset.model, instances, get_call_site(), parent)
+        for ref, instance in zip(group.instances, instances):
+            self.groups[id(instance)] = (ref, group)
+
+    def lazy_load(self, instance, name, single):
+        """
+        Counts the lazy load of the relation ``name`` of ``instance``, and
+        prefetches it for the other instances of its queryset if
+        auto_prefetch is set. Returns True if it did.
+        """
+        group = self.get_group(instance)
+        if group is not None:
+            origin, path = group.get_origin(name)
+            key = (origin.model, path, origin.fetched_at)
+        else:
+            origin, path = None, name
+            key = (instance._meta.concrete_model, path, None)
+        finding = self.findings.get(key)
+        if finding is None:
+            finding = self.findings[key] = Finding(
+                model=key[0], path=path, single=single, fetched_at=key[2], site=get_call_site())
+        finding.count += 1
+
+        if single and self.auto_prefetch and group is not None and name not in group.prefetched:
+            group.prefetched.add(name)
+            # The instance comes first: prefetch_related_objects() skips the
+            # relation if it's cached on the first one.
+            instances = [instance] + [obj for obj in (ref() for ref in group.instances)
+                                      if obj is not None and obj is not instance]
+            if len(instances) > 1:
+                from django.db.models.query import prefetch_related_objects
+                finding.prefetched = True
+                finding.count += len(instances) - 1
+                self.parent = (group, name)
+                try:
+                    prefetch_related_objects(instances, [name])
+                finally:
+                    self.parent = None
+                return True
+
+        self.loading = finding
+        if single:
+            self.parent = (group, name) if group is not None else None
+        return False
+
+    def executed(self, alias, sql):
+        """
+        Counts a query run by a debug cursor, with its SQL before the
+        parameters are interpolated.
+        """
+        finding, self.loading = self.loading, None
+        if finding is not None:
+            finding.queries += 1
+            return
+        site = get_call_site()
+        key = (alias, sql, site)
+        finding = self.findings.get(key)
+        if finding is None:
+            finding = self.findings[key] = Finding(sql=sql, site=site)
+        finding.count += 1
+        finding.queries += 1
+
+    def get_report(self):
+        """
+        Returns the findings seen more than ``threshold`` times, the most
+        frequent first.
+        """
+        findings = [finding for finding in self.findings.values() if finding.count > self.threshold]
+        findings.sort(key=lambda finding: -finding.count)
+        return findings
+
+    def format_report(self):
+        return '\n'.join(six.text_type(finding) for finding in self.get_report())
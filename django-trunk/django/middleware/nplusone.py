@@ -0,0 +1,40 @@
+import logging
+
+from django.db.nplusone import NPlusOneDetector
+
+
+logger = logging.getLogger('django.db.nplusone')
+
+
+class NPlusOneMiddleware(object):
+    """
+    Detects the N+1 queries of each request and logs a report of them as a
+    warning. Meant for development and staging: like with DEBUG = True, every
+    query is logged, and the stack is inspected for each of them.
+    """
+    def process_request(self, request):
+        request._nplusone_detector = NPlusOneDetector().start()
+
+    def process_exception(self, request, exception):
+        # Stop now rather than in process_response(), which isn't called if
+        # another middleware fails: the thread would keep detecting, and the
+        # connections keep every query. The report is still logged if it is.
+        detector = getattr(request, '_nplusone_detector', None)
+        if detector is not None:
+            detector.stop()
+
+    def process_response(self, request, response):
+        detector = getattr(request, '_nplusone_detector', None)
+        if detector is None:
+            return response
+        detector.stop()
+        del request._nplusone_detector
+        report = detector.format_report()
+        if report:
+            logger.warning('N+1 queries in %s %s:\n%s', request.method, request.path, report,
+                extra={
+                    'status_code': response.status_code,
+                    'request': request,
+                }
+            )
+        return response
@@ -26,6 +26,7 @@ from django.core.management.commands import flush
 from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
 from django.core.urlresolvers import clear_url_caches, set_urlconf
 from django.db import connection, connections, DEFAULT_DB_ALIAS, transaction
+from django.db.nplusone import NPlusOneDetector
 from django.forms.fields import CharField
 from django.http import QueryDict
 from django.test.client import Client
@@ -113,6 +114,20 @@ class _AssertNumQueriesContext(CaptureQueriesContext):
         )
 
 
+class _AssertNoNPlusOneContext(NPlusOneDetector):
+    def __init__(self, test_case, threshold):
+        self.test_case = test_case
+        super(_AssertNoNPlusOneContext, self).__init__(threshold=threshold)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super(_AssertNoNPlusOneContext, self).__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        report = self.format_report()
+        if report:
+            self.test_case.fail("N+1 queries detected:\n%s" % report)
+
+
 class _AssertTemplateUsedContext(object):
     def __init__(self, test_case, template_name):
         self.test_case = test_case
@@ -847,6 +862,14 @@ class TransactionTestCase(SimpleTestCase):
         with context:
             func(*args, **kwargs)
 
+    def assertNoNPlusOne(self, threshold=None, func=None, *args, **kwargs):
+        context = _AssertNoNPlusOneContext(self, threshold)
+        if func is None:
+            return context
+
+        with context:
+            func(*args, **kwargs)
+
 
 def connections_support_transactions():
     """
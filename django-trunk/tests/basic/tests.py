@@ -6,6 +6,8 @@ import threading
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.db import connections, DEFAULT_DB_ALIAS
 from django.db import DatabaseError
+from django.db.models import signals
+from django.db.models.base import get_row_loader
 from django.db.models.fields import Field, FieldDoesNotExist
 from django.db.models.manager import BaseManager
 from django.db.models.query import QuerySet, EmptyQuerySet, ValuesListQuerySet, MAX_GET_RESULTS
@@ -798,6 +800,7 @@ class ManagerTest(TestCase):
         'prefetch_related',
         'values',
         'values_list',
+        'to_arrays',
         'update',
         'reverse',
         'defer',
@@ -880,3 +883,61 @@ class SelectOnSaveTests(TestCase):
                 asos.save(update_fields=['pub_date'])
         finally:
             Article._base_manager.__class__ = orig_class
+
+
+class RowLoaderTests(TestCase):
+    def setUp(self):
+        self.a1 = Article.objects.create(headline='First', pub_date=datetime(2005, 7, 28))
+        self.a2 = Article.objects.create(headline='Second', pub_date=datetime(2005, 7, 29))
+
+    def test_loaded_instances(self):
+        articles = list(Article.objects.all())
+        self.assertEqual(articles, [self.a1, self.a2])
+        self.assertEqual(articles[0].headline, 'First')
+        self.assertEqual(articles[1].pub_date, datetime(2005, 7, 29))
+        self.assertEqual(articles[0]._state.db, DEFAULT_DB_ALIAS)
+        self.assertFalse(articles[0]._state.adding)
+        articles[0].headline = 'Changed'
+        with self.assertNumQueries(1):
+            articles[0].save()
+        self.assertEqual(Article.objects.get(pk=self.a1.pk).headline, 'Changed')
+
+    def test_deferred_fields(self):
+        article = Article.objects.only('headline').get(pk=self.a1.pk)
+        self.assertEqual(article.headline, 'First')
+        self.assertFalse(article._state.adding)
+        with self.assertNumQueries(1):
+            self.assertEqual(article.pub_date, datetime(2005, 7, 28))
+
+    def test_select_related(self):
+        first = SelfRef.objects.create()
+        second = SelfRef.objects.create(selfref=first)
+        with self.assertNumQueries(1):
+            obj = SelfRef.objects.select_related('selfref').get(pk=second.pk)
+            self.assertEqual(obj.selfref, first)
+            self.assertEqual(obj.selfref._state.db, DEFAULT_DB_ALIAS)
+            self.assertFalse(obj.selfref._state.adding)
+        obj = SelfRef.objects.select_related('selfref').get(pk=first.pk)
+        self.assertIsNone(obj.selfref)
+
+    def test_init_signals(self):
+        """
+        Instances are created with __init__() while pre_init or post_init
+        have receivers for the model.
+        """
+        initialized = []
+
+        def receiver(sender, instance, **kwargs):
+            initialized.append(instance.headline)
+        signals.post_init.connect(receiver, sender=Article)
+        try:
+            self.assertEqual(len(Article.objects.all()), 2)
+        finally:
+            signals.post_init.disconnect(receiver, sender=Article)
+        self.assertEqual(initialized, ['First', 'Second'])
+        self.assertEqual(len(Article.objects.all()), 2)
+        self.assertEqual(len(initialized), 2)
+
+    def test_loaders_are_reused(self):
+        self.assertIs(get_row_loader(Article), get_row_loader(Article))
+        self.assertIsNot(get_row_loader(Article), get_row_loader(Article, ('id', 'headline')))
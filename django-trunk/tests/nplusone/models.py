@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+
+
+@python_2_unicode_compatible
+class Author(models.Model):
+    name = models.CharField(max_length=50)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['id']
+
+
+class Profile(models.Model):
+    author = models.OneToOneField(Author, related_name='profile')
+    bio = models.TextField()
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        ordering = ['id']
+
+
+@python_2_unicode_compatible
+class Post(models.Model):
+    author = models.ForeignKey(Author, related_name='posts')
+    title = models.CharField(max_length=100)
+    tags = models.ManyToManyField(Tag, related_name='posts')
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        ordering = ['id']
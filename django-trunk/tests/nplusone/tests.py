@@ -0,0 +1,181 @@
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.db.nplusone import get_detector, NPlusOneDetector
+from django.http import HttpResponse, HttpResponseServerError
+from django.middleware.nplusone import NPlusOneMiddleware
+from django.test import RequestFactory, TestCase
+from django.test.utils import patch_logger
+
+from .models import Author, Post, Profile, Tag
+
+
+class NPlusOneDetectorTests(TestCase):
+    def setUp(self):
+        tags = [Tag.objects.create(name='tag%d' % i) for i in range(2)]
+        for i in range(5):
+            author = Author.objects.create(name='author%d' % i)
+            Profile.objects.create(author=author, bio='bio%d' % i)
+            post = Post.objects.create(author=author, title='post%d' % i)
+            post.tags = tags
+
+    def test_foreign_key(self):
+        with NPlusOneDetector() as detector:
+            for post in Post.objects.all():
+                post.author.name
+        findings = detector.get_report()
+        self.assertEqual(len(findings), 1)
+        finding = findings[0]
+        self.assertEqual(finding.model, Post)
+        self.assertEqual(finding.path, 'author')
+        self.assertEqual(finding.count, 5)
+        self.assertEqual(finding.queries, 5)
+        self.assertEqual(finding.suggestion, "select_related('author')")
+        self.assertIn('tests.py', finding.fetched_at)
+        self.assertIn('in test_foreign_key', finding.site)
+        self.assertIn("select_related('author')", detector.format_report())
+
+    def test_select_related(self):
+        with NPlusOneDetector() as detector:
+            for post in Post.objects.select_related('author__profile'):
+                post.author.profile.bio
+        self.assertEqual(detector.get_report(), [])
+
+    def test_chained_relations(self):
+        with NPlusOneDetector() as detector:
+            for post in Post.objects.all():
+                post.author.profile.bio
+        suggestions = sorted(finding.suggestion for finding in detector.get_report())
+        self.assertEqual(suggestions, ["select_related('author')", "select_related('author__profile')"])
+
+    def test_reverse_relations(self):
+        with NPlusOneDetector() as detector:
+            for author in Author.objects.all():
+                list(author.posts.all())
+            for post in Post.objects.all():
+                list(post.tags.all())
+            for tag in Tag.objects.all():
+                for i in range(3):
+                    list(tag.posts.all())
+        counts = dict(((finding.model, finding.suggestion), finding.count) for finding in detector.get_report())
+        self.assertEqual(counts, {
+            (Author, "prefetch_related('posts')"): 5,
+            (Post, "prefetch_related('tags')"): 5,
+            (Tag, "prefetch_related('posts')"): 6,
+        })
+        with NPlusOneDetector() as detector:
+            for author in Author.objects.prefetch_related('posts'):
+                list(author.posts.all())
+        self.assertEqual(detector.get_report(), [])
+
+    def test_repeated_queries(self):
+        ids = list(Author.objects.values_list('id', flat=True))
+        with NPlusOneDetector() as detector:
+            for author_id in ids:
+                Author.objects.get(pk=author_id)
+        findings = detector.get_report()
+        self.assertEqual(len(findings), 1)
+        self.assertIsNone(findings[0].path)
+        self.assertEqual(findings[0].count, 5)
+        self.assertIn('nplusone_author', findings[0].sql)
+
+    def test_threshold(self):
+        with NPlusOneDetector(threshold=5) as detector:
+            for post in Post.objects.all():
+                post.author.name
+        self.assertEqual(detector.get_report(), [])
+        with NPlusOneDetector(threshold=4) as detector:
+            for post in Post.objects.all():
+                post.author.name
+        self.assertEqual(len(detector.get_report()), 1)
+
+    def test_auto_prefetch(self):
+        with NPlusOneDetector(auto_prefetch=True) as detector:
+            # posts, authors, profiles
+            with self.assertNumQueries(3):
+                posts = list(Post.objects.all())
+                self.assertEqual([post.author.profile.bio for post in posts], ['bio%d' % i for i in range(5)])
+        findings = detector.get_report()
+        self.assertEqual(len(findings), 2)
+        self.assertTrue(all(finding.prefetched for finding in findings))
+        self.assertEqual(findings[0].count, 5)
+        self.assertIn('prefetched automatically', detector.format_report())
+
+    def test_auto_prefetch_many(self):
+        """
+        Reverse foreign keys and many-to-many relations aren't prefetched.
+        """
+        with NPlusOneDetector(auto_prefetch=True):
+            with self.assertNumQueries(6):
+                for author in Author.objects.all():
+                    list(author.posts.all())
+
+    def test_activation(self):
+        use_debug_cursor = connection.use_debug_cursor
+        with NPlusOneDetector() as detector:
+            self.assertIs(get_detector(), detector)
+            self.assertTrue(connection.use_debug_cursor)
+            with NPlusOneDetector() as inner:
+                self.assertIs(get_detector(), inner)
+            self.assertIs(get_detector(), detector)
+        self.assertIsNone(get_detector())
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+
+    def test_assert_no_n_plus_one(self):
+        with self.assertNoNPlusOne():
+            for post in Post.objects.select_related('author'):
+                post.author.name
+        with self.assertRaises(AssertionError) as cm:
+            with self.assertNoNPlusOne():
+                for post in Post.objects.all():
+                    post.author.name
+        self.assertIn("select_related('author')", str(cm.exception))
+        self.assertNoNPlusOne(10, lambda: [post.author for post in Post.objects.all()])
+
+
+def post_list(request):
+    return HttpResponse(', '.join('%s by %s' % (post, post.author) for post in Post.objects.all()))
+
+
+def failing_post_list(request):
+    [post.author for post in Post.objects.all()]
+    raise ValueError
+
+
+class NPlusOneMiddlewareTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Post.objects.create(author=Author.objects.create(name='author%d' % i), title='post%d' % i)
+
+    def test_report(self):
+        middleware = NPlusOneMiddleware()
+        request = RequestFactory().get('/posts/')
+        with patch_logger('django.db.nplusone', 'warning') as calls:
+            middleware.process_request(request)
+            response = middleware.process_response(request, post_list(request))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_detector())
+        self.assertEqual(len(calls), 1)
+        self.assertIn('N+1 queries in GET /posts/', calls[0])
+        self.assertIn("5 lazy loads of Post.author", calls[0])
+        self.assertIn('in post_list', calls[0])
+
+    def test_exception(self):
+        middleware = NPlusOneMiddleware()
+        request = RequestFactory().get('/posts/')
+        use_debug_cursor = connection.use_debug_cursor
+        middleware.process_request(request)
+        try:
+            failing_post_list(request)
+        except ValueError as exc:
+            self.assertIsNone(middleware.process_exception(request, exc))
+        self.assertIsNone(get_detector())
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
+        # The response middleware still reports the queries of the request.
+        with patch_logger('django.db.nplusone', 'warning') as calls:
+            response = middleware.process_response(request, HttpResponseServerError())
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(calls), 1)
+        self.assertIn("5 lazy loads of Post.author", calls[0])
+        self.assertIsNone(get_detector())
+        self.assertEqual(connection.use_debug_cursor, use_debug_cursor)
@@ -4,7 +4,7 @@ from datetime import datetime
 import unittest
 
 from django.core.paginator import (Paginator, EmptyPage, InvalidPage,
-    PageNotAnInteger)
+    PageNotAnInteger, CursorPaginator, InvalidCursor)
 from django.test import TestCase
 from django.utils import six
 
@@ -308,3 +308,72 @@ class ModelPaginationTests(TestCase):
         )
         # After __getitem__ is called, object_list is a list
         self.assertIsInstance(p.object_list, list)
+
+
+class CursorPaginationTests(TestCase):
+    """
+    Tests for the CursorPaginator and CursorPage classes.
+    """
+
+    def setUp(self):
+        # Articles 1-3 share a pub_date so that the pk breaks the tie.
+        for x in range(1, 10):
+            Article.objects.create(headline='Article %s' % x,
+                                   pub_date=datetime(2005, 7, max(x, 3)))
+        self.paginator = CursorPaginator(Article.objects.all(), 4,
+                                         ordering=('-pub_date', '-pk'))
+
+    def headlines(self, page):
+        return [article.headline for article in page]
+
+    def test_first_page(self):
+        with self.assertNumQueries(1):
+            p = self.paginator.page()
+            self.assertEqual(self.headlines(p), ['Article 9', 'Article 8', 'Article 7', 'Article 6'])
+        self.assertTrue(p.has_next())
+        self.assertFalse(p.has_previous())
+        self.assertTrue(p.has_other_pages())
+        self.assertRaises(InvalidPage, p.previous_cursor)
+
+    def test_forward_and_backward(self):
+        p1 = self.paginator.page()
+        p2 = self.paginator.page(p1.next_cursor())
+        self.assertEqual(self.headlines(p2), ['Article 5', 'Article 4', 'Article 3', 'Article 2'])
+        self.assertTrue(p2.has_previous())
+        self.assertTrue(p2.has_next())
+        p3 = self.paginator.page(p2.next_cursor())
+        self.assertEqual(self.headlines(p3), ['Article 1'])
+        self.assertFalse(p3.has_next())
+        self.assertRaises(InvalidPage, p3.next_cursor)
+        back = self.paginator.page(p3.previous_cursor())
+        self.assertEqual(self.headlines(back), self.headlines(p2))
+        back = self.paginator.page(back.previous_cursor())
+        self.assertEqual(self.headlines(back), self.headlines(p1))
+        self.assertFalse(back.has_previous())
+
+    def test_stable_under_inserts(self):
+        p1 = self.paginator.page()
+        Article.objects.create(headline='Article 10', pub_date=datetime(2005, 7, 10))
+        p2 = self.paginator.page(p1.next_cursor())
+        self.assertEqual(self.headlines(p2), ['Article 5', 'Article 4', 'Article 3', 'Article 2'])
+
+    def test_ascending_ordering(self):
+        paginator = CursorPaginator(Article.objects.all(), 5, ordering=('pub_date', 'pk'))
+        p1 = paginator.page()
+        self.assertEqual(self.headlines(p1), ['Article %s' % x for x in range(1, 6)])
+        p2 = paginator.page(p1.next_cursor())
+        self.assertEqual(self.headlines(p2), ['Article %s' % x for x in range(6, 10)])
+
+    def test_invalid_cursor(self):
+        # Not base64, an empty list, a wrong number of values, JSON objects
+        # and null.
+        for cursor in ('garbage', 'W10', 'WzAsIngiXQ', 'e30', 'eyIwIjoxfQ', 'bnVsbA'):
+            self.assertRaises(InvalidCursor, self.paginator.page, cursor)
+        # InvalidCursor can be handled like the other pagination errors.
+        self.assertRaises(InvalidPage, self.paginator.page, 'garbage')
+
+    def test_empty(self):
+        Article.objects.all().delete()
+        p = self.paginator.page()
+        self.assertEqual(len(p), 0)
+        self.assertFalse(p.has_other_pages())
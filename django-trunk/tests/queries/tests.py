@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import array
 from collections import OrderedDict
 import datetime
 from operator import attrgetter
@@ -8,13 +9,22 @@ import unittest
 import warnings
 
 from django.core.exceptions import FieldError
-from django.db import connection, DEFAULT_DB_ALIAS
+from django.db import connection, models, transaction, DEFAULT_DB_ALIAS
+from django.db.backends.utils import CompiledSQLCache
 from django.db.models import Count, F, Q
+from django.db.models.query import ResultColumn
 from django.db.models.sql.where import WhereNode, EverythingNode, NothingNode
+from django.db.models.sql import compiler
 from django.db.models.sql.datastructures import EmptyResultSet
-from django.test import TestCase, skipUnlessDBFeature
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 from django.test.utils import str_prefix, CaptureQueriesContext
 from django.utils import six
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from .models import (
     Annotation, Article, Author, Celebrity, Child, Cover, Detail, DumbCategory,
@@ -3371,3 +3381,384 @@ class Ticket22429Tests(TestCase):
 
         queryset = Student.objects.filter(~Q(classroom__school=F('school')))
         self.assertQuerysetEqual(queryset, [st2], lambda x: x)
+
+
+class CompiledSQLCacheTests(TestCase):
+    def setUp(self):
+        self.old_cache = connection.compiled_sql_cache
+        self.cache = connection.compiled_sql_cache = CompiledSQLCache(10)
+        self.n1 = Number.objects.create(num=1)
+        self.n2 = Number.objects.create(num=2)
+        note = Note.objects.create(note='n1', misc='foo')
+        self.e1 = ExtraInfo.objects.create(info='e1', note=note, value=41)
+        self.e2 = ExtraInfo.objects.create(info='e2', note=note)
+        self.a1 = Author.objects.create(name='a1', num=1001, extra=self.e1)
+        self.a2 = Author.objects.create(name='a2', num=1002, extra=self.e2)
+
+    def tearDown(self):
+        connection.compiled_sql_cache = self.old_cache
+
+    def test_same_shape_reuses_sql(self):
+        self.assertEqual(Number.objects.filter(num=1).get(), self.n1)
+        self.assertEqual((self.cache.hits, self.cache.misses, len(self.cache)), (0, 1, 1))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(Number.objects.filter(num=2).get(), self.n2)
+        self.assertEqual((self.cache.hits, self.cache.misses, len(self.cache)), (1, 1, 1))
+        self.assertIn('2', captured[0]['sql'])
+        self.assertEqual(Number.objects.filter(num=3).count(), 0)
+
+    def test_cached_sql_matches_compiled_sql(self):
+        querysets = [
+            Number.objects.filter(num__gt=0, num__lt=5).order_by('-num')[:1],
+            Number.objects.filter(Q(num=1) | ~Q(num__in=[2, 3])),
+            Author.objects.select_related('extra__note').filter(name__startswith='a'),
+            Author.objects.only('name').filter(extra__info='e1'),
+            ExtraInfo.objects.filter(value__isnull=True),
+            NamedCategory.objects.filter(name='x'),
+        ]
+        for qs in querysets:
+            query = qs.query.clone()
+            compiled = qs.query.get_compiler(connection=connection).as_sql()
+            cached = query.get_compiler(connection=connection).as_sql()
+            self.assertEqual(cached, compiled)
+        self.assertEqual(self.cache.hits, len(querysets))
+
+    def test_results(self):
+        for name, author in (('a1', self.a1), ('a2', self.a2)):
+            with self.assertNumQueries(1):
+                fetched = Author.objects.select_related('extra').get(name=name)
+                self.assertEqual(fetched, author)
+                self.assertEqual(fetched.extra.info, author.extra.info)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertQuerysetEqual(Author.objects.filter(num__in=[1001, 1002]), [self.a1, self.a2], lambda x: x)
+        self.assertQuerysetEqual(Author.objects.filter(num__in=[1002, 1003]), [self.a2], lambda x: x)
+        self.assertEqual(list(Author.objects.filter(num__in=[]).values_list('name')), [])
+
+    def test_value_dependent_sql(self):
+        # isnull=True and isnull=False, or lists of different lengths, don't
+        # compile to the same SQL.
+        self.assertEqual(ExtraInfo.objects.filter(value__isnull=True).get(), self.e2)
+        self.assertEqual(ExtraInfo.objects.filter(value__isnull=False).get(), self.e1)
+        self.assertEqual(len(Number.objects.filter(num__in=[1])), 1)
+        self.assertEqual(len(Number.objects.filter(num__in=[1, 2])), 2)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(len(self.cache), 4)
+
+    def test_uncacheable_queries(self):
+        self.assertIsNone(Number.objects.filter(num=F('num')).query.get_fingerprint())
+        self.assertIsNone(Number.objects.extra(where=['num > 0']).query.get_fingerprint())
+        self.assertIsNone(Number.objects.annotate(Count('id')).query.get_fingerprint())
+        self.assertIsNone(Number.objects.filter(num__in=Number.objects.values('num')).query.get_fingerprint())
+        self.assertIsNone(Number.objects.select_for_update().query.get_fingerprint())
+        self.assertEqual(len(Number.objects.filter(num=F('num'))), 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        cache = CompiledSQLCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((len(cache), cache.hits, cache.misses), (2, 3, 1))
+
+    def test_lru_order(self):
+        cache = CompiledSQLCache(3)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.get('a')
+        # replacing an entry makes it the most recently used too
+        cache.set('b', 'B')
+        cache.set('d', 'd')
+        self.assertEqual(list(cache.entries), ['a', 'b', 'd'])
+        cache.set('e', 'e')
+        cache.set('f', 'f')
+        self.assertEqual(list(cache.entries), ['d', 'e', 'f'])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('d'), 'd')
+        self.assertEqual(list(cache.entries), ['e', 'f', 'd'])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Test only for PostgreSQL")
+class ServerSideCursorTests(TransactionTestCase):
+    available_apps = ['queries']
+
+    def setUp(self):
+        Number.objects.bulk_create([Number(num=i) for i in range(10)])
+
+    def open_cursors(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, is_holdable FROM pg_cursors")
+            return cursor.fetchall()
+
+    def test_with_hold(self):
+        """
+        Outside of transactions, the server-side cursor is declared WITH HOLD
+        and is closed when the iteration stops early.
+        """
+        for number in Number.objects.order_by('num').iterator(chunk_size=2):
+            if number.num == 5:
+                cursors = self.open_cursors()
+                break
+        self.assertEqual(len(cursors), 1)
+        self.assertTrue(cursors[0][1])
+        self.assertEqual(self.open_cursors(), [])
+
+    def test_closed(self):
+        results = Number.objects.values_list('num', flat=True).iterator(chunk_size=2)
+        next(results)
+        results.close()
+        self.assertEqual(self.open_cursors(), [])
+        with transaction.atomic():
+            for _ in Number.objects.iterator(chunk_size=2):
+                break
+            self.assertEqual(self.open_cursors(), [])
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.sizes = []
+
+    def fetchmany(self, size):
+        self.sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class IteratorChunkSizeTests(TestCase):
+    def setUp(self):
+        Number.objects.bulk_create([Number(num=i) for i in range(10)])
+
+    def test_chunk_sizes(self):
+        numbers = list(range(10))
+        for chunk_size in (None, 1, 3, 100, 'auto'):
+            qs = Number.objects.order_by('num')
+            self.assertEqual([n.num for n in qs.iterator(chunk_size=chunk_size)], numbers)
+            self.assertEqual([n['num'] for n in qs.values('num').iterator(chunk_size=chunk_size)], numbers)
+            self.assertEqual(list(qs.values_list('num', flat=True).iterator(chunk_size=chunk_size)), numbers)
+
+    def test_dates_chunk_sizes(self):
+        Ticket21203Parent.objects.create(parent_bool=True)
+        # auto_now is set on save().
+        Ticket21203Parent.objects.update(created=datetime.datetime(2014, 5, 1, 12, 30))
+        for chunk_size in (None, 1, 'auto'):
+            dates = Ticket21203Parent.objects.dates('created', 'year')
+            self.assertEqual(list(dates.iterator(chunk_size=chunk_size)), [datetime.date(2014, 1, 1)])
+            datetimes = Ticket21203Parent.objects.datetimes('created', 'hour')
+            self.assertEqual(list(datetimes.iterator(chunk_size=chunk_size)),
+                             [datetime.datetime(2014, 5, 1, 12)])
+
+    def test_invalid_chunk_size(self):
+        for chunk_size in (0, -1, 'big', 1.5):
+            with self.assertRaises(ValueError):
+                list(Number.objects.iterator(chunk_size=chunk_size))
+
+    def test_chunked_cursor(self):
+        """
+        A chunk size asks the connection for a chunked cursor.
+        """
+        calls = []
+        chunked_cursor = connection.chunked_cursor
+
+        def tracking_chunked_cursor():
+            calls.append(True)
+            return chunked_cursor()
+        connection.chunked_cursor = tracking_chunked_cursor
+        try:
+            self.assertEqual(len(list(Number.objects.iterator())), 10)
+            self.assertEqual(len(calls), 0)
+            self.assertEqual(len(list(Number.objects.iterator(chunk_size=4))), 10)
+            self.assertEqual(len(calls), 1)
+        finally:
+            del connection.chunked_cursor
+
+    def tracked_chunked_cursors(self):
+        """
+        Makes connection.chunked_cursor() record the cursors it returns and
+        whether they were closed.
+        """
+        cursors = []
+        chunked_cursor = connection.chunked_cursor
+
+        def tracking_chunked_cursor():
+            cursor = chunked_cursor()
+            close = cursor.close
+
+            def tracking_close():
+                cursors[index] = True
+                close()
+            index = len(cursors)
+            cursors.append(False)
+            cursor.close = tracking_close
+            return cursor
+        connection.chunked_cursor = tracking_chunked_cursor
+        self.addCleanup(delattr, connection, 'chunked_cursor')
+        return cursors
+
+    def test_chunked_cursor_closed_when_stopped_early(self):
+        """
+        Leaving the iteration early closes the cursor at once, not when the
+        iterators are garbage collected.
+        """
+        cursors = self.tracked_chunked_cursors()
+        # Read the rows in chunks even on the backends reading them at once.
+        features = connection.features
+        self.addCleanup(setattr, features, 'can_use_chunked_reads', features.can_use_chunked_reads)
+        features.can_use_chunked_reads = True
+        Ticket21203Parent.objects.create(parent_bool=True)
+        querysets = [
+            Number.objects.order_by('num'),
+            Number.objects.order_by('num').values('num'),
+            Number.objects.order_by('num').values_list('num', flat=True),
+            Number.objects.extra(select={'double': 'num * 2'}).order_by('num').values_list('double'),
+            Ticket21203Parent.objects.dates('created', 'year'),
+            Ticket21203Parent.objects.datetimes('created', 'hour'),
+        ]
+        for i, qs in enumerate(querysets):
+            for _ in qs.iterator(chunk_size=1):
+                break
+            self.assertEqual(cursors, [True] * (i + 1))
+        # Closing an iterator that is kept around.
+        results = Number.objects.iterator(chunk_size=2)
+        next(results)
+        self.assertEqual(cursors[-1], False)
+        results.close()
+        self.assertEqual(cursors[-1], True)
+
+    def test_fixed_fetch_size(self):
+        cursor = FakeCursor([(i,) for i in range(10)])
+        chunks = list(compiler.fetch_chunks(cursor, [], 4))
+        self.assertEqual([len(rows) for rows in chunks], [4, 4, 2])
+        self.assertEqual(cursor.sizes, [4, 4, 4, 4])
+
+    def test_adaptive_fetch_size(self):
+        cursor = FakeCursor([(i,) for i in range(2000)])
+        chunks = list(compiler.fetch_chunks(cursor, [], 'auto'))
+        self.assertEqual(sum(len(rows) for rows in chunks), 2000)
+        # Fast fetches of small rows double the size.
+        self.assertEqual(cursor.sizes[:4], [100, 200, 400, 800])
+
+    def test_adaptive_fetch_size_wide_rows(self):
+        row = ('x' * 100000,)
+        cursor = FakeCursor([row] * 300)
+        list(compiler.fetch_chunks(cursor, [], 'auto'))
+        # About 40 such rows fit in ADAPTIVE_CHUNK_MAX_BYTES; sizes don't go
+        # below GET_ITERATOR_CHUNK_SIZE.
+        self.assertEqual(cursor.sizes, [100, 100, 100, 100])
+
+
+class ToArraysTests(TestCase):
+    def setUp(self):
+        Number.objects.bulk_create([Number(num=i) for i in range(10)])
+        self.note = Note.objects.create(note='n1', misc='m1')
+        for info, value in (('e1', 1), ('e2', None), ('e3', 3)):
+            ExtraInfo.objects.create(info=info, note=self.note, value=value)
+        self.created = datetime.datetime(2014, 5, 1, 12, 30, 15, 250)
+        Ticket21203Parent.objects.create(parent_bool=True)
+        Ticket21203Parent.objects.create(parent_bool=False)
+        # auto_now is set on save().
+        Ticket21203Parent.objects.update(created=self.created)
+
+    def test_array_columns(self):
+        arrays = Number.objects.order_by('num').to_arrays('num', 'id')
+        self.assertIsInstance(arrays, OrderedDict)
+        self.assertEqual(list(arrays), ['num', 'id'])
+        self.assertIsInstance(arrays['num'], array.array)
+        self.assertEqual(arrays['num'].tolist(), list(range(10)))
+        self.assertEqual(arrays['id'].tolist(), list(Number.objects.order_by('num').values_list('id', flat=True)))
+
+    def test_all_fields(self):
+        arrays = Ticket21203Parent.objects.order_by('pk').to_arrays()
+        self.assertEqual(list(arrays), ['parentid', 'parent_bool', 'created'])
+        self.assertEqual(arrays['parent_bool'].tolist(), [True, False])
+        self.assertEqual(arrays['created'], [self.created] * 2)
+
+    def test_nulls_and_foreign_keys(self):
+        arrays = ExtraInfo.objects.order_by('info').to_arrays('info', 'note', 'value')
+        self.assertEqual(arrays['info'], ['e1', 'e2', 'e3'])
+        self.assertIsInstance(arrays['note'], array.array)
+        self.assertEqual(arrays['note'].tolist(), [self.note.pk] * 3)
+        self.assertEqual(arrays['value'], [1, None, 3])
+
+    def test_extra_and_annotations(self):
+        arrays = Number.objects.extra(select={'double': 'num * 2'}).order_by('num').to_arrays('double', 'num')
+        self.assertEqual(list(arrays), ['double', 'num'])
+        self.assertEqual(list(arrays['double']), list(range(0, 20, 2)))
+        arrays = ExtraInfo.objects.values_list('note').annotate(n=Count('id')).order_by().to_arrays('note', 'n')
+        self.assertEqual(list(arrays), ['note', 'n'])
+        self.assertEqual(list(arrays['note']), [self.note.pk])
+        self.assertEqual(list(arrays['n']), [3])
+
+    def test_chunk_size(self):
+        arrays = Number.objects.order_by('num').to_arrays('num', chunk_size=3)
+        self.assertEqual(arrays['num'].tolist(), list(range(10)))
+
+    def test_empty(self):
+        arrays = Number.objects.none().to_arrays('num')
+        self.assertEqual(arrays['num'], array.array('l'))
+        arrays = Number.objects.filter(num__gt=100).to_arrays('num')
+        self.assertEqual(arrays['num'], array.array('l'))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(TypeError):
+            Number.objects.to_arrays('num', flat=True)
+
+    def test_column_fallback(self):
+        """
+        A column falls back to a list on values that don't fit its array.
+        """
+        column = ResultColumn(Number._meta.get_field('num'))
+        column.extend((1, 2))
+        column.extend((3, None, 5))
+        self.assertEqual(column.values, [1, 2, 3, None, 5])
+        column = ResultColumn(Number._meta.get_field('num'))
+        column.extend((1, 2 ** 100))
+        self.assertEqual(column.values, [1, 2 ** 100])
+
+    @unittest.skipUnless(numpy, "NumPy isn't installed")
+    def test_numpy(self):
+        arrays = ExtraInfo.objects.order_by('info').to_arrays('info', 'note', 'value', numpy=True)
+        self.assertEqual(arrays['info'].dtype, object)
+        self.assertEqual(arrays['info'].tolist(), ['e1', 'e2', 'e3'])
+        self.assertEqual(arrays['note'].tolist(), [self.note.pk] * 3)
+        self.assertEqual(arrays['value'].dtype, float)
+        self.assertEqual(arrays['value'][0], 1)
+        self.assertTrue(numpy.isnan(arrays['value'][1]))
+
+        arrays = Ticket21203Parent.objects.order_by('pk').to_arrays('parent_bool', 'created', numpy=True)
+        self.assertEqual(arrays['parent_bool'].dtype, bool)
+        self.assertEqual(arrays['parent_bool'].tolist(), [True, False])
+        self.assertEqual(arrays['created'].dtype, numpy.dtype('datetime64[us]'))
+        self.assertEqual(arrays['created'].tolist(), [self.created] * 2)
+
+    @unittest.skipUnless(numpy, "NumPy isn't installed")
+    def test_numpy_aware_datetimes(self):
+        created = timezone.make_aware(self.created, timezone.get_fixed_timezone(120))
+        with self.settings(USE_TZ=True):
+            Ticket21203Parent.objects.update(created=created)
+            arrays = Ticket21203Parent.objects.to_arrays('created', numpy=True)
+        # In UTC.
+        self.assertEqual(arrays['created'].tolist(), [self.created - datetime.timedelta(hours=2)] * 2)
+
+    @unittest.skipUnless(numpy, "NumPy isn't installed")
+    def test_numpy_dates(self):
+        column = ResultColumn(models.DateField())
+        column.extend((datetime.date(1969, 12, 31), datetime.date(2014, 5, 1)))
+        self.assertEqual(column.to_numpy().tolist(), [datetime.date(1969, 12, 31), datetime.date(2014, 5, 1)])
+        column = ResultColumn(models.DateTimeField())
+        column.extend((self.created, None))
+        self.assertEqual(column.to_numpy().tolist(), [self.created, None])
+        column = ResultColumn(models.DateField())
+        column.extend((None,))
+        self.assertEqual(column.to_numpy().tolist(), [None])
+        # Backends without a date type return datetimes.
+        column = ResultColumn(models.DateField())
+        column.extend((datetime.datetime(2014, 5, 1, 23, 30), None))
+        self.assertEqual(column.to_numpy().tolist(), [datetime.date(2014, 5, 1), None])
+        with self.settings(USE_TZ=True):
+            column = ResultColumn(models.DateTimeField())
+            column.extend((None, timezone.make_aware(self.created, timezone.get_fixed_timezone(120))))
+            self.assertEqual(column.to_numpy().tolist(), [None, self.created - datetime.timedelta(hours=2)])
@@ -1,2 +1,8 @@
 bind = "0.0.0.0:8001"
 
+# every open stream holds a thread, and the tweets are only pushed to the
+# streams of the process they were posted to (see twitter/streaming.py).
+# settings.STREAMING_MAX_STREAMS must stay below threads so that some are
+# left to serve the pages.
+workers = 1
+threads = 200
@@ -1,7 +1,10 @@
 fuser -k 8001/tcp;
+# the job worker, see twitter/jobs.py; jobs it was running are retried
+pkill -f "manage.py run_jobs";
 source ../venv/bin/activate;
 echo "DONE"
 gunicorn twitter_project.wsgi:application -c gunicorn.conf.py  -D
+nohup python manage.py run_jobs --processes 2 >> run_jobs.log 2>&1 &
 echo "Finished Restarting"
 
 
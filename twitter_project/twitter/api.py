@@ -0,0 +1,159 @@
+"""
+A read-only JSON API, version 1, under /api/1/.
+
+    /api/1/tweets                   public timeline
+    /api/1/users/<name>             profile and counts
+    /api/1/users/<name>/tweets      tweets of a user
+    /api/1/users/<name>/home        home timeline of a user
+
+Timelines are lists of tweets, newest first, paginated like Twitter's:
+``?count=`` tweets (at most MAX_COUNT) with an id greater than
+``?since_id=`` and lower than or equal to ``?max_id=``. Tweets are
+serialized from ``values_list()`` rows, without instantiating models.
+
+Every response carries a strong ETag and a Last-Modified date derived from
+the fragment cache generations of the data it shows (see
+twitter.fragments), so a conditional request is answered with a 304 after
+a cache lookup and at most one query, before the data is read.
+"""
+import json
+import time
+from datetime import datetime
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse, JsonResponse, Http404
+from django.views.decorators.http import condition, require_GET
+
+from twitter import fragments
+from twitter.models import Tweet, UserProfile
+from twitter.timeline import get_timeline_store
+
+
+VERSION = 1
+COUNT = 20
+MAX_COUNT = 200
+
+TWEET_FIELDS = ('id', 'user__username', 'text', 'created_date')
+PROFILE_FIELDS = ('user_id', 'user__username', 'tweet_count', 'follower_count', 'following_count')
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def json_response(data, status=200):
+    return HttpResponse(json.dumps(data, separators=(',', ':')), status=status,
+                        content_type='application/json')
+
+
+def get_user_id(user_name):
+    user_id = User.objects.filter(username=user_name).values_list('id', flat=True).first()
+    if user_id is None:
+        raise Http404
+    return user_id
+
+
+def get_cursor(request):
+    """
+    return ``(since_id, max_id, count)`` from the query string
+    """
+    try:
+        since_id = int(request.GET.get('since_id') or 0)
+        max_id = request.GET.get('max_id')
+        max_id = int(max_id) if max_id else None
+        count = min(max(int(request.GET.get('count') or COUNT), 1), MAX_COUNT)
+    except ValueError:
+        raise BadRequest("'since_id', 'max_id' and 'count' must be integers.")
+    return since_id, max_id, count
+
+
+def get_version(request, name, vary_on):
+    """
+    return the ETag and the Last-Modified date of the response to
+    ``request`` showing fragment ``name``; None if it may be read from a
+    replica that hasn't caught up with the last change
+    """
+    if not hasattr(request, '_api_version'):
+        key, changed = fragments.make_key(name, vary_on + [VERSION, request.get_full_path()])
+        if fragments.may_be_stale(changed):
+            request._api_version = None, None
+        elif time.time() - changed < 1:
+            # Last-Modified has a resolution of one second: a change later in
+            # the same second would go unnoticed
+            request._api_version = key[len(fragments.KEY_PREFIX):], None
+        else:
+            request._api_version = key[len(fragments.KEY_PREFIX):], datetime.utcfromtimestamp(int(changed))
+    return request._api_version
+
+
+def versioned(name):
+    """
+    make the decorated view conditional on the generations of the data of
+    fragment ``name``; a ``user_name`` URL argument is resolved to the
+    ``user_id`` argument of the view
+    """
+    def decorator(view):
+        conditional = condition(
+            etag_func=lambda request, **kwargs: get_version(request, name, list(kwargs.values()))[0],
+            last_modified_func=lambda request, **kwargs: get_version(request, name, list(kwargs.values()))[1],
+        )(view)
+
+        @require_GET
+        @wraps(view)
+        def wrapper(request, user_name=None):
+            kwargs = {} if user_name is None else {'user_id': get_user_id(user_name)}
+            try:
+                return conditional(request, **kwargs)
+            except BadRequest as e:
+                return JsonResponse({"error": str(e)}, status=400)
+        return wrapper
+    return decorator
+
+
+def serialize_tweets(rows):
+    return [{
+        "id": tweet_id,
+        "user": username,
+        "text": text,
+        "created_date": created_date.isoformat(),
+    } for tweet_id, username, text, created_date in rows]
+
+
+def tweet_rows(tweets, since_id, max_id, count):
+    tweets = tweets.filter(id__gt=since_id)
+    if max_id is not None:
+        tweets = tweets.filter(id__lte=max_id)
+    return tweets.order_by('-id').values_list(*TWEET_FIELDS)[:count]
+
+
+@versioned('public_tweets')
+def public_timeline(request):
+    since_id, max_id, count = get_cursor(request)
+    return json_response(serialize_tweets(tweet_rows(Tweet.objects.all(), since_id, max_id, count)))
+
+
+@versioned('user_tweets')
+def user_timeline(request, user_id):
+    since_id, max_id, count = get_cursor(request)
+    tweets = Tweet.objects.filter(user_id=user_id)
+    return json_response(serialize_tweets(tweet_rows(tweets, since_id, max_id, count)))
+
+
+@versioned('api_home_tweets')
+def home_timeline(request, user_id):
+    since_id, max_id, count = get_cursor(request)
+    # the timeline store excludes max_id, the API includes it
+    tweet_ids = get_timeline_store().get_tweet_ids_before(
+        user_id, None if max_id is None else max_id + 1, count)
+    tweet_ids = [tweet_id for tweet_id in tweet_ids if tweet_id > since_id]
+    rows = dict((row[0], row) for row in Tweet.objects.filter(id__in=tweet_ids).values_list(*TWEET_FIELDS))
+    return json_response(serialize_tweets(rows[tweet_id] for tweet_id in tweet_ids if tweet_id in rows))
+
+
+@versioned('profile')
+def profile(request, user_id):
+    row = UserProfile.objects.filter(user_id=user_id).values_list(*PROFILE_FIELDS).first()
+    if row is None:
+        raise Http404
+    return json_response(dict(zip(('id', 'user', 'tweet_count', 'follower_count', 'following_count'), row)))
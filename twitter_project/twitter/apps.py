@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class TwitterConfig(AppConfig):
+    name = 'twitter'
+    verbose_name = "Dwitter"
+
+    def ready(self):
+        # connect the signal receivers keeping derived data up to date and
+        # register the tasks of the job queue
+        from twitter import fragments, rendering, search, tasks, trends
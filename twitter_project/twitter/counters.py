@@ -0,0 +1,109 @@
+"""
+Denormalized tweet, follower and following counts stored on UserProfile.
+
+The counters are moved with single UPDATE ... SET x = x + n statements so
+concurrent writers never lose an increment. ``reconcile()`` recomputes them
+from Tweet and Relationship when they drift (see the reconcile_counters
+command).
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from twitter.models import UserProfile, Tweet, Relationship
+
+
+COUNTER_FIELDS = ('tweet_count', 'follower_count', 'following_count')
+
+
+def incr(user_id, field, delta=1):
+    UserProfile.objects.filter(user_id=user_id).update(**{field: F(field) + delta})
+
+
+def tweet_posted(user_id, count=1):
+    incr(user_id, 'tweet_count', count)
+
+
+def tweets_posted(counts):
+    """
+    apply ``{user_id: number of new tweets}`` with one UPDATE per user
+    """
+    with transaction.atomic():
+        for user_id, count in counts.items():
+            tweet_posted(user_id, count)
+
+
+def tweet_deleted(user_id, count=1):
+    incr(user_id, 'tweet_count', -count)
+
+
+def followed(who_id, whom_id):
+    with transaction.atomic():
+        incr(who_id, 'following_count')
+        incr(whom_id, 'follower_count')
+
+
+def unfollowed(who_id, whom_id):
+    with transaction.atomic():
+        incr(who_id, 'following_count', -1)
+        incr(whom_id, 'follower_count', -1)
+
+
+def get_counts(user_id):
+    """
+    return ``{field: value}`` of the counters of ``user_id`` as stored now,
+    rather than as they were when a profile was loaded
+    """
+    counts = UserProfile.objects.filter(user_id=user_id).values(*COUNTER_FIELDS).first()
+    return counts or dict((field, 0) for field in COUNTER_FIELDS)
+
+
+def save_profile(profile):
+    """
+    save every field of ``profile`` but its counters, which other requests
+    may have moved since it was read
+    """
+    profile.save(update_fields=[field.name for field in profile._meta.concrete_fields
+                                if not field.primary_key and field.name not in COUNTER_FIELDS])
+
+
+def compute(user_ids=None, tweet_model=Tweet, relationship_model=Relationship):
+    """
+    return ``{user_id: {field: value}}`` counted from Tweet and Relationship
+    """
+    tweets = tweet_model.objects.all()
+    followings = relationship_model.objects.all()
+    followers = relationship_model.objects.all()
+    if user_ids is not None:
+        tweets = tweets.filter(user_id__in=user_ids)
+        followings = followings.filter(who_id__in=user_ids)
+        followers = followers.filter(whom_id__in=user_ids)
+
+    counts = {}
+    for field, rows in (
+            ('tweet_count', tweets.values_list('user_id').annotate(n=Count('id')).order_by()),
+            ('following_count', followings.values_list('who_id').annotate(n=Count('id')).order_by()),
+            ('follower_count', followers.values_list('whom_id').annotate(n=Count('id')).order_by())):
+        for user_id, n in rows:
+            counts.setdefault(user_id, {})[field] = n
+    return counts
+
+
+def reconcile(user_ids=None, profile_model=UserProfile, **models):
+    """
+    rewrite the counters that differ from the real counts; return how many
+    profiles were fixed
+    """
+    counts = compute(user_ids, **models)
+    profiles = profile_model.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+
+    fixed = 0
+    with transaction.atomic():
+        for row in profiles.values('id', 'user_id', *COUNTER_FIELDS):
+            expected = dict((field, 0) for field in COUNTER_FIELDS)
+            expected.update(counts.get(row['user_id'], {}))
+            if any(row[field] != expected[field] for field in COUNTER_FIELDS):
+                profile_model.objects.filter(id=row['id']).update(**expected)
+                fixed += 1
+    return fixed
@@ -0,0 +1,260 @@
+"""
+Archives of a user's data: profile, tweets, followings and followers.
+
+An archive is generated in chunks of CHUNK_SIZE rows written to disk under
+``settings.EXPORT_ROOT/<user_id>/<snapshot>/``, then streamed from there as
+NDJSON (one JSON object per line, each with a "type") or as a zip of
+NDJSON files, one per chunk. Rows are read by id ranges with
+``QuerySet.iterator()``, so memory use doesn't depend on how many tweets
+the user has.
+
+A snapshot records the highest ids when the export started and only
+covers the rows up to them. Chunks are named after the ids they span,
+so an interrupted export resumes from the last chunk written, and a new
+download within ``settings.EXPORT_MAX_AGE`` reuses the chunks already on
+disk. Concurrent downloads may each start a snapshot; the directory of each
+one gets a unique name. Snapshots older than twice EXPORT_MAX_AGE are
+deleted when a new one starts, so a download still reading a snapshot has
+at least EXPORT_MAX_AGE seconds to finish.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.encoding import force_bytes
+
+from twitter.models import Relationship, Tweet
+
+
+CHUNK_SIZE = 1000
+DEFAULT_MAX_AGE = 24 * 60 * 60
+MANIFEST = 'manifest.json'
+# bytes read at a time from a chunk file
+BLOCK_SIZE = 64 * 1024
+
+
+def tweet_rows(user_id, after_id, max_id):
+    tweets = Tweet.objects.filter(user_id=user_id, id__gt=after_id, id__lte=max_id).order_by('id')
+    for tweet_id, text, created_date in tweets.values_list('id', 'text', 'created_date')[:CHUNK_SIZE].iterator():
+        yield tweet_id, {"type": "tweet", "id": tweet_id, "text": text,
+                         "created_date": created_date.isoformat()}
+
+
+def relationship_rows(kind, field, other_field):
+    def rows(user_id, after_id, max_id):
+        relationships = list(Relationship.objects.filter(
+            id__gt=after_id, id__lte=max_id, **{field: user_id}).order_by('id')
+            .values_list('id', other_field)[:CHUNK_SIZE].iterator())
+        usernames = dict(User.objects.filter(id__in=[other_id for _, other_id in relationships])
+                         .values_list('id', 'username'))
+        for relationship_id, other_id in relationships:
+            # None for a deleted user
+            record = {"type": kind, "user": usernames[other_id]} if other_id in usernames else None
+            yield relationship_id, record
+    return rows
+
+
+# name => (model whose ids are exported, function returning the (id,
+# record) pairs of a chunk)
+SECTIONS = (
+    ('tweets', Tweet, tweet_rows),
+    ('followings', Relationship, relationship_rows('following', 'who_id', 'whom_id')),
+    ('followers', Relationship, relationship_rows('follower', 'whom_id', 'who_id')),
+)
+
+
+def get_root():
+    return getattr(settings, 'EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+
+
+def get_max_age():
+    return getattr(settings, 'EXPORT_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def snapshot_time(snapshot):
+    """
+    return when the snapshot named ``snapshot`` was started
+    """
+    # <milliseconds>-<random> (<milliseconds> before)
+    try:
+        return int(snapshot.split('-')[0]) / 1000.0
+    except ValueError:
+        return 0.0
+
+
+def write_file(path, content):
+    # write then rename, so that readers never see a partial chunk; the
+    # downloads of a snapshot may write the same chunk at the same time
+    tmp = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.rename(tmp, path)
+
+
+def to_line(record):
+    return force_bytes(json.dumps(record, separators=(',', ':'))) + b'\n'
+
+
+class Export(object):
+    """
+    The snapshot of the data of one user being exported.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.directory = None
+        self.manifest = None
+
+    def open(self):
+        """
+        reuse the latest snapshot of the user if it is recent enough, or
+        start a new one
+        """
+        user_directory = os.path.join(get_root(), str(self.user.pk))
+        snapshots = sorted(os.listdir(user_directory)) if os.path.isdir(user_directory) else []
+        for snapshot in reversed(snapshots):
+            path = os.path.join(user_directory, snapshot, MANIFEST)
+            if os.path.exists(path):
+                with open(path) as f:
+                    manifest = json.load(f)
+                if manifest['created'] > time.time() - get_max_age():
+                    self.directory = os.path.dirname(path)
+                    self.manifest = manifest
+                    return self
+                break
+        self.manifest = {
+            "created": time.time(),
+            "max_ids": dict((name, model.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+                            for name, model, _ in SECTIONS),
+        }
+        self.directory = os.path.join(user_directory, '%d-%s' % (self.manifest['created'] * 1000,
+                                                                 uuid.uuid4().hex[:8]))
+        os.makedirs(self.directory)
+        write_file(os.path.join(self.directory, MANIFEST), force_bytes(json.dumps(self.manifest)))
+        expired = time.time() - 2 * get_max_age()
+        for snapshot in snapshots:
+            if snapshot_time(snapshot) < expired:
+                shutil.rmtree(os.path.join(user_directory, snapshot), ignore_errors=True)
+        return self
+
+    def profile(self):
+        profile = self.user.profile
+        return {
+            "type": "profile",
+            "id": self.user.pk,
+            "user": self.user.username,
+            "desc": profile.desc,
+            "date_joined": self.user.date_joined.isoformat(),
+            "exported": datetime.utcfromtimestamp(self.manifest['created']).isoformat(),
+        }
+
+    def chunks(self):
+        """
+        yield the ``(name, path)`` of the chunk files of the snapshot in
+        order, generating the missing ones
+        """
+        for name, model, rows in SECTIONS:
+            existing = dict((filename.split('-')[1], filename) for filename in os.listdir(self.directory)
+                            if filename.startswith(name + '-') and filename.endswith('.ndjson'))
+            after_id = 0
+            while True:
+                # <name>-<after id>-<last id>.ndjson
+                filename = existing.get(str(after_id))
+                if filename is None:
+                    filename = self.write_chunk(name, rows, after_id)
+                    if filename is None:
+                        break
+                yield filename[:-len('.ndjson')], os.path.join(self.directory, filename)
+                after_id = int(filename[:-len('.ndjson')].split('-')[2])
+
+    def write_chunk(self, name, rows, after_id):
+        """
+        write the chunk of section ``name`` following ``after_id`` and
+        return its file name, or None after the last one
+        """
+        last_id = None
+        lines = []
+        for last_id, record in rows(self.user.pk, after_id, self.manifest['max_ids'][name]):
+            if record is not None:
+                lines.append(to_line(record))
+        if last_id is None:
+            return None
+        filename = '%s-%d-%d.ndjson' % (name, after_id, last_id)
+        write_file(os.path.join(self.directory, filename), b''.join(lines))
+        return filename
+
+
+def read_blocks(path):
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def stream_ndjson(export):
+    yield to_line(export.profile())
+    for _, path in export.chunks():
+        for block in read_blocks(path):
+            yield block
+
+
+class ZipStream(object):
+    """
+    The write-only file zipfile writes the archive to; what has been
+    written is taken with ``pop()``.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def stream_zip(export):
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED)
+    archive.writestr('profile.json', json.dumps(export.profile(), indent=2))
+    yield stream.pop()
+    for name, path in export.chunks():
+        with open(path, 'rb') as f:
+            archive.writestr('%s.ndjson' % name, f.read())
+        yield stream.pop()
+    archive.close()
+    yield stream.pop()
+
+
+FORMATS = {
+    'ndjson': (stream_ndjson, 'application/x-ndjson', 'ndjson'),
+    'zip': (stream_zip, 'application/zip', 'zip'),
+}
+
+
+def export(user, format='zip'):
+    """
+    return the iterator of the bytes of the archive of ``user`` in
+    ``format``
+    """
+    stream = FORMATS[format][0]
+    return stream(Export(user).open())
@@ -0,0 +1,245 @@
+"""
+Template fragment caching with signal-driven invalidation.
+
+A fragment is a piece of a template, e.g. a page of tweets, cached under
+its name, the values it varies on (the user, the page number or cursor...)
+and the current *generation* of everything it depends on. A generation is a
+token stored in the cache under keys such as "tweets:<user_id>"; the
+receivers below replace the token whenever a Tweet, Relationship or profile
+changes, so stale fragments are never read again and simply expire.
+
+Each fragment name maps to a function in DEPENDENCIES that returns the
+generation keys of the fragment from its vary-on values:
+
+    {% cachefragment "user_tweets" user.pk request.GET.page %}...{% endcachefragment %}
+
+Hits, misses and the render time saved by hits are counted per fragment in
+the cache too, see ``get_stats()`` and the fragment_stats command.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.encoding import force_bytes
+
+from twitter import graph, routers
+from twitter.models import Tweet, Relationship, UserProfile
+
+
+KEY_PREFIX = 'fragment:'
+STATS_PREFIX = 'fragment-stats:'
+STATS = ('hits', 'misses', 'render_us', 'saved_us')
+
+PUBLIC_TWEETS = 'tweets'
+PROFILES = 'profiles'
+
+
+def tweets_key(user_id):
+    return 'tweets:{}'.format(user_id)
+
+
+def timeline_key(user_id):
+    return 'timeline:{}'.format(user_id)
+
+
+def profile_key(user_id):
+    return 'profile:{}'.format(user_id)
+
+
+DEPENDENCIES = {
+    # every list of tweets shows the pictures and names of their authors
+    'public_tweets': lambda *vary_on: [PUBLIC_TWEETS, PROFILES],
+    'home_tweets': lambda user_id, *vary_on: [timeline_key(user_id), PROFILES],
+    'user_tweets': lambda user_id, *vary_on: [tweets_key(user_id), profile_key(user_id)],
+    'sidebar': lambda user_id, login_user_id, *vary_on: [profile_key(user_id), profile_key(login_user_id)],
+    'profile': lambda user_id, *vary_on: [profile_key(user_id)],
+    # the JSON of twitter.api only has the usernames of the authors, which
+    # profile_changed() invalidates in the timelines of their followers
+    'api_home_tweets': lambda user_id, *vary_on: [timeline_key(user_id)],
+}
+
+
+def get_cache():
+    """
+    return the cache named by ``settings.FRAGMENT_CACHE`` (``default`` if unset)
+    """
+    return caches[getattr(settings, 'FRAGMENT_CACHE', 'default')]
+
+
+def get_timeout():
+    # fragments are invalidated explicitly, the timeout only bounds how long
+    # unreachable ones use memory
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def new_generation():
+    return '{:.3f}-{}'.format(time.time(), uuid.uuid4().hex[:12])
+
+
+def generation_time(generation):
+    try:
+        return float(generation.split('-', 1)[0])
+    except ValueError:
+        # a token from before generations were timestamped
+        return 0.0
+
+
+def make_key(name, vary_on):
+    """
+    return the key of fragment ``name`` for the ``vary_on`` values, which
+    includes the current generation of its dependencies, and the time the
+    newest of these generations started
+    """
+    cache = get_cache()
+    dependencies = DEPENDENCIES[name](*vary_on)
+    generations = cache.get_many(dependencies)
+    for key in dependencies:
+        if key not in generations:
+            generations[key] = _start_generation(cache, key)
+    parts = [name] + ['%s' % value for value in vary_on] + [generations[key] for key in dependencies]
+    changed = max(generation_time(generations[key]) for key in dependencies)
+    return KEY_PREFIX + hashlib.md5(force_bytes(':'.join(parts))).hexdigest(), changed
+
+
+def _start_generation(cache, key):
+    # add() so that concurrent requests agree on the first generation
+    token = new_generation()
+    if not cache.add(key, token, None):
+        token = cache.get(key, token)
+    return token
+
+
+def get_generation(key):
+    """
+    return the current generation of ``key``, e.g. to tell whether data
+    read before has changed since
+    """
+    cache = get_cache()
+    token = cache.get(key)
+    if token is None:
+        token = _start_generation(cache, key)
+    return token
+
+
+def may_be_stale(changed):
+    """
+    return whether data read now may predate the generation started at
+    ``changed``, because the replicas may not have the change yet
+    """
+    return routers.reads_from_replicas() and time.time() - changed < routers.get_replica_lag()
+
+
+def get_or_render(name, vary_on, render):
+    """
+    return the cached fragment ``name`` for ``vary_on``, calling ``render()``
+    to produce and cache it on a miss
+    """
+    cache = get_cache()
+    key, changed = make_key(name, vary_on)
+    cached = cache.get(key)
+    if cached is not None:
+        content, render_us = cached
+        _incr(name, hits=1, saved_us=render_us)
+        return content
+    start = time.time()
+    content = render()
+    render_us = int((time.time() - start) * 1000000)
+    if may_be_stale(changed):
+        # don't keep what the replicas returned for the whole generation
+        _incr(name, misses=1, render_us=render_us)
+        return content
+    cache.set(key, (content, render_us), get_timeout())
+    _incr(name, misses=1, render_us=render_us)
+    return content
+
+
+def invalidate(*keys):
+    """
+    start a new generation for ``keys``, making every fragment depending on
+    them stale
+    """
+    token = new_generation()
+    get_cache().set_many(dict((key, token) for key in keys), None)
+
+
+def _incr(name, **counts):
+    cache = get_cache()
+    for stat, delta in counts.items():
+        key = '{}{}:{}'.format(STATS_PREFIX, name, stat)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # first count; a concurrent first count may be lost
+            if not cache.add(key, delta, None):
+                cache.incr(key, delta)
+
+
+def get_stats():
+    """
+    return ``{name: {"hits", "misses", "hit_ratio", "render_time",
+    "saved_time"}}`` for every fragment, times in seconds
+    """
+    keys = ['{}{}:{}'.format(STATS_PREFIX, name, stat) for name in DEPENDENCIES for stat in STATS]
+    values = get_cache().get_many(keys)
+    res = {}
+    for name in DEPENDENCIES:
+        stats = dict((stat, values.get('{}{}:{}'.format(STATS_PREFIX, name, stat), 0)) for stat in STATS)
+        lookups = stats['hits'] + stats['misses']
+        res[name] = {
+            "hits": stats['hits'],
+            "misses": stats['misses'],
+            "hit_ratio": stats['hits'] / float(lookups) if lookups else None,
+            "render_time": stats['render_us'] / 1000000.0,
+            "saved_time": stats['saved_us'] / 1000000.0,
+        }
+    return res
+
+
+def reset_stats():
+    get_cache().delete_many(['{}{}:{}'.format(STATS_PREFIX, name, stat)
+                             for name in DEPENDENCIES for stat in STATS])
+
+
+def tweets_changed(tweets):
+    """
+    invalidate the fragments showing any of ``tweets``; bulk writers call it
+    themselves as bulk_create sends no signals
+    """
+    author_ids = set(tweet.user_id for tweet in tweets)
+    keys = set([PUBLIC_TWEETS])
+    for author_id, follower_ids in graph.follower_ids_map(author_ids).items():
+        keys.update(timeline_key(follower_id) for follower_id in follower_ids)
+    for author_id in author_ids:
+        # the sidebar shows the tweet count
+        keys.update([tweets_key(author_id), profile_key(author_id)])
+    invalidate(*keys)
+
+
+@receiver(post_save, sender=Tweet, dispatch_uid='twitter.fragments.tweet_saved')
+@receiver(post_delete, sender=Tweet, dispatch_uid='twitter.fragments.tweet_deleted')
+def tweet_changed(sender, instance, **kwargs):
+    tweets_changed([instance])
+
+
+@receiver(post_save, sender=Relationship, dispatch_uid='twitter.fragments.relationship_saved')
+@receiver(post_delete, sender=Relationship, dispatch_uid='twitter.fragments.relationship_deleted')
+def relationship_changed(sender, instance, **kwargs):
+    invalidate(profile_key(instance.who_id), profile_key(instance.whom_id), timeline_key(instance.who_id))
+
+
+@receiver(post_save, sender=User, dispatch_uid='twitter.fragments.user_saved')
+@receiver(post_save, sender=UserProfile, dispatch_uid='twitter.fragments.profile_saved')
+def profile_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= set(['last_login']):
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    keys = [PROFILES, profile_key(user_id)]
+    if sender is User:
+        # the username may have changed
+        keys.extend(timeline_key(follower_id) for follower_id in graph.follower_ids(user_id))
+    invalidate(*keys)
@@ -0,0 +1,167 @@
+"""
+Follower graph queries on top of Relationship.
+
+Every function answers with a single query (or none at all once an
+AdjacencyIndex is loaded), whatever the number of relationships involved.
+Functions returning users return lazy QuerySets, so they can be sliced or
+handed to a Paginator without loading the whole list.
+"""
+from collections import defaultdict
+from threading import local
+
+from django.contrib.auth.models import User
+from django.core.signals import request_started, request_finished
+from django.db.models import Q
+
+from twitter.models import Relationship
+
+
+def follower_ids(user_id):
+    """
+    return the ids of the users following ``user_id``
+    """
+    return Relationship.objects.filter(whom_id=user_id).values_list('who_id', flat=True)
+
+
+def following_ids(user_id):
+    """
+    return the ids of the users ``user_id`` follows
+    """
+    return Relationship.objects.filter(who_id=user_id).values_list('whom_id', flat=True)
+
+
+def follower_ids_map(user_ids):
+    """
+    return ``{user_id: [follower ids]}`` for many users with one query
+    """
+    res = dict((user_id, []) for user_id in user_ids)
+    rows = Relationship.objects.filter(whom_id__in=list(res)).values_list('whom_id', 'who_id')
+    for whom_id, who_id in rows:
+        res[whom_id].append(who_id)
+    return res
+
+
+def followers(user_id):
+    return User.objects.filter(id__in=follower_ids(user_id)).order_by('id')
+
+
+def followings(user_id):
+    return User.objects.filter(id__in=following_ids(user_id)).order_by('id')
+
+
+def mutuals(user_id):
+    """
+    return the users who follow ``user_id`` and are followed back
+    """
+    return followings(user_id).filter(id__in=follower_ids(user_id))
+
+
+def is_following(who_id, whom_id):
+    return Relationship.objects.filter(who_id=who_id, whom_id=whom_id).exists()
+
+
+def following_pairs(pairs):
+    """
+    return the subset of ``(who_id, whom_id)`` pairs that are relationships
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    query = Q()
+    for who_id, whom_ids in _group_pairs(pairs).items():
+        query |= Q(who_id=who_id, whom_id__in=whom_ids)
+    found = Relationship.objects.filter(query).values_list('who_id', 'whom_id')
+    return set(found) & pairs
+
+
+def _group_pairs(pairs):
+    grouped = defaultdict(list)
+    for who_id, whom_id in pairs:
+        grouped[who_id].append(whom_id)
+    return grouped
+
+
+class AdjacencyIndex(object):
+    """
+    In-memory adjacency sets for the relationships touching ``user_ids``.
+
+    Loading costs one query; afterwards every lookup involving at least one
+    of ``user_ids`` is answered without touching the database.
+    """
+
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.following = defaultdict(set)
+        self.followers = defaultdict(set)
+        if self.user_ids:
+            rows = Relationship.objects.filter(
+                Q(who_id__in=self.user_ids) | Q(whom_id__in=self.user_ids)
+            ).values_list('who_id', 'whom_id')
+            for who_id, whom_id in rows:
+                self.following[who_id].add(whom_id)
+                self.followers[whom_id].add(who_id)
+
+    def _check(self, *user_ids):
+        if not self.user_ids.intersection(user_ids):
+            raise KeyError("None of %r were loaded in this index." % (user_ids,))
+
+    def is_following(self, who_id, whom_id):
+        self._check(who_id, whom_id)
+        return whom_id in self.following[who_id]
+
+    def following_pairs(self, pairs):
+        return set(pair for pair in pairs if self.is_following(*pair))
+
+    def following_ids(self, user_id):
+        self._check(user_id)
+        return self.following[user_id]
+
+    def follower_ids(self, user_id):
+        self._check(user_id)
+        return self.followers[user_id]
+
+    def mutual_ids(self, user_id):
+        return self.following_ids(user_id) & self.follower_ids(user_id)
+
+
+class RequestFollowingCache(local):
+    """
+    Per-thread memo of the usernames each user follows.
+
+    It is emptied whenever a request starts or finishes, so within one request
+    the followings of a user are loaded once and every later check is a set
+    lookup.
+    """
+
+    def __init__(self):
+        self.usernames = {}
+        self.user_ids = {}
+
+    def clear(self, **kwargs):
+        self.usernames.clear()
+        self.user_ids.clear()
+
+    def remember(self, user):
+        """
+        record the id of ``user``, already loaded, to avoid looking it up
+        """
+        self.user_ids[user.username] = user.pk
+
+    def following_usernames(self, username):
+        if username not in self.usernames:
+            if username in self.user_ids:
+                who_ids = [self.user_ids[username]]
+            else:
+                who_ids = User.objects.filter(username=username).values('id')
+            whom_ids = Relationship.objects.filter(who_id__in=who_ids).values('whom_id')
+            self.usernames[username] = frozenset(
+                User.objects.filter(id__in=whom_ids).values_list('username', flat=True))
+        return self.usernames[username]
+
+    def is_following(self, who_name, whom_name):
+        return whom_name in self.following_usernames(who_name)
+
+
+request_cache = RequestFollowingCache()
+request_started.connect(request_cache.clear)
+request_finished.connect(request_cache.clear)
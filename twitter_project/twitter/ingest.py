@@ -0,0 +1,146 @@
+"""
+Bulk tweet ingestion from newline-delimited JSON.
+
+Each line is an object such as ``{"user": "alice", "text": "hello"}``. Lines
+are validated and written in batches: one bulk INSERT per batch inside its
+own transaction, which also queues the fan-out, counter updates and search
+indexing of the batch as jobs (see twitter.tasks). Invalid lines are
+reported and skipped; they never abort the batch they belong to.
+"""
+import json
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import six, timezone
+
+from twitter import fragments, jobs, rendering, streaming, trends
+from twitter.models import Tweet
+
+
+BATCH_SIZE = 1000
+TWEET_MAX_LENGTH = 140
+
+
+class IngestResult(object):
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def error(self, line_number, message):
+        self.errors.append({"line": line_number, "error": message})
+
+    def as_dict(self):
+        return {"created": self.created, "errors": self.errors}
+
+
+def parse(lines, result):
+    """
+    yield ``(line_number, record)`` for every JSON object in ``lines``
+    """
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            result.error(line_number, "Invalid JSON.")
+            continue
+        if not isinstance(record, dict):
+            result.error(line_number, "Expected a JSON object.")
+            continue
+        yield line_number, record
+
+
+def ingest(lines, user=None, batch_size=BATCH_SIZE):
+    """
+    create the tweets described by the NDJSON ``lines`` and return an
+    IngestResult.
+
+    If ``user`` is given every tweet is written as that user and the "user"
+    key of the records is ignored.
+    """
+    result = IngestResult()
+    batch = []
+    for item in parse(lines, result):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            _ingest_batch(batch, user, result)
+            batch = []
+    if batch:
+        _ingest_batch(batch, user, result)
+    return result
+
+
+def _validate(batch, user, result):
+    """
+    return the ``(line_number, Tweet)`` pairs of the valid records
+    """
+    if user is None:
+        usernames = set(record.get("user") for _, record in batch)
+        user_ids = dict(User.objects.filter(username__in=[name for name in usernames if name])
+                        .values_list('username', 'id'))
+    valid = []
+    for line_number, record in batch:
+        text = record.get("text")
+        if not isinstance(text, six.text_type) or not text.strip():
+            result.error(line_number, "'text' must be a non-empty string.")
+            continue
+        if len(text) > TWEET_MAX_LENGTH:
+            result.error(line_number, "'text' is longer than %d characters." % TWEET_MAX_LENGTH)
+            continue
+        if user is not None:
+            user_id = user.id
+        else:
+            user_id = user_ids.get(record.get("user"))
+            if user_id is None:
+                result.error(line_number, "Unknown user %r." % record.get("user"))
+                continue
+        tweet = Tweet(user_id=user_id, text=text)
+        # bulk_create sends no pre_save signal
+        rendering.render_tweet(tweet)
+        valid.append((line_number, tweet))
+    return valid
+
+
+def _ingest_batch(batch, user, result):
+    tweets = [tweet for _, tweet in _validate(batch, user, result)]
+    if not tweets:
+        return
+    with transaction.atomic():
+        last_id = Tweet.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        started = timezone.now()
+        Tweet.objects.bulk_create(tweets)
+        _assign_ids(tweets, last_id, started)
+        # committed with the tweets; fan-out and counters, see twitter.tasks
+        jobs.enqueue_many("tweet_posted", [{"tweet_id": tweet.id, "user_id": tweet.user_id}
+                                           for tweet in tweets])
+        # bulk_create sends no post_save signal
+        jobs.enqueue_many("index_tweets", [{"tweet_id": tweet.id} for tweet in tweets])
+    # once committed, or pages rendered meanwhile would be cached with the
+    # old rows
+    fragments.tweets_changed(tweets)
+    trends.tweets_posted(tweets)
+    streaming.publish_many(tweets)
+    result.created += len(tweets)
+
+
+def _assign_ids(tweets, last_id, started):
+    """
+    bulk_create doesn't return primary keys; read back, in the transaction
+    of the INSERT, the rows of the authors of ``tweets`` inserted after
+    ``last_id`` since ``started``, and give their ids to the tweets of each
+    author in order.
+    """
+    pending = defaultdict(list)
+    for tweet in reversed(tweets):
+        pending[tweet.user_id].append(tweet)
+    rows = (Tweet.objects.filter(id__gt=last_id, user_id__in=list(pending), created_date__gte=started)
+            .order_by('id').values_list('id', 'user_id'))
+    for tweet_id, user_id in rows:
+        if pending[user_id]:
+            pending[user_id].pop().id = tweet_id
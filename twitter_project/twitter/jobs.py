@@ -0,0 +1,197 @@
+"""
+A job queue stored in the database, for the side effects of writes.
+
+Views ``enqueue()`` a job instead of doing the work; the run_jobs command
+runs them. Tasks are registered by name with the ``task`` decorator (see
+twitter.tasks) and receive a list of payloads: a worker claims up to
+``batch_size`` due jobs of the same task and runs them with one call.
+
+Delivery is at least once. A claimed job is leased to its worker until
+``locked_until``; if the worker dies the lease expires and another worker
+picks the job up. A task and the deletion of its jobs are committed in one
+transaction, so a task that only writes to the database is not applied
+twice, but tasks with effects outside of it (cache, files) must tolerate
+being run again. Such effects are best registered with ``after_commit()``
+so that nobody sees them before the rows they describe. A failing batch is retried job by job; a failing job is
+rescheduled with an exponential backoff and marked failed after
+``settings.JOBS_MAX_ATTEMPTS`` attempts.
+
+With ``settings.JOBS_ASYNC = False`` jobs run as soon as they are enqueued,
+which is convenient in development and tests.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from twitter.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+LEASE = 5 * 60
+MAX_ATTEMPTS = 5
+BACKOFF = 10
+MAX_BACKOFF = 60 * 60
+
+registry = {}
+_local = threading.local()
+
+
+def task(name):
+    """
+    register the decorated function as the task ``name``; it is called
+    with the list of the payloads of a batch of jobs
+    """
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def is_async():
+    return getattr(settings, 'JOBS_ASYNC', True)
+
+
+def enqueue(name, **payload):
+    """
+    schedule the task ``name`` with ``payload``, which must be JSON
+    serializable
+    """
+    enqueue_many(name, [payload])
+
+
+def enqueue_many(name, payloads):
+    """
+    schedule the task ``name`` once for each of ``payloads``, with one
+    INSERT
+    """
+    if name not in registry:
+        raise KeyError("Unknown task %r." % name)
+    payloads = list(payloads)
+    if not payloads:
+        return
+    if not is_async():
+        registry[name](payloads)
+        return
+    Job.objects.bulk_create([Job(name=name, payload=json.dumps(payload)) for payload in payloads])
+
+
+def after_commit(func, *args, **kwargs):
+    """
+    call ``func(*args, **kwargs)`` once the transaction of the running task
+    has committed, e.g. to invalidate cached pages; at once outside of a
+    task run by ``run()``. Nothing is called if the task fails.
+    """
+    callbacks = getattr(_local, 'callbacks', None)
+    if callbacks is None:
+        func(*args, **kwargs)
+    else:
+        callbacks.append((func, args, kwargs))
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def due_jobs(now):
+    return Job.objects.filter(failed=False, run_at__lte=now).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+
+
+def claim(worker, batch_size=BATCH_SIZE):
+    """
+    lease up to ``batch_size`` due jobs of the same task to ``worker`` and
+    return them, oldest first
+    """
+    now = timezone.now()
+    due = due_jobs(now).order_by('run_at', 'id')
+    name = due.values_list('name', flat=True).first()
+    if name is None:
+        return []
+    job_ids = list(due.filter(name=name).values_list('id', flat=True)[:batch_size])
+    lock = '{}:{}'.format(worker, uuid.uuid4().hex[:8])
+    # jobs claimed by another worker meanwhile no longer match due_jobs()
+    due_jobs(now).filter(id__in=job_ids).update(
+        locked_by=lock, locked_until=now + timedelta(seconds=getattr(settings, 'JOBS_LEASE', LEASE)))
+    return list(Job.objects.filter(id__in=job_ids, locked_by=lock).order_by('run_at', 'id'))
+
+
+def run(jobs):
+    """
+    run a batch of claimed jobs of the same task; return the number of jobs
+    that succeeded
+    """
+    try:
+        func = registry[jobs[0].name]
+    except KeyError:
+        for job in jobs:
+            retry(job, "Unknown task %r." % job.name)
+        return 0
+    _local.callbacks = []
+    try:
+        with transaction.atomic():
+            func([json.loads(job.payload) for job in jobs])
+            Job.objects.filter(id__in=[job.id for job in jobs]).delete()
+    except Exception:
+        _local.callbacks = None
+        if len(jobs) > 1:
+            # find the failing jobs
+            return sum(run([job]) for job in jobs)
+        logger.exception("Job %s (%s) failed.", jobs[0].id, jobs[0].name)
+        retry(jobs[0], traceback.format_exc())
+        return 0
+    callbacks, _local.callbacks = _local.callbacks, None
+    for callback, args, kwargs in callbacks:
+        try:
+            callback(*args, **kwargs)
+        except Exception:
+            # the jobs are done, don't run them again
+            logger.exception("A callback of %s jobs (%s) failed after commit.", len(jobs), jobs[0].name)
+    return len(jobs)
+
+
+def retry(job, error):
+    """
+    release ``job`` and schedule its next attempt, or mark it failed
+    """
+    job.attempts += 1
+    job.last_error = error
+    job.locked_by = ''
+    job.locked_until = None
+    if job.attempts >= getattr(settings, 'JOBS_MAX_ATTEMPTS', MAX_ATTEMPTS):
+        job.failed = True
+    else:
+        delay = min(BACKOFF * 2 ** (job.attempts - 1), MAX_BACKOFF)
+        # spread the retries of jobs that failed together
+        job.run_at = timezone.now() + timedelta(seconds=delay * random.uniform(1, 1.5))
+    job.save()
+
+
+def work(batch_size=BATCH_SIZE, once=False, sleep=1.0):
+    """
+    run jobs until interrupted, or until none is due if ``once``; return
+    the number of jobs that succeeded
+    """
+    worker = worker_name()
+    done = 0
+    while True:
+        jobs = claim(worker, batch_size)
+        if jobs:
+            done += run(jobs)
+        elif once:
+            return done
+        else:
+            time.sleep(sleep)
@@ -0,0 +1,61 @@
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from twitter import api, views
+
+
+class Command(BaseCommand):
+    help = ("Measures the throughput of the JSON API, with and without conditional "
+            "requests, against the HTML views showing the same timelines.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', action='store', dest='requests', type='int', default=200,
+            help='Number of requests per view.'),
+        make_option('--user', action='store', dest='user', default=None,
+            help='Username whose timelines are requested; the first user by default.'),
+    )
+
+    def handle(self, *args, **options):
+        users = User.objects.select_related('profile')
+        user = users.filter(username=options['user']).first() if options['user'] else users.first()
+        if user is None:
+            raise CommandError("Create a user first.")
+        factory = RequestFactory()
+        name = user.username
+        cases = (
+            ("public timeline", views.index, '/', {}, api.public_timeline, '/api/1/tweets'),
+            ("user timeline", views.user_timeline, '/tweets/%s' % name, {'user_name': name},
+             api.user_timeline, '/api/1/users/%s/tweets' % name),
+            ("home timeline", views.followings_timeline, '/tweets/%s/followings' % name, {'user_name': name},
+             api.home_timeline, '/api/1/users/%s/home' % name),
+        )
+
+        def measure(view, path, kwargs, **headers):
+            start = time.time()
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options['requests']):
+                    request = factory.get(path, **headers)
+                    request.session = {'username': name}
+                    request.user = request.dwitter_user = user
+                    response = view(request, **kwargs)
+            elapsed = time.time() - start
+            return response, options['requests'] / elapsed, len(queries) / options['requests']
+
+        self.stdout.write("%-16s %-10s %10s %8s %8s" % ("", "", "req/s", "queries", "bytes"))
+        for label, html_view, html_path, kwargs, api_view, api_path in cases:
+            response, rate, queries = measure(html_view, html_path, kwargs)
+            self.stdout.write("%-16s %-10s %10.0f %8.1f %8d" % (label, "html", rate, queries, len(response.content)))
+            response, rate, queries = measure(api_view, api_path, kwargs)
+            self.stdout.write("%-16s %-10s %10.0f %8.1f %8d" % ("", "json", rate, queries, len(response.content)))
+            if not response.has_header('ETag'):
+                continue
+            response, rate, queries = measure(api_view, api_path, kwargs, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.stdout.write("%-16s %-10s %10.0f %8.1f %8d" % ("", "json, 304", rate, queries, len(response.content)))
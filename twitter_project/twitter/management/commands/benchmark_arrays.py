@@ -0,0 +1,95 @@
+from __future__ import division
+
+import sys
+import time
+from collections import Counter
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from twitter.models import Tweet
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def size_of(value):
+    """
+    return the approximate number of bytes used by ``value``, including the
+    items of lists, tuples and arrays of objects
+    """
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(sys.getsizeof(item) for item in value)
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def analyze_rows(rows):
+    hours = Counter(created_date.hour for _, created_date in rows)
+    users = Counter(user_id for user_id, _ in rows)
+    return hours, users
+
+
+def analyze_arrays(columns):
+    hours = Counter(created_date.hour for created_date in columns['created_date'])
+    users = Counter(columns['user'])
+    return hours, users
+
+
+def analyze_numpy(columns):
+    hours = numpy.bincount(columns['created_date'].astype('datetime64[h]').astype('int64') % 24, minlength=24)
+    users = numpy.bincount(columns['user'])
+    return hours, users
+
+
+class Command(BaseCommand):
+    help = ("Compares the time and memory taken to fetch the user and date of tweets "
+            "and count them per hour and per user, with values_list() and to_arrays().")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', action='store', dest='rows', type='int', default=50000,
+            help='Number of tweets loaded per query.'),
+        make_option('--rounds', action='store', dest='rounds', type='int', default=5,
+            help='Number of times each case runs; the fastest is reported.'),
+    )
+
+    def handle(self, *args, **options):
+        tweets = Tweet.objects.order_by('id')[:options['rows']]
+        rows = len(tweets.values_list('id'))
+        if not rows:
+            raise CommandError("Create some tweets first, e.g. with generate_load_data.")
+        cases = [
+            ("values_list()", lambda: list(tweets.values_list('user', 'created_date')), analyze_rows),
+            ("to_arrays()", lambda: tweets.to_arrays('user', 'created_date'), analyze_arrays),
+        ]
+        if numpy is not None:
+            cases.append(("to_arrays(numpy)", lambda: tweets.to_arrays('user', 'created_date', numpy=True),
+                          analyze_numpy))
+        else:
+            self.stderr.write("NumPy isn't installed, skipping to_arrays(numpy=True).")
+        self.stdout.write("%-18s %12s %12s %12s" % ("%d rows" % rows, "fetch rows/s", "count ms", "size MB"))
+        for label, fetch, analyze in cases:
+            fetch_time, result = self.measure(fetch, options['rounds'])
+            count_time, _ = self.measure(lambda: analyze(result), options['rounds'])
+            self.stdout.write("%-18s %12.0f %12.1f %12.2f" % (label, rows / fetch_time, count_time * 1000,
+                                                             size_of(result) / 1024 / 1024))
+
+    def measure(self, func, rounds):
+        """
+        return the shortest time taken by ``func()`` in ``rounds`` runs and
+        its result
+        """
+        best = None
+        for _ in range(rounds):
+            start = time.time()
+            result = func()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
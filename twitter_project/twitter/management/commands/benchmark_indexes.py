@@ -0,0 +1,112 @@
+from __future__ import division
+
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from twitter import graph
+from twitter.models import Tweet
+
+
+# Tables reduced to the columns the hot lookups touch.
+SCHEMA = [
+    'CREATE TABLE "twitter_relationship" ("id" integer NOT NULL PRIMARY KEY, '
+    '"who_id" integer NOT NULL, "whom_id" integer NOT NULL)',
+    'CREATE TABLE "twitter_tweet" ("id" integer NOT NULL PRIMARY KEY, '
+    '"user_id" integer NOT NULL, "text" text NOT NULL, "created_date" datetime NOT NULL)',
+]
+
+# What migration 0013 adds, plus the single column index Django creates for
+# the Tweet.user foreign key (it exists in both variants).
+BASE_INDEXES = [
+    'CREATE INDEX "twitter_tweet_user_id" ON "twitter_tweet" ("user_id")',
+]
+NEW_INDEXES = [
+    'CREATE UNIQUE INDEX "relationship_who_whom" ON "twitter_relationship" ("who_id", "whom_id")',
+    'CREATE INDEX "relationship_whom_who" ON "twitter_relationship" ("whom_id", "who_id")',
+    'CREATE INDEX "tweet_user_created" ON "twitter_tweet" ("user_id", "created_date")',
+]
+
+
+class Command(BaseCommand):
+    help = ("Compares the query plans and latency of the Relationship and Tweet "
+            "hot lookups on SQLite without and with the indexes of migration 0013.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', action='store', dest='rows', type='int', default=1000000,
+            help='Number of relationships and of tweets to generate.'),
+        make_option('--users', action='store', dest='users', type='int', default=10000,
+            help='Number of distinct user ids.'),
+        make_option('--repeat', action='store', dest='repeat', type='int', default=200,
+            help='Number of times each lookup is timed.'),
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark compiles its queries for SQLite.")
+        self.rows = options['rows']
+        self.users = options['users']
+        self.repeat = options['repeat']
+        if self.rows > self.users ** 2:
+            raise CommandError("--rows can't exceed the number of distinct (who, whom) pairs.")
+
+        for label, indexes in (('before', BASE_INDEXES), ('after', BASE_INDEXES + NEW_INDEXES)):
+            db = self.build_database(indexes)
+            self.stdout.write("== %s: %d relationships, %d tweets" % (label, self.rows, self.rows))
+            for name, make_query in self.lookups():
+                sql, params = make_query()
+                plan = db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+                elapsed = self.time_query(db, make_query)
+                self.stdout.write("%-14s %8.3f ms  %s" % (
+                    name, elapsed * 1000, ' | '.join(row[-1] for row in plan)))
+            db.close()
+
+    def build_database(self, indexes):
+        db = sqlite3.connect(':memory:')
+        for statement in SCHEMA + indexes:
+            db.execute(statement)
+        rnd = random.Random(0)
+        pairs = set()
+        while len(pairs) < self.rows:
+            pairs.add((rnd.randint(1, self.users), rnd.randint(1, self.users)))
+        db.executemany('INSERT INTO "twitter_relationship" ("who_id", "whom_id") VALUES (?, ?)', pairs)
+        start = datetime(2014, 5, 1)
+        db.executemany(
+            'INSERT INTO "twitter_tweet" ("user_id", "text", "created_date") VALUES (?, ?, ?)',
+            ((rnd.randint(1, self.users), 'tweet %d' % i, str(start + timedelta(seconds=i)))
+             for i in range(self.rows)))
+        db.commit()
+        return db
+
+    def lookups(self):
+        rnd = random.Random(1)
+
+        def user_id():
+            return rnd.randint(1, self.users)
+
+        def compile(queryset):
+            sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+            # the sqlite3 module takes qmark placeholders
+            return sql.replace('%s', '?'), params
+
+        return [
+            ('is_following', lambda: compile(
+                graph.following_ids(user_id()).filter(whom_id=user_id())[:1])),
+            ('followings', lambda: compile(graph.following_ids(user_id()))),
+            ('followers', lambda: compile(graph.follower_ids(user_id()))),
+            ('user_timeline', lambda: compile(
+                Tweet.objects.filter(user_id=user_id()).order_by('-created_date')
+                .values_list('id', flat=True)[:10])),
+        ]
+
+    def time_query(self, db, make_query):
+        queries = [make_query() for _ in range(self.repeat)]
+        start = time.time()
+        for sql, params in queries:
+            db.execute(sql, params).fetchall()
+        return (time.time() - start) / self.repeat
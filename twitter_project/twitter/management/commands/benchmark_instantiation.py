@@ -0,0 +1,60 @@
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import signals
+
+from twitter.models import Tweet
+
+
+def noop(sender, **kwargs):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Measures how many Tweet rows per second QuerySet.iterator() turns into "
+            "instances, with the row loaders and through Model.__init__().")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', action='store', dest='rows', type='int', default=5000,
+            help='Number of tweets loaded per query.'),
+        make_option('--rounds', action='store', dest='rounds', type='int', default=5,
+            help='Number of times each query runs; the fastest is reported.'),
+    )
+
+    def handle(self, *args, **options):
+        tweets = Tweet.objects.order_by('-id')[:options['rows']]
+        rows = len(tweets.values_list('id'))
+        if not rows:
+            raise CommandError("Create some tweets first, e.g. with generate_load_data.")
+        cases = (
+            ("plain", tweets),
+            ("only()", tweets.only('id', 'text', 'created_date')),
+            ("select_related()", tweets.select_related('user')),
+        )
+        self.stdout.write("%-18s %14s %14s %8s" % ("%d rows" % rows, "__init__ rows/s", "loader rows/s", "speedup"))
+        for label, queryset in cases:
+            # a pre_init receiver makes every model go through __init__()
+            signals.pre_init.connect(noop)
+            try:
+                init_rate = rows / self.measure(queryset, options['rounds'])
+            finally:
+                signals.pre_init.disconnect(noop)
+            loader_rate = rows / self.measure(queryset, options['rounds'])
+            self.stdout.write("%-18s %14.0f %14.0f %7.2fx" % (label, init_rate, loader_rate, loader_rate / init_rate))
+
+    def measure(self, queryset, rounds):
+        """
+        return the shortest time taken to iterate over ``queryset`` in
+        ``rounds`` runs
+        """
+        best = None
+        for _ in range(rounds):
+            start = time.time()
+            for _ in queryset.iterator():
+                pass
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
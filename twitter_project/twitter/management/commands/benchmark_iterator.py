@@ -0,0 +1,50 @@
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from twitter.models import Tweet
+
+
+class Command(BaseCommand):
+    help = ("Measures how many Tweet rows per second QuerySet.iterator() reads with "
+            "the default fetch size, fixed chunk sizes and chunk_size='auto'.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', action='store', dest='rows', type='int', default=50000,
+            help='Number of tweets loaded per query.'),
+        make_option('--rounds', action='store', dest='rounds', type='int', default=5,
+            help='Number of times each query runs; the fastest is reported.'),
+    )
+
+    def handle(self, *args, **options):
+        tweets = Tweet.objects.order_by('id')[:options['rows']]
+        rows = len(tweets.values_list('id'))
+        if not rows:
+            raise CommandError("Create some tweets first, e.g. with generate_load_data.")
+        cases = (
+            ("instances", tweets),
+            ("values_list()", tweets.values_list('id', 'text', 'created_date')),
+        )
+        chunk_sizes = (None, 10, 1000, 'auto')
+        self.stdout.write("%-16s" % ("%d rows" % rows) +
+                          "".join("%17s" % ("chunk_size=%s" % size) for size in chunk_sizes))
+        for label, queryset in cases:
+            rates = [rows / self.measure(queryset, size, options['rounds']) for size in chunk_sizes]
+            self.stdout.write("%-16s" % label + "".join("%17.0f" % rate for rate in rates))
+
+    def measure(self, queryset, chunk_size, rounds):
+        """
+        return the shortest time taken to iterate over ``queryset`` with
+        ``chunk_size`` in ``rounds`` runs
+        """
+        best = None
+        for _ in range(rounds):
+            start = time.time()
+            for _ in queryset.iterator(chunk_size=chunk_size):
+                pass
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
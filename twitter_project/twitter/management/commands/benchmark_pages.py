@@ -0,0 +1,198 @@
+from __future__ import division
+
+import json
+import platform
+import random
+import resource
+import time
+from optparse import make_option
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.utils import timezone
+
+from twitter.models import Tweet
+
+
+SCENARIOS = ('index', 'user_timeline', 'followings_timeline', 'relationship', 'new_tweet')
+# scenarios run in a transaction rolled back at the end, so that a run
+# doesn't change the data of the next one
+WRITE_SCENARIOS = ('new_tweet',)
+# metrics compared with --compare, lower is better
+COMPARED = ('p50_ms', 'p95_ms', 'queries')
+
+
+def percentile(values, fraction):
+    """
+    return the value below which ``fraction`` of the sorted ``values`` lie
+    """
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def max_rss_kb():
+    # kilobytes on Linux, bytes on Mac OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if platform.system() == 'Darwin' else rss
+
+
+class Command(BaseCommand):
+    help = ("Drives the main pages through the test client as users created by "
+            "generate_load_data and reports latency percentiles, queries per "
+            "request and memory, optionally saved to and compared with JSON files. "
+            "The tweets (and jobs) of the new_tweet scenario are written in a "
+            "transaction that is rolled back, so their commit isn't measured.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', action='store', dest='requests', type='int', default=200,
+            help='Number of requests per scenario.'),
+        make_option('--users', action='store', dest='users', type='int', default=20,
+            help='Number of users the requests are made as.'),
+        make_option('--prefix', action='store', dest='prefix', default='load',
+            help='Prefix of the usernames of generate_load_data.'),
+        make_option('--password', action='store', dest='password', default='dwitter',
+            help='Password of these users.'),
+        make_option('--scenario', action='append', dest='scenarios', default=None,
+            help='Scenario to run, among %s; all by default. Can be repeated.' % ', '.join(SCENARIOS)),
+        make_option('--output', action='store', dest='output', default=None,
+            help='Write the results to this JSON file.'),
+        make_option('--compare', action='store', dest='compare', default=None,
+            help='Compare the results with this JSON file of a previous run.'),
+        make_option('--tolerance', action='store', dest='tolerance', type='float', default=0.2,
+            help='Relative increase reported as a regression by --compare.'),
+        make_option('--seed', action='store', dest='seed', type='int', default=0,
+            help='Seed of the random generator.'),
+    )
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or SCENARIOS
+        for name in scenarios:
+            if name not in SCENARIOS:
+                raise CommandError("Unknown scenario %r." % name)
+        usernames = list(User.objects.filter(username__startswith=options['prefix'])
+                         .order_by('id').values_list('username', flat=True))
+        if not usernames:
+            raise CommandError("No user named %s<number>, run generate_load_data first." % options['prefix'])
+        # the test client's host must be allowed
+        setup_test_environment()
+        self.rnd = random.Random(options['seed'])
+        self.usernames = usernames
+        self.clients = [(username, self.login(username, options['password']))
+                        for username in self.rnd.sample(usernames, min(options['users'], len(usernames)))]
+
+        results = {}
+        for name in scenarios:
+            # a few users make all the requests, far above the write limits
+            with override_settings(RATE_LIMITS={}):
+                results[name] = self.run(name, options['requests'])
+            self.stdout.write("%-20s p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  %5.1f queries  max RSS %d kB" % (
+                name, results[name]['p50_ms'], results[name]['p95_ms'], results[name]['p99_ms'],
+                results[name]['queries'], results[name]['max_rss_kb']))
+
+        report = {
+            "date": timezone.now().isoformat(),
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "cache": settings.CACHES['default']['BACKEND'],
+            "users": len(usernames),
+            "tweets": Tweet.objects.count(),
+            "requests": options['requests'],
+            "results": results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report, options['tolerance'])
+
+    def login(self, username, password):
+        client = Client()
+        response = client.post('/login', {'username': username, 'password': password})
+        if response.status_code != 302:
+            raise CommandError("Can't log in as %s." % username)
+        return client
+
+    def request(self, name):
+        """
+        return a function making one request of scenario ``name`` as a
+        random user
+        """
+        username, client = self.rnd.choice(self.clients)
+        # popular users are visited more; generate_load_data makes the first
+        # users the most followed ones
+        other = self.usernames[min(int(self.rnd.paretovariate(1)) - 1, len(self.usernames) - 1)]
+        page = self.rnd.choice((1, 1, 1, 2, 3))
+        if name == 'index':
+            return lambda: client.get('/', {'page': page})
+        if name == 'user_timeline':
+            return lambda: client.get('/tweets/%s' % other, {'page': page})
+        if name == 'followings_timeline':
+            return lambda: client.get('/tweets/%s/followings' % username, {'page': page})
+        if name == 'relationship':
+            return lambda: client.get('/tweets/%s/relationship' % other,
+                                      {'type': self.rnd.choice(('followers', 'followings'))})
+        if name == 'new_tweet':
+            return lambda: client.post('/%s/tweets/new' % username,
+                                       {'text': 'benchmark tweet %d #bench' % self.rnd.randint(1, 1000000)})
+
+    def run(self, name, requests):
+        if name not in WRITE_SCENARIOS:
+            return self.measure(name, requests)
+        with transaction.atomic():
+            try:
+                return self.measure(name, requests)
+            finally:
+                transaction.set_rollback(True)
+
+    def measure(self, name, requests):
+        latencies = []
+        queries = []
+        # warm up caches and imports
+        self.request(name)()
+        rss_before = max_rss_kb()
+        for _ in range(requests):
+            make_request = self.request(name)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.time()
+                response = make_request()
+                latencies.append((time.time() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError("%s: status %d." % (name, response.status_code))
+            queries.append(len(captured))
+        latencies.sort()
+        return {
+            "mean_ms": sum(latencies) / len(latencies),
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": latencies[-1],
+            "queries": sum(queries) / len(queries),
+            "max_queries": max(queries),
+            "max_rss_kb": max_rss_kb(),
+            "rss_growth_kb": max_rss_kb() - rss_before,
+        }
+
+    def compare(self, baseline, report, tolerance):
+        regressions = 0
+        self.stdout.write("Compared with the run of %s:" % baseline.get('date'))
+        for name, result in sorted(report['results'].items()):
+            previous = baseline['results'].get(name)
+            if previous is None:
+                continue
+            for metric in COMPARED:
+                before, after = previous[metric], result[metric]
+                change = (after - before) / before if before else 0
+                flag = ''
+                if change > tolerance:
+                    flag = '  REGRESSION'
+                    regressions += 1
+                self.stdout.write("%-20s %-8s %9.2f -> %9.2f  %+6.1f%%%s" % (
+                    name, metric, before, after, change * 100, flag))
+        if regressions:
+            raise CommandError("%d regression(s) above %d%%." % (regressions, tolerance * 100))
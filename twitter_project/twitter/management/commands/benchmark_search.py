@@ -0,0 +1,71 @@
+from __future__ import division
+
+import random
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from twitter.models import Tweet, SearchTerm
+from twitter.search import rebuild_index, SearchPaginator
+
+
+class Command(BaseCommand):
+    help = ("Measures the search index build time and query latency on a "
+            "throwaway test database filled with synthetic tweets.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--tweets', action='store', dest='tweets', type='int', default=1000000,
+            help='Number of synthetic tweets.'),
+        make_option('--users', action='store', dest='users', type='int', default=1000,
+            help='Number of synthetic users.'),
+        make_option('--repeat', action='store', dest='repeat', type='int', default=50,
+            help='Number of times each query is timed.'),
+    )
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(0)
+        self.vocabulary = ['word%d' % i for i in range(20000)]
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            self.populate(options['users'], options['tweets'])
+            start = time.time()
+            rebuild_index()
+            elapsed = time.time() - start
+            self.stdout.write("Indexed %d tweets (%d terms) in %.2fs, %d tweets/s." % (
+                options['tweets'], SearchTerm.objects.count(), elapsed, options['tweets'] / elapsed))
+            for query in ('word1', 'word15000', 'word1*', 'word12*', '#tag3', '@user7',
+                          'word1 word2', 'word1 #tag3'):
+                self.stdout.write("%-14s %8.3f ms per first page" % (
+                    query, self.time_query(query, options['repeat']) * 1000))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def text(self):
+        # word frequencies follow a Zipf-like distribution
+        words = [self.vocabulary[int(self.rnd.paretovariate(1.1)) % len(self.vocabulary)]
+                 for _ in range(self.rnd.randint(3, 15))]
+        if self.rnd.random() < 0.2:
+            words.append('#tag%d' % int(self.rnd.paretovariate(1.1)))
+        if self.rnd.random() < 0.2:
+            words.append('@user%d' % self.rnd.randint(1, 1000))
+        return ' '.join(words)
+
+    def populate(self, users, tweets):
+        User.objects.bulk_create([User(username='user%d' % i) for i in range(users)])
+        user_ids = list(User.objects.values_list('id', flat=True))
+        chunk = 10000
+        for offset in range(0, tweets, chunk):
+            with transaction.atomic():
+                Tweet.objects.bulk_create([
+                    Tweet(user_id=self.rnd.choice(user_ids), text=self.text())
+                    for _ in range(min(chunk, tweets - offset))
+                ])
+
+    def time_query(self, query, repeat):
+        start = time.time()
+        for _ in range(repeat):
+            list(SearchPaginator(query, 20).page())
+        return (time.time() - start) / repeat
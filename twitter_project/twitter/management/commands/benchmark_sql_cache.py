@@ -0,0 +1,67 @@
+from __future__ import division
+
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, DEFAULT_DB_ALIAS
+from django.db.backends.utils import CompiledSQLCache
+
+from twitter.models import Tweet
+
+
+class Command(BaseCommand):
+    help = ("Times QuerySet.filter().get() and the compilation of its SQL without "
+            "and with the compiled SQL cache of the connection.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', action='store', dest='repeat', type='int', default=2000,
+            help='Number of queries per case.'),
+        make_option('--size', action='store', dest='size', type='int', default=100,
+            help='Size of the compiled SQL cache.'),
+    )
+
+    def handle(self, *args, **options):
+        tweet_ids = list(Tweet.objects.order_by('-id').values_list('id', flat=True)[:100])
+        usernames = list(User.objects.order_by('id').values_list('username', flat=True)[:100])
+        if not tweet_ids:
+            raise CommandError("Create some tweets first, e.g. with generate_load_data.")
+        repeat = options['repeat']
+        cases = (
+            ("Tweet pk", lambda i: Tweet.objects.filter(pk=tweet_ids[i % len(tweet_ids)])),
+            ("User username", lambda i: User.objects.filter(username=usernames[i % len(usernames)])),
+            ("Tweet + user", lambda i: Tweet.objects.select_related('user').filter(pk=tweet_ids[i % len(tweet_ids)])),
+        )
+
+        old_cache = connection.compiled_sql_cache
+        try:
+            self.stdout.write("%-16s %-8s %12s %12s" % ("", "", "as_sql() us", "get() us"))
+            for label, make_queryset in cases:
+                for mode in ("off", "on"):
+                    connection.compiled_sql_cache = CompiledSQLCache(options['size']) if mode == "on" else None
+                    # only the compilation of a new query is timed
+                    compile_us = self.measure(repeat, lambda query: query.get_compiler(DEFAULT_DB_ALIAS).as_sql(),
+                                              lambda i: make_queryset(i).query)
+                    get_us = self.measure(repeat, lambda i: make_queryset(i).get())
+                    self.stdout.write("%-16s %-8s %12.1f %12.1f" % (label if mode == "off" else "",
+                                                                    "cache " + mode, compile_us, get_us))
+        finally:
+            connection.compiled_sql_cache = old_cache
+
+    def measure(self, repeat, func, setup=lambda i: i, rounds=5):
+        """
+        return the mean duration of ``func(setup(i))`` for i in
+        ``range(repeat)`` in microseconds, in the fastest of ``rounds``
+        rounds; ``setup`` isn't timed
+        """
+        func(setup(repeat))
+        best = None
+        for _ in range(rounds):
+            args = [setup(i) for i in range(repeat)]
+            start = time.time()
+            for arg in args:
+                func(arg)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best / repeat * 1000000
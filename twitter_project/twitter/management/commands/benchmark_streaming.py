@@ -0,0 +1,101 @@
+from __future__ import division
+
+import threading
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from twitter import streaming, views
+
+
+class Command(BaseCommand):
+    help = ("Compares showing new tweets by reloading the timeline page with pushing "
+            "them to idle streams: the cost of a reload, and the cost and latency "
+            "of a publish to many subscribers.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--subscribers', action='store', dest='subscribers', type='int', default=1000,
+            help='Number of idle streams.'),
+        make_option('--tweets', action='store', dest='tweets', type='int', default=100,
+            help='Number of tweets published.'),
+        make_option('--reloads', action='store', dest='reloads', type='int', default=100,
+            help='Number of timed page reloads.'),
+        make_option('--interval', action='store', dest='interval', type='int', default=30,
+            help='Seconds between two reloads of a polling client.'),
+    )
+
+    def handle(self, *args, **options):
+        user = User.objects.select_related('profile').first()
+        if user is None:
+            raise CommandError("Create a user first.")
+        subscribers = options['subscribers']
+        interval = options['interval']
+
+        # polling: every client renders the public timeline again
+        factory = RequestFactory()
+        start = time.time()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(options['reloads']):
+                request = factory.get('/')
+                request.session = {}
+                request.user = request.dwitter_user = user
+                views.index(request)
+        reload_ms = (time.time() - start) / options['reloads'] * 1000
+        self.stdout.write("Reload: %.2f ms and %.1f queries per page; %d clients polling every %ds "
+                          "cost %.0f ms of CPU and %.0f queries per second." % (
+                              reload_ms, len(queries) / options['reloads'], subscribers, interval,
+                              reload_ms * subscribers / interval,
+                              len(queries) / options['reloads'] * subscribers / interval))
+
+        # streaming: the clients wait in threads until a tweet is published
+        broker = streaming.broker
+        latencies = []
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def listen(subscriber):
+            while not stop.is_set():
+                for _, published in subscriber.get():
+                    with lock:
+                        latencies.append(time.time() - published)
+
+        threads = []
+        for _ in range(subscribers):
+            thread = threading.Thread(target=listen, args=(broker.subscribe(),))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            publish_time = 0
+            for i in range(options['tweets']):
+                start = time.time()
+                # the message is the publication time, to measure the latency
+                broker.publish(start, user.pk, start)
+                publish_time += time.time() - start
+                # let the listeners drain their queues
+                time.sleep(0.01)
+            deadline = time.time() + 5
+            while len(latencies) < subscribers * options['tweets'] and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            broker.tick()
+            for thread in threads:
+                thread.join()
+            for subscriber in broker.subscribers():
+                broker.unsubscribe(subscriber)
+
+        latencies.sort()
+        if not latencies:
+            raise CommandError("No tweet was delivered.")
+        self.stdout.write("Publish to %d idle streams: %.2f ms per tweet, %d of %d deliveries; "
+                          "latency median %.2f ms, 99th percentile %.2f ms." % (
+                              subscribers, publish_time / options['tweets'] * 1000,
+                              len(latencies), subscribers * options['tweets'],
+                              latencies[len(latencies) // 2] * 1000,
+                              latencies[int(len(latencies) * 0.99)] * 1000))
@@ -0,0 +1,63 @@
+from __future__ import division
+
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from twitter.trends import SlidingWindowCounter, extract_hashtags, extract_mentions
+
+
+class Command(BaseCommand):
+    help = ("Replays a synthetic tweet stream through the trending counters and "
+            "measures the ingestion rate and the latency of the top-N query.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--tweets', action='store', dest='tweets', type='int', default=1000000,
+            help='Number of synthetic tweets.'),
+        make_option('--rate', action='store', dest='rate', type='int', default=1000,
+            help='Tweets per second of simulated time.'),
+        make_option('--tags', action='store', dest='tags', type='int', default=50000,
+            help='Number of distinct hashtags.'),
+        make_option('--repeat', action='store', dest='repeat', type='int', default=1000,
+            help='Number of times each query is timed.'),
+    )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        tags = ['#tag%d' % i for i in range(options['tags'])]
+        texts = []
+        for _ in range(10000):
+            # tag popularity follows a Zipf-like distribution
+            words = ['word'] * rnd.randint(3, 12)
+            for _ in range(rnd.choice((0, 0, 1, 1, 2, 3))):
+                words.append(tags[int(rnd.paretovariate(1.1)) % len(tags)])
+            if rnd.random() < 0.3:
+                words.append('@user%d' % rnd.randint(1, 10000))
+            texts.append(' '.join(words))
+
+        hashtags = SlidingWindowCounter()
+        mentions = SlidingWindowCounter()
+        tweets = options['tweets']
+        step = 1 / options['rate']
+        now = time.time() - tweets * step
+        start = time.time()
+        for i in range(tweets):
+            text = texts[i % len(texts)]
+            hashtags.add(extract_hashtags(text), now)
+            mentions.add(extract_mentions(text), now)
+            now += step
+        elapsed = time.time() - start
+        self.stdout.write("Counted %d tweets (%.0f s of stream) in %.2fs, %d tweets/s; %d hashtags in the window." % (
+            tweets, tweets * step, elapsed, tweets / elapsed, len(hashtags.totals)))
+
+        for label, refresh in (('top 10, cached ranking', hashtags.refresh), ('top 10, fresh ranking', 0)):
+            hashtags.refresh = refresh
+            hashtags.top(10, now)
+            start = time.time()
+            for _ in range(options['repeat']):
+                hashtags.top(10, now)
+            self.stdout.write("%-24s %8.3f ms" % (label, (time.time() - start) / options['repeat'] * 1000))
+        for term, score in hashtags.top(5, now):
+            self.stdout.write("  %-12s %10.1f" % (term, score))
@@ -0,0 +1,41 @@
+import sys
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from twitter import export
+
+
+class Command(BaseCommand):
+    help = ("Writes the archive of a user's tweets, followings and followers. An "
+            "interrupted export resumes from the chunks already generated.")
+    args = '<username>'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', action='store', dest='format', default='zip',
+            help='Archive format: %s.' % ', '.join(sorted(export.FORMATS))),
+        make_option('--output', action='store', dest='output', default=None,
+            help='File to write; standard output by default.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: export_user %s" % self.args)
+        user = User.objects.select_related('profile').filter(username=args[0]).first()
+        if user is None:
+            raise CommandError("No user named %r." % args[0])
+        if options['format'] not in export.FORMATS:
+            raise CommandError("Unknown format %r." % options['format'])
+        verbosity = int(options.get('verbosity'))
+        output = open(options['output'], 'wb') if options['output'] else getattr(sys.stdout, 'buffer', sys.stdout)
+        size = 0
+        try:
+            for data in export.export(user, options['format']):
+                output.write(data)
+                size += len(data)
+        finally:
+            if options['output']:
+                output.close()
+        if verbosity >= 1 and options['output']:
+            self.stdout.write("Wrote %d bytes to %s." % (size, options['output']))
@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from twitter.fragments import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = ("Reports the hit ratio of the cached template fragments and the "
+            "render time their hits saved.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', action='store_true', dest='reset', default=False,
+            help='Reset the statistics after reporting them.'),
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write("%-14s %8s %8s %7s %12s %12s" % (
+            'fragment', 'hits', 'misses', 'ratio', 'rendering', 'saved'))
+        for name, stats in sorted(get_stats().items()):
+            ratio = stats['hit_ratio']
+            self.stdout.write("%-14s %8d %8d %7s %11.3fs %11.3fs" % (
+                name, stats['hits'], stats['misses'],
+                '-' if ratio is None else '%.1f%%' % (ratio * 100),
+                stats['render_time'], stats['saved_time']))
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,186 @@
+from __future__ import division
+
+import bisect
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from twitter import counters, fragments, rendering, search
+from twitter.models import Relationship, Tweet, UserProfile
+from twitter.timeline import get_timeline_store
+
+
+BATCH_SIZE = 5000
+WORDS = ('the', 'a', 'django', 'python', 'coffee', 'today', 'new', 'release', 'bug', 'fixed',
+         'deploy', 'weekend', 'music', 'tokyo', 'train', 'lunch', 'great', 'idea', 'why', 'now')
+# share of the tweets posted in each hour of the day (UTC)
+HOURLY = (2, 1, 1, 1, 1, 2, 3, 5, 6, 6, 5, 6, 7, 6, 5, 5, 6, 7, 8, 9, 9, 8, 6, 4)
+
+
+@contextmanager
+def explicit_created_date():
+    """
+    let bulk_create() store the created_date of the tweets instead of the
+    current time
+    """
+    field = Tweet._meta.get_field('created_date')
+    auto_now = field.auto_now
+    field.auto_now = False
+    try:
+        yield
+    finally:
+        field.auto_now = auto_now
+
+
+class Sampler(object):
+    """
+    Draws indexes with probabilities proportional to ``weights``.
+    """
+
+    def __init__(self, weights, rnd):
+        self.cumulative = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+        self.rnd = rnd
+
+    def sample(self):
+        return bisect.bisect(self.cumulative, self.rnd.random() * self.cumulative[-1])
+
+
+class Command(BaseCommand):
+    help = ("Generates users, a power-law follower graph and tweets spread over the "
+            "last days with bulk_create, to reproduce a production-like load locally.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--users', action='store', dest='users', type='int', default=1000,
+            help='Number of users to create.'),
+        make_option('--tweets', action='store', dest='tweets', type='int', default=100000,
+            help='Number of tweets to create.'),
+        make_option('--followings', action='store', dest='followings', type='int', default=50,
+            help='Average number of users each user follows.'),
+        make_option('--exponent', action='store', dest='exponent', type='float', default=2.1,
+            help='Exponent of the power law of the follower counts.'),
+        make_option('--days', action='store', dest='days', type='int', default=30,
+            help='Number of days the tweets are spread over.'),
+        make_option('--prefix', action='store', dest='prefix', default='load',
+            help='Prefix of the usernames, followed by a number.'),
+        make_option('--password', action='store', dest='password', default='dwitter',
+            help='Password of every user created.'),
+        make_option('--seed', action='store', dest='seed', type='int', default=0,
+            help='Seed of the random generator.'),
+    )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity'))
+        rnd = random.Random(options['seed'])
+        start = time.time()
+        user_ids = self.create_users(options['users'], options['prefix'], options['password'])
+        # Zipf weights rank ** (-1 / (exponent - 1)) give follower counts
+        # following a power law of that exponent; user 0 is the most followed
+        popularity = Sampler([rank ** (-1 / (options['exponent'] - 1))
+                              for rank in range(1, len(user_ids) + 1)], rnd)
+        self.create_relationships(user_ids, popularity, options['followings'], rnd)
+        # popular users tweet more
+        self.create_tweets(user_ids, popularity, options['tweets'], options['days'], rnd)
+
+        self.log(1, "Updating counters and home timelines...")
+        counters.reconcile(user_ids)
+        store = get_timeline_store()
+        for user_id in user_ids:
+            store.rebuild(user_id)
+        fragments.invalidate(fragments.PUBLIC_TWEETS, fragments.PROFILES)
+        self.log(1, "Done in %.1fs." % (time.time() - start))
+
+    def log(self, verbosity, message):
+        if self.verbosity >= verbosity:
+            self.stdout.write(message)
+
+    def create_users(self, count, prefix, password):
+        first = User.objects.filter(username__startswith=prefix).count()
+        names = ['%s%d' % (prefix, i) for i in range(first, first + count)]
+        if User.objects.filter(username__in=names[:1000]).exists():
+            raise CommandError("Users named %s<number> already exist, use another --prefix." % prefix)
+        with transaction.atomic():
+            # the login view compares the password as it is stored
+            User.objects.bulk_create([User(username=name, password=password) for name in names])
+            rows = []
+            for i in range(0, len(names), BATCH_SIZE):
+                rows.extend(User.objects.filter(username__in=names[i:i + BATCH_SIZE]).values_list('id', 'username'))
+            rows.sort()
+            user_ids = [user_id for user_id, _ in rows]
+            self.usernames = [username for _, username in rows]
+            UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in user_ids])
+        self.log(1, "Created %d users, %s to %s." % (count, names[0], names[-1]))
+        return user_ids
+
+    def create_relationships(self, user_ids, popularity, followings, rnd):
+        batch = []
+        total = 0
+        with transaction.atomic():
+            for who in range(len(user_ids)):
+                # the number of followings is skewed too, with the requested mean
+                wanted = min(int(rnd.expovariate(1 / followings)) + 1, len(user_ids) - 1)
+                whoms = set()
+                attempts = 0
+                while len(whoms) < wanted and attempts < wanted * 10:
+                    whom = popularity.sample()
+                    if whom != who:
+                        whoms.add(whom)
+                    attempts += 1
+                batch.extend(Relationship(who_id=user_ids[who], whom_id=user_ids[whom]) for whom in whoms)
+                if len(batch) >= BATCH_SIZE:
+                    Relationship.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            Relationship.objects.bulk_create(batch)
+        total += len(batch)
+        self.log(1, "Created %d relationships." % total)
+
+    def create_tweets(self, user_ids, activity, count, days, rnd):
+        now = timezone.now()
+        hours = Sampler(HOURLY, rnd)
+        dates = []
+        for _ in range(count):
+            day = now - timedelta(days=rnd.randint(0, days - 1))
+            date = day.replace(hour=hours.sample(), minute=rnd.randint(0, 59),
+                               second=rnd.randint(0, 59), microsecond=rnd.randint(0, 999999))
+            dates.append(min(date, now))
+        # ids follow the dates, like tweets posted live
+        dates.sort()
+        created = 0
+        with explicit_created_date():
+            for i in range(0, count, BATCH_SIZE):
+                tweets = []
+                for date in dates[i:i + BATCH_SIZE]:
+                    tweet = Tweet(user_id=user_ids[activity.sample()], created_date=date,
+                                  text=self.make_text(rnd))
+                    # bulk_create sends no pre_save signal
+                    rendering.render_tweet(tweet)
+                    tweets.append(tweet)
+                with transaction.atomic():
+                    last_id = Tweet.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                    Tweet.objects.bulk_create(tweets)
+                    # nor post_save
+                    search.index_tweets(Tweet.objects.filter(id__gt=last_id))
+                created += len(tweets)
+                self.log(2, "Created %d tweets." % created)
+        self.log(1, "Created %d tweets over %d days." % (count, days))
+
+    def make_text(self, rnd):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(3, 15))]
+        if rnd.random() < 0.2:
+            words.append('#' + rnd.choice(WORDS))
+        if rnd.random() < 0.1:
+            words.append('@' + rnd.choice(self.usernames))
+        if rnd.random() < 0.05:
+            words.append('http://example.com/%d' % rnd.randint(1, 1000))
+        return ' '.join(words)
@@ -0,0 +1,34 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from twitter.models import UserProfile
+from twitter.thumbnails import generate
+
+
+class Command(BaseCommand):
+    help = "Generates the thumbnails of the profile pictures that don't have them yet."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='Regenerate the thumbnails of every picture, e.g. after changing the sizes.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        profiles = UserProfile.objects.exclude(picture='')
+        if not options['all']:
+            profiles = profiles.filter(picture_hash='')
+        done = failed = 0
+        for profile in profiles.order_by('pk').iterator():
+            try:
+                ok = generate(profile)
+            except IOError as e:
+                self.stderr.write("Profile %s: %s" % (profile.pk, e))
+                ok = False
+            if ok:
+                done += 1
+            else:
+                failed += 1
+        if verbosity >= 1:
+            self.stdout.write("Generated the thumbnails of %d profiles, %d failed." % (done, failed))
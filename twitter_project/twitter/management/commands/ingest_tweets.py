@@ -0,0 +1,46 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from twitter.ingest import ingest, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ("Creates tweets from newline-delimited JSON files (or stdin), one "
+            "{\"user\": \"name\", \"text\": \"...\"} object per line.")
+    args = '[file file ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size', type='int', default=BATCH_SIZE,
+            help='Number of tweets written per transaction.'),
+    )
+
+    def handle(self, *paths, **options):
+        verbosity = int(options.get('verbosity'))
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        created = errors = 0
+        start = time.time()
+        for path in paths or ['-']:
+            if path == '-':
+                stream = sys.stdin
+            else:
+                stream = open(path, 'rb')
+            try:
+                result = ingest(stream, batch_size=batch_size)
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+            created += result.created
+            errors += len(result.errors)
+            if verbosity >= 2:
+                for error in result.errors:
+                    self.stderr.write("%s:%s: %s" % (path, error["line"], error["error"]))
+        elapsed = time.time() - start
+        if verbosity >= 1:
+            self.stdout.write("Created %d tweets in %.2fs (%d/s), skipped %d invalid lines." % (
+                created, elapsed, created / elapsed if elapsed else 0, errors))
@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from twitter.ratelimit import get_limits, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Reports the number of write requests throttled by each rate limit."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', action='store_true', dest='reset', default=False,
+            help='Reset the counters after reporting them.'),
+    )
+
+    def handle(self, *args, **options):
+        limits = get_limits()
+        self.stdout.write("%-14s %14s %10s" % ('scope', 'limit', 'throttled'))
+        for scope, throttled in sorted(get_stats().items()):
+            burst, period = limits[scope]
+            self.stdout.write("%-14s %14s %10d" % (scope, '%d/%ss' % (burst, period), throttled))
+        if options['reset']:
+            reset_stats()
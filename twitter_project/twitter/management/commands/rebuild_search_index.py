@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from twitter.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of tweets."
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        start = time.time()
+        count = rebuild_index()
+        if verbosity >= 1:
+            self.stdout.write("Indexed %d tweets in %.2fs." % (count, time.time() - start))
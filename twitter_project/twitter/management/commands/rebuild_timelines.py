@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from twitter.timeline import get_timeline_store
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialized home timelines from Relationship and Tweet."
+    args = '[user_id user_id ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--trim-only', action='store_true', dest='trim_only', default=False,
+            help='Only drop entries beyond TIMELINE_MAX_LENGTH, without rebuilding.'),
+    )
+
+    def handle(self, *user_ids, **options):
+        verbosity = int(options.get('verbosity'))
+        store = get_timeline_store()
+        if user_ids:
+            user_ids = [int(user_id) for user_id in user_ids]
+        else:
+            user_ids = User.objects.order_by('id').values_list('id', flat=True)
+
+        count = 0
+        for user_id in user_ids:
+            if not options.get('trim_only'):
+                store.rebuild(user_id)
+            store.trim(user_id)
+            count += 1
+            if verbosity >= 2:
+                self.stdout.write("Rebuilt timeline of user %s" % user_id)
+        if verbosity >= 1:
+            self.stdout.write("Processed %d timelines." % count)
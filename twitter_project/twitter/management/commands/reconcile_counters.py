@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from twitter.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recomputes the tweet, follower and following counters of UserProfile."
+    args = '[user_id user_id ...]'
+
+    def handle(self, *user_ids, **options):
+        verbosity = int(options.get('verbosity'))
+        if user_ids:
+            fixed = reconcile([int(user_id) for user_id in user_ids])
+        else:
+            fixed = reconcile()
+        if verbosity >= 1:
+            self.stdout.write("Fixed the counters of %d profiles." % fixed)
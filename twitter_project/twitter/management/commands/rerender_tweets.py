@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from twitter.rendering import rerender_stale, RENDER_VERSION
+
+
+class Command(BaseCommand):
+    help = "Re-renders the HTML of the tweets rendered by an older version of the renderer."
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        start = time.time()
+        count = rerender_stale()
+        if verbosity >= 1:
+            self.stdout.write("Rendered %d tweets with version %d in %.2fs." % (
+                count, RENDER_VERSION, time.time() - start))
@@ -0,0 +1,49 @@
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from twitter import jobs
+
+
+def work(batch_size, once, sleep):
+    try:
+        jobs.work(batch_size=batch_size, once=once, sleep=sleep)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Runs the jobs queued by twitter.jobs with a pool of worker processes."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', action='store', dest='processes', type='int', default=1,
+            help='Number of worker processes.'),
+        make_option('--batch-size', action='store', dest='batch_size', type='int',
+            default=jobs.BATCH_SIZE, help='Maximum number of jobs of the same task run at once.'),
+        make_option('--sleep', action='store', dest='sleep', type='float', default=1.0,
+            help='Seconds to wait when no job is due.'),
+        make_option('--once', action='store_true', dest='once', default=False,
+            help='Exit once no job is due instead of waiting for more.'),
+    )
+
+    def handle(self, *args, **options):
+        arguments = (options['batch_size'], options['once'], options['sleep'])
+        if options['processes'] == 1:
+            work(*arguments)
+            return
+        # the workers must not share the connections of this process
+        for connection in connections.all():
+            connection.close()
+        workers = [multiprocessing.Process(target=work, args=arguments, name='jobs-%d' % i)
+                   for i in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
@@ -0,0 +1,35 @@
+import shutil
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from twitter.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = ("Copies the SQLite primary database over the SQLite files standing in "
+            "for its replicas in development.")
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity'))
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError("settings.DATABASE_REPLICAS is empty.")
+        for alias in [DEFAULT_DB_ALIAS] + list(replicas):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError("Database %r isn't a SQLite database." % alias)
+            connections[alias].close()
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+        lock = sqlite3.connect(primary)
+        try:
+            # block writers so that the copies are consistent
+            lock.execute('BEGIN IMMEDIATE')
+            for alias in replicas:
+                shutil.copyfile(primary, settings.DATABASES[alias]['NAME'])
+                if verbosity >= 1:
+                    self.stdout.write("Copied %s to %s." % (DEFAULT_DB_ALIAS, alias))
+        finally:
+            lock.rollback()
+            lock.close()
@@ -0,0 +1,148 @@
+"""
+Per-request state: the logged-in user and the database routing.
+
+DwitterUserMiddleware sets ``request.dwitter_user`` to the User (with its
+profile loaded) named by ``request.session["username"]``, or None. The
+result is kept for ``settings.DWITTER_USER_CACHE_TIMEOUT`` seconds in a
+process-local cache keyed by session, so most requests don't query the user
+at all. The instance is shared by the requests of that session: treat it as
+read-only.
+
+Saving the User or UserProfile, and the writes that change the profile
+counters, drop the cached entry in the current process. Each entry also
+records the generation of the user's profile fragments (see
+twitter.fragments) and is only used while it is current, so the changes
+made by other processes, such as the counters moved by the job worker, are
+seen as soon as they invalidate the profile.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from twitter import fragments, routers
+from twitter.graph import request_cache
+from twitter.models import Tweet, Relationship, UserProfile
+
+
+DEFAULT_TIMEOUT = 10
+MAX_ENTRIES = 1000
+
+
+class UserCache(object):
+    """
+    Process-local map of ``(session_key, username)`` to ``(expiry, user,
+    generation)``.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_timeout(self):
+        return getattr(settings, 'DWITTER_USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def get(self, session_key, username):
+        entry = self.entries.get((session_key, username))
+        if entry is None or entry[0] <= time.time():
+            return None
+        expiry, user, generation = entry
+        if fragments.get_generation(fragments.profile_key(user.pk)) != generation:
+            return None
+        return user
+
+    def set(self, session_key, username, user, generation):
+        """
+        cache ``user``, read during ``generation`` of its profile
+        """
+        with self.lock:
+            if len(self.entries) >= MAX_ENTRIES:
+                self.cull()
+            self.entries[session_key, username] = (time.time() + self.get_timeout(), user, generation)
+
+    def cull(self):
+        now = time.time()
+        for key, (expiry, user, generation) in list(self.entries.items()):
+            if expiry <= now:
+                del self.entries[key]
+        if len(self.entries) >= MAX_ENTRIES:
+            self.entries.clear()
+
+    def forget(self, *user_ids):
+        user_ids = set(user_ids)
+        with self.lock:
+            for key, (expiry, user, generation) in list(self.entries.items()):
+                if user.pk in user_ids:
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+def get_dwitter_user(request):
+    """
+    return the logged-in User with its profile, or None
+    """
+    username = request.session.get("username")
+    if username is None:
+        return None
+    session_key = request.session.session_key
+    user = user_cache.get(session_key, username)
+    if user is None:
+        user = User.objects.select_related('profile').filter(username=username).first()
+        if user is None:
+            return None
+        if session_key is not None:
+            user_cache.set(session_key, username, user,
+                           fragments.get_generation(fragments.profile_key(user.pk)))
+    request_cache.remember(user)
+    return user
+
+
+class DwitterUserMiddleware(object):
+    """
+    Set ``request.dwitter_user``; must come after SessionMiddleware.
+    """
+
+    def process_request(self, request):
+        request.dwitter_user = get_dwitter_user(request)
+
+
+@receiver(post_save, sender=User, dispatch_uid='twitter.middleware.user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='twitter.middleware.user_deleted')
+def user_changed(sender, instance, **kwargs):
+    user_cache.forget(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile, dispatch_uid='twitter.middleware.profile_saved')
+@receiver(post_save, sender=Tweet, dispatch_uid='twitter.middleware.tweet_saved')
+@receiver(post_delete, sender=Tweet, dispatch_uid='twitter.middleware.tweet_deleted')
+def profile_changed(sender, instance, **kwargs):
+    user_cache.forget(instance.user_id)
+
+
+@receiver(post_save, sender=Relationship, dispatch_uid='twitter.middleware.relationship_saved')
+@receiver(post_delete, sender=Relationship, dispatch_uid='twitter.middleware.relationship_deleted')
+def relationship_changed(sender, instance, **kwargs):
+    user_cache.forget(instance.who_id, instance.whom_id)
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Let twitter.routers.ReplicaRouter send the reads of the request to the
+    replicas; must come after SessionMiddleware.
+    """
+
+    def process_request(self, request):
+        routers.start_request(request)
+
+    def process_response(self, request, response):
+        routers.state.reset()
+        return response
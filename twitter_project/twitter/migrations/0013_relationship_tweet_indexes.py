@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def remove_duplicate_relationships(apps, schema_editor):
+    """
+    Keep the oldest row of each (who_id, whom_id) pair so the unique
+    constraint can be created.
+    """
+    Relationship = apps.get_model('twitter', 'Relationship')
+    seen = set()
+    duplicates = []
+    for pk, who_id, whom_id in Relationship.objects.order_by('id').values_list('id', 'who_id', 'whom_id'):
+        if (who_id, whom_id) in seen:
+            duplicates.append(pk)
+        seen.add((who_id, whom_id))
+    for i in range(0, len(duplicates), 500):
+        Relationship.objects.filter(id__in=duplicates[i:i + 500]).delete()
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Count the tweets, followings and followers of every user, once the
+    duplicate relationships are gone so they aren't counted.
+    """
+    UserProfile = apps.get_model('twitter', 'UserProfile')
+    Tweet = apps.get_model('twitter', 'Tweet')
+    Relationship = apps.get_model('twitter', 'Relationship')
+    counts = {}
+    for field, rows in (
+            ('tweet_count', Tweet.objects.values_list('user_id').annotate(n=Count('id')).order_by()),
+            ('following_count', Relationship.objects.values_list('who_id').annotate(n=Count('id')).order_by()),
+            ('follower_count', Relationship.objects.values_list('whom_id').annotate(n=Count('id')).order_by())):
+        for user_id, n in rows:
+            counts.setdefault(user_id, {})[field] = n
+    # the counters of the other users are still 0
+    for user_id, fields in counts.items():
+        UserProfile.objects.filter(user_id=user_id).update(**fields)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter', '0012_userprofile_counters'),
+    ]
+
+    operations = [
+        # unapplying keeps the rows removed and the counters filled
+        migrations.RunPython(remove_duplicate_relationships, noop),
+        migrations.RunPython(fill_counters, noop),
+        migrations.AlterUniqueTogether(
+            name='relationship',
+            unique_together=set([('who_id', 'whom_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='relationship',
+            index_together=set([('whom_id', 'who_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together=set([('user', 'created_date')]),
+        ),
+    ]
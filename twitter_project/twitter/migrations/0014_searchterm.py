@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+
+from django.db import models, migrations
+
+
+# the tokenizer of twitter.search when the index was created; later changes
+# to it are applied with the rebuild_search_index command
+TOKEN_RE = re.compile(r'[#@]?\w+\*?', re.UNICODE)
+TERM_MAX_LENGTH = 100
+
+
+def tokenize(text):
+    terms = set()
+    for token in TOKEN_RE.findall(text.lower()):
+        token = token.rstrip('*')
+        if len(token) > TERM_MAX_LENGTH:
+            continue
+        terms.add(token)
+        if token[0] in '#@' and len(token) > 1:
+            terms.add(token[1:])
+    return terms
+
+
+def build_index(apps, schema_editor):
+    Tweet = apps.get_model('twitter', 'Tweet')
+    SearchTerm = apps.get_model('twitter', 'SearchTerm')
+    last_id = 0
+    while True:
+        rows = list(Tweet.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'text')[:2000])
+        if not rows:
+            return
+        SearchTerm.objects.bulk_create([
+            SearchTerm(term=term, tweet_id=tweet_id)
+            for tweet_id, text in rows for term in tokenize(text)
+        ])
+        last_id = rows[-1][0]
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter', '0013_relationship_tweet_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('term', models.CharField(max_length=100)),
+                ('tweet', models.ForeignKey(to='twitter.Tweet', to_field='id')),
+            ],
+            options={
+                'unique_together': set([('term', 'tweet')]),
+            },
+            bases=(models.Model,),
+        ),
+        # the table is dropped when unapplying
+        migrations.RunPython(build_index, noop),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+import textwrap
+
+from django.db import models, migrations
+from django.utils.html import escape
+from django.utils.http import urlquote
+
+
+# version 1 of twitter.rendering.render(); tweets rendered by a later version
+# are re-rendered when shown or by the rerender_tweets command
+RENDER_VERSION = 1
+LINE_LENGTH = 70
+
+ENTITY_RE = re.compile(r'(?P<url>https?://[^\s<>"]+)|(?P<mention>@\w+)|(?P<hashtag>#\w+)', re.UNICODE)
+
+
+def _link(match):
+    value = match.group(0)
+    if match.group('url'):
+        return '<a href="{0}" rel="nofollow">{0}</a>'.format(escape(value))
+    if match.group('mention'):
+        return '<a href="/tweets/{0}">{1}</a>'.format(urlquote(value[1:]), escape(value))
+    return '<a href="/search?q={0}">{1}</a>'.format(urlquote(value), escape(value))
+
+
+def linkify(line):
+    res = []
+    position = 0
+    for match in ENTITY_RE.finditer(line):
+        res.append(escape(line[position:match.start()]))
+        res.append(_link(match))
+        position = match.end()
+    res.append(escape(line[position:]))
+    return ''.join(res)
+
+
+def render(text):
+    lines = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, LINE_LENGTH,
+                                   break_long_words=False, break_on_hyphens=False) or [''])
+    return '<br>'.join(linkify(line) for line in lines)
+
+
+def render_tweets(apps, schema_editor):
+    Tweet = apps.get_model('twitter', 'Tweet')
+    for tweet in Tweet.objects.only('id', 'text').iterator():
+        Tweet.objects.filter(pk=tweet.pk).update(rendered_text=render(tweet.text), render_version=RENDER_VERSION)
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter', '0014_searchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='rendered_text',
+            field=models.TextField(default='', editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='render_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        # the columns are dropped when unapplying
+        migrations.RunPython(render_tweets, noop),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twitter', '0015_tweet_rendered_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_hash',
+            # the default fills the existing rows
+            field=models.CharField(default='', max_length=40, editable=False, blank=True),
+            preserve_default=False,
+        ),
+    ]
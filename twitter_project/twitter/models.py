@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from django.template.defaultfilters import stringfilter
 from django.db import models
+from django.utils import timezone
+from django.utils.safestring import mark_safe
 from django.shortcuts import render, redirect
 from django.contrib.sessions.backends.db import SessionStore
 
@@ -9,17 +11,20 @@ from django.contrib.sessions.backends.db import SessionStore
 class UserProfile(models.Model):
     user = models.OneToOneField(User,related_name='profile')
     picture = models.ImageField(upload_to="pictures", blank=True)
+    # content hash naming the thumbnails of picture, see twitter.thumbnails
+    picture_hash = models.CharField(max_length=40, blank=True, editable=False)
     desc = models.TextField(blank=True)
+    # denormalized counters, maintained by twitter.counters
+    tweet_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def followers(self):
         """
         return user's all followers
         """
-        follower_ids = [follower.who_id for follower in Relationship.objects.filter(whom_id = self.user.id).all()]
-        res = []
-        for follower_id in follower_ids:
-            res.append(User.objects.get(id = follower_id))
-        return res
+        from twitter import graph
+        return graph.followers(self.user_id)
 
 
     @property
@@ -32,11 +37,8 @@ class UserProfile(models.Model):
         return all following users
         """
 
-        following_ids = [following.whom_id for following in Relationship.objects.filter(who_id = self.user.id).all()]
-        res = []
-        for following_id in following_ids:
-            res.append(User.objects.get(id = following_id))
-        return res
+        from twitter import graph
+        return graph.followings(self.user_id)
 
 
 class Tweet(models.Model):
@@ -44,28 +46,90 @@ class Tweet(models.Model):
     text = models.TextField(blank=False, default="")
     created_date = models.DateTimeField(auto_now=True)
 
+    # HTML of text, see twitter.rendering
+    rendered_text = models.TextField(blank=True, default="", editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        # user timelines: WHERE user_id = ? ORDER BY created_date DESC
+        index_together = (('user', 'created_date'),)
+
     @property
     def pretty_text(self):
         """
+        return the text as wrapped HTML with its links, rendered when the
+        tweet was saved
         """
-        len_char_line = 70
-        lines= len(self.text) % len_char_line
-        total = ""
-        for i in range(0,lines):
-            try:
-                total += self.text[i*len_char_line:(i+1)*len_char_line]
-                total += "\n"
-            except:
-                pass
-
-
-        return  total
+        from twitter import rendering
+        return mark_safe(rendering.pretty_text(self))
 
 class Relationship(models.Model):
     who_id = models.IntegerField()
     whom_id  = models.IntegerField()
 
+    class Meta:
+        # (who_id, whom_id) answers "does A follow B" and followings,
+        # (whom_id, who_id) answers followers.
+        unique_together = (('who_id', 'whom_id'),)
+        index_together = (('whom_id', 'who_id'),)
+
     def __str__(self):
         return str("<who_id: {}, whom_id: {}>".format(self.who_id,self.whom_id))
 
 
+class TimelineEntry(models.Model):
+    """
+    One tweet in a user's materialized home timeline.
+    """
+    user = models.ForeignKey(User, related_name='timeline_entries')
+    tweet = models.ForeignKey(Tweet, related_name='+')
+
+    class Meta:
+        unique_together = (('user', 'tweet'),)
+
+    def __str__(self):
+        return str("<user_id: {}, tweet_id: {}>".format(self.user_id,self.tweet_id))
+
+
+
+
+class SearchTerm(models.Model):
+    """
+    One row of the inverted index used by twitter.search: ``tweet``
+    contains ``term``.
+    """
+    term = models.CharField(max_length=100)
+    tweet = models.ForeignKey(Tweet, related_name='+')
+
+    class Meta:
+        # (term, tweet_id) answers exact and prefix lookups with a range scan
+        unique_together = (('term', 'tweet'),)
+
+    def __str__(self):
+        return str("<term: {}, tweet_id: {}>".format(self.term,self.tweet_id))
+
+
+class Job(models.Model):
+    """
+    A pending call of a task registered with twitter.jobs, run by the
+    run_jobs command. Done jobs are deleted.
+    """
+    name = models.CharField(max_length=100)
+    # JSON object passed to the task
+    payload = models.TextField(default="{}")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # the worker running the job, until locked_until
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    # set once the job has used up its attempts
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # due jobs: WHERE failed = 0 AND run_at <= now ORDER BY run_at
+        index_together = (('failed', 'run_at'),)
+
+    def __str__(self):
+        return str("<name: {}, run_at: {}, attempts: {}>".format(self.name,self.run_at,self.attempts))
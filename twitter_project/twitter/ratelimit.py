@@ -0,0 +1,160 @@
+"""
+Per-user rate limits of the write endpoints.
+
+Each limit is a token bucket: a client may make ``burst`` requests at once,
+then one every ``period / burst`` seconds. ``settings.RATE_LIMITS`` maps a
+scope to ``(burst, period)``; RateLimitMiddleware applies the limit of
+the URL name of the view to its POST, PUT, PATCH and DELETE requests, and
+the ``ratelimit`` decorator applies the limit of any scope to a view.
+Clients are identified by the logged-in user, or by their IP address.
+Rejected requests get a 429 response before the view runs.
+
+The bucket is stored in the cache as its "theoretical arrival time": the
+time at which it will be full again, in milliseconds. A request moves it
+forward by one interval with an atomic ``incr()``; it is rejected, and the
+move undone, if that puts it more than ``burst`` intervals ahead of now.
+Concurrent requests finding an expired bucket may each reset it, which
+can let a few more requests through but never rejects too many.
+
+The requests throttled are counted per scope, see ``get_stats()`` and the
+ratelimit_stats command. Use a cache shared by all the processes, e.g.
+memcached, for the limits to be global.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit:'
+STATS_PREFIX = 'ratelimit-stats:'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# incr() keeps the expiry of a key; a bucket found refilled is reset
+# anyway, the expiry only frees the memory of idle clients
+KEY_TIMEOUT = 24 * 60 * 60
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def get_limits():
+    return getattr(settings, 'RATE_LIMITS', {})
+
+
+def get_client(request):
+    user = getattr(request, 'dwitter_user', None)
+    if user is not None:
+        return 'user:{}'.format(user.pk)
+    return 'ip:{}'.format(request.META.get('REMOTE_ADDR'))
+
+
+def hit(key, burst, period, now=None):
+    """
+    take a token from the bucket ``key``; return 0 if there was one, or
+    the number of seconds until there is one
+    """
+    cache = get_cache()
+    if now is None:
+        now = time.time()
+    now_ms = int(now * 1000)
+    interval = max(int(period * 1000 / burst), 1)
+    # a new bucket is full: it was full at now
+    cache.add(key, now_ms, KEY_TIMEOUT)
+    try:
+        arrival = cache.incr(key, interval)
+    except ValueError:
+        # expired in between
+        cache.add(key, now_ms + interval, KEY_TIMEOUT)
+        return 0
+    if arrival <= now_ms + interval:
+        # the bucket had refilled: start again from now
+        cache.set(key, now_ms + interval, KEY_TIMEOUT)
+        return 0
+    if arrival - now_ms > burst * interval:
+        try:
+            cache.decr(key, interval)
+        except ValueError:
+            pass
+        return (arrival - now_ms - burst * interval) / 1000.0
+    return 0
+
+
+def check(request, scope, burst, period):
+    """
+    return a 429 response if ``request`` exceeds the limit of ``scope``,
+    or None
+    """
+    key = '{}{}:{}'.format(KEY_PREFIX, scope, get_client(request))
+    wait = hit(key, burst, period)
+    if not wait:
+        return None
+    _incr_throttled(scope)
+    logger.info("Throttled %s of %s for %.1fs.", scope, get_client(request), wait)
+    response = HttpResponse("Too many requests, try again later.", status=429, content_type='text/plain')
+    response['Retry-After'] = int(math.ceil(wait))
+    return response
+
+
+def ratelimit(scope, methods=WRITE_METHODS):
+    """
+    limit the ``methods`` requests of the decorated view to
+    ``settings.RATE_LIMITS[scope]``; views without a limit aren't limited
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = get_limits().get(scope)
+            if limit is not None and request.method in methods:
+                response = check(request, scope, *limit)
+                if response is not None:
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware(object):
+    """
+    Applies the limit named by the URL name of the view to its writes. Must
+    come after DwitterUserMiddleware.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in WRITE_METHODS:
+            return None
+        match = getattr(request, 'resolver_match', None)
+        limit = get_limits().get(match.url_name) if match is not None else None
+        if limit is None:
+            return None
+        return check(request, match.url_name, *limit)
+
+
+def _incr_throttled(scope):
+    cache = get_cache()
+    key = '{}{}'.format(STATS_PREFIX, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_stats():
+    """
+    return ``{scope: number of requests throttled}`` for the scopes of
+    ``settings.RATE_LIMITS``
+    """
+    keys = dict(('{}{}'.format(STATS_PREFIX, scope), scope) for scope in get_limits())
+    values = get_cache().get_many(list(keys))
+    return dict((scope, values.get(key, 0)) for key, scope in keys.items())
+
+
+def reset_stats():
+    get_cache().delete_many(['{}{}'.format(STATS_PREFIX, scope) for scope in get_limits()])
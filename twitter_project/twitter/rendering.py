@@ -0,0 +1,128 @@
+"""
+Tweet text rendering.
+
+The HTML shown for a tweet (wrapped lines, links for URLs, @mentions and
+#hashtags) is computed once when the tweet is written and stored in
+Tweet.rendered_text along with the RENDER_VERSION that produced it.
+
+Bump RENDER_VERSION whenever ``render()`` changes. Tweets rendered by an
+older version are rendered on the fly when displayed and queued; the queue
+is written back once the response has been sent (see ``flush()``), and the
+rerender_tweets command re-renders everything in bulk.
+"""
+import re
+import textwrap
+from threading import local
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.http import urlquote
+
+from twitter.models import Tweet
+
+
+RENDER_VERSION = 1
+LINE_LENGTH = 70
+
+ENTITY_RE = re.compile(r'(?P<url>https?://[^\s<>"]+)|(?P<mention>@\w+)|(?P<hashtag>#\w+)', re.UNICODE)
+
+
+def _link(match):
+    value = match.group(0)
+    if match.group('url'):
+        return '<a href="{0}" rel="nofollow">{0}</a>'.format(escape(value))
+    if match.group('mention'):
+        return '<a href="/tweets/{0}">{1}</a>'.format(urlquote(value[1:]), escape(value))
+    return '<a href="/search?q={0}">{1}</a>'.format(urlquote(value), escape(value))
+
+
+def linkify(line):
+    """
+    escape ``line`` and turn its URLs, mentions and hashtags into links
+    """
+    res = []
+    position = 0
+    for match in ENTITY_RE.finditer(line):
+        res.append(escape(line[position:match.start()]))
+        res.append(_link(match))
+        position = match.end()
+    res.append(escape(line[position:]))
+    return ''.join(res)
+
+
+def render(text):
+    """
+    return the HTML of ``text``: lines wrapped at LINE_LENGTH characters
+    (without splitting words such as URLs) joined by <br>
+    """
+    lines = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, LINE_LENGTH,
+                                   break_long_words=False, break_on_hyphens=False) or [''])
+    return '<br>'.join(linkify(line) for line in lines)
+
+
+def render_tweet(tweet):
+    tweet.rendered_text = render(tweet.text)
+    tweet.render_version = RENDER_VERSION
+
+
+@receiver(pre_save, sender=Tweet, dispatch_uid='twitter.rendering.tweet_saving')
+def tweet_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        render_tweet(instance)
+
+
+class StaleTweets(local):
+    """
+    Per-thread queue of the tweets rendered by an older RENDER_VERSION and
+    displayed during the current request.
+    """
+
+    def __init__(self):
+        self.tweets = {}
+
+    def add(self, tweet):
+        self.tweets[tweet.pk] = tweet
+
+    def flush(self, **kwargs):
+        tweets, self.tweets = self.tweets, {}
+        for tweet in tweets.values():
+            # update() rather than save(): leave created_date untouched
+            Tweet.objects.filter(pk=tweet.pk, text=tweet.text).update(
+                rendered_text=tweet.rendered_text, render_version=tweet.render_version)
+
+
+stale_tweets = StaleTweets()
+request_finished.connect(stale_tweets.flush)
+
+
+def pretty_text(tweet):
+    """
+    return the stored HTML of ``tweet``, re-rendering it if it is stale
+    """
+    if tweet.render_version != RENDER_VERSION:
+        render_tweet(tweet)
+        if tweet.pk is not None:
+            stale_tweets.add(tweet)
+    return tweet.rendered_text
+
+
+def rerender_stale(chunk_size=1000):
+    """
+    re-render every stale tweet; return how many were updated
+    """
+    count = 0
+    while True:
+        tweets = list(Tweet.objects.exclude(render_version=RENDER_VERSION)
+                      .only('id', 'text')[:chunk_size])
+        if not tweets:
+            return count
+        with transaction.atomic():
+            for tweet in tweets:
+                Tweet.objects.filter(pk=tweet.pk).update(
+                    rendered_text=render(tweet.text), render_version=RENDER_VERSION)
+        count += len(tweets)
@@ -0,0 +1,125 @@
+"""
+Read/write splitting between the primary database and its replicas.
+
+ReplicaRouter sends the reads of the timeline, profile and relationship
+models made while serving a request to one of the aliases listed in
+``settings.DATABASE_REPLICAS``, chosen at random for each query; everything
+else (writes, reads inside a transaction, management commands and job
+workers) goes to ``default``.
+
+Replicas lag behind the primary, so a user who just wrote would not see
+their own tweet or follow on the next page. ``pin_to_primary()`` stores a
+marker in the session that makes ReplicaRoutingMiddleware send that user's
+reads to the primary for ``settings.DATABASE_REPLICA_LAG`` seconds.
+
+Data computed from replica reads and cached must allow for the lag too:
+see ``read_from_primary()``.
+
+Locally, replicas can be SQLite files refreshed from the primary with the
+sync_replicas command.
+"""
+import random
+import time
+from contextlib import contextmanager
+from threading import local
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+PIN_SESSION_KEY = 'db_primary_until'
+DEFAULT_REPLICA_LAG = 5
+
+# lowercase model names of the twitter app read from replicas
+REPLICATED_MODELS = ('tweet', 'timelineentry', 'userprofile', 'relationship')
+
+
+class RoutingState(local):
+    """
+    Per-thread flags of the request being served.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, **kwargs):
+        self.use_replicas = False
+        self.pinned = False
+
+
+state = RoutingState()
+request_finished.connect(state.reset)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def start_request(request):
+    """
+    allow replica reads for the current request unless its session is
+    pinned to the primary
+    """
+    until = request.session.get(PIN_SESSION_KEY)
+    state.use_replicas = True
+    state.pinned = until is not None and until > time.time()
+
+
+def pin_to_primary(request):
+    """
+    read from the primary for the rest of this request and for the next
+    ones of the same session, until the replicas have caught up
+    """
+    request.session[PIN_SESSION_KEY] = time.time() + get_replica_lag()
+    state.pinned = True
+
+
+def get_replica_lag():
+    return getattr(settings, 'DATABASE_REPLICA_LAG', DEFAULT_REPLICA_LAG)
+
+
+def reads_from_replicas():
+    """
+    return whether the reads of the current thread may go to a replica
+    """
+    return bool(get_replicas()) and state.use_replicas and not state.pinned
+
+
+@contextmanager
+def read_from_primary():
+    """
+    send the reads of the block to the primary, e.g. to compute something
+    that will be cached
+    """
+    pinned, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'twitter' or model._meta.model_name not in REPLICATED_MODELS:
+            return None
+        if not reads_from_replicas() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # a transaction reads what it is about to write from
+            return DEFAULT_DB_ALIAS
+        return random.choice(get_replicas())
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set([DEFAULT_DB_ALIAS] + list(get_replicas()))
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, model):
+        # replicas get their schema from the primary
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,175 @@
+"""
+Full-text search over Tweet.text.
+
+Tweets are tokenized into lowercase terms stored in the SearchTerm table,
+an inverted index kept up to date by the post_save/post_delete receivers
+below (saved tweets are indexed by a job; bulk writers call
+``index_tweets()`` themselves, as bulk_create sends no signals). Besides plain words, ``#hashtag`` and ``@mention`` tokens are
+indexed with their prefix so they can be searched for exactly.
+
+A query is a list of terms that must all match; a term ending with ``*``
+matches every term starting with it. Results are ranked newest first and
+paginated with cursors on the tweet id, so every page is a handful of index
+range scans whatever the size of the index.
+"""
+import re
+
+from django.core.paginator import CursorPaginator
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from twitter import jobs
+from twitter.models import Tweet, SearchTerm
+
+
+TOKEN_RE = re.compile(r'[#@]?\w+\*?', re.UNICODE)
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+MAX_QUERY_TERMS = 10
+
+
+def tokenize(text):
+    """
+    return the set of terms indexed for ``text``; "#django" yields both
+    "#django" and "django"
+    """
+    terms = set()
+    for token in TOKEN_RE.findall(text.lower()):
+        token = token.rstrip('*')
+        if len(token) > TERM_MAX_LENGTH:
+            continue
+        terms.add(token)
+        if token[0] in '#@' and len(token) > 1:
+            terms.add(token[1:])
+    return terms
+
+
+def index_tweets(tweets):
+    """
+    (re)index ``tweets``, which must have their primary key set
+    """
+    tweets = [tweet for tweet in tweets if tweet.pk is not None]
+    if not tweets:
+        return
+    with transaction.atomic():
+        SearchTerm.objects.filter(tweet_id__in=[tweet.pk for tweet in tweets]).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(term=term, tweet_id=tweet.pk)
+            for tweet in tweets for term in tokenize(tweet.text)
+        ])
+
+
+def rebuild_index(chunk_size=2000):
+    """
+    rebuild the whole index, reading tweets by chunks of ``chunk_size``;
+    return the number of tweets indexed
+    """
+    SearchTerm.objects.all().delete()
+    count = 0
+    last_id = 0
+    while True:
+        rows = list(Tweet.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', 'text')[:chunk_size])
+        if not rows:
+            return count
+        with transaction.atomic():
+            SearchTerm.objects.bulk_create([
+                SearchTerm(term=term, tweet_id=tweet_id)
+                for tweet_id, text in rows for term in tokenize(text)
+            ])
+        count += len(rows)
+        last_id = rows[-1][0]
+
+
+def unindex_tweets(tweet_ids):
+    SearchTerm.objects.filter(tweet_id__in=list(tweet_ids)).delete()
+
+
+@receiver(post_save, sender=Tweet, dispatch_uid='twitter.search.tweet_saved')
+def tweet_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        # see twitter.tasks.index_tweets
+        jobs.enqueue('index_tweets', tweet_id=instance.pk)
+
+
+@receiver(post_delete, sender=Tweet, dispatch_uid='twitter.search.tweet_deleted')
+def tweet_deleted(sender, instance, **kwargs):
+    # the rows are usually gone already through the cascade
+    unindex_tweets([instance.pk])
+
+
+def parse_query(query):
+    """
+    return the list of ``(term, is_prefix)`` pairs of ``query``
+    """
+    res = []
+    for token in TOKEN_RE.findall(query.lower())[:MAX_QUERY_TERMS]:
+        is_prefix = token.endswith('*')
+        token = token.rstrip('*')
+        res.append((token[:TERM_MAX_LENGTH], is_prefix))
+    return res
+
+
+def term_filter(term, is_prefix):
+    if is_prefix:
+        # a range instead of LIKE so the (term, tweet_id) index is used
+        return {'term__gte': term, 'term__lt': term + u'\uffff'}
+    return {'term': term}
+
+
+def matching_tweet_ids(terms, max_id=None, since_id=None):
+    """
+    return a QuerySet of the ids of the tweets matching every one of
+    ``terms`` (lower than ``max_id``, greater than ``since_id``), newest first.
+
+    The first term drives an ordered scan of the (term, tweet_id) index, so
+    fetching a page stops after the page is full instead of collecting every
+    match first.
+    """
+    (term, is_prefix), others = terms[0], terms[1:]
+    matches = SearchTerm.objects.filter(**term_filter(term, is_prefix))
+    if max_id is not None:
+        matches = matches.filter(tweet_id__lt=max_id)
+    if since_id is not None:
+        matches = matches.filter(tweet_id__gt=since_id)
+    for term, is_prefix in others:
+        matches = matches.filter(
+            tweet_id__in=SearchTerm.objects.filter(**term_filter(term, is_prefix)).values('tweet_id'))
+    if terms[0][1]:
+        # a prefix may match several terms of the same tweet
+        matches = matches.distinct()
+    return matches.order_by('-tweet_id').values_list('tweet_id', flat=True)
+
+
+def search(query):
+    """
+    return a QuerySet of the tweets matching every term of ``query``, newest
+    first
+    """
+    terms = parse_query(query)
+    if not terms:
+        return Tweet.objects.none()
+    return Tweet.objects.filter(id__in=matching_tweet_ids(terms)).order_by('-id')
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Cursor pagination over the results of ``query``, newest first, reading
+    one page of ids from the index at a time.
+    """
+
+    def __init__(self, query, per_page):
+        super(SearchPaginator, self).__init__(search(query), per_page, ordering=('-id',))
+        self.terms = parse_query(query)
+
+    def get_objects(self, position, backwards, limit):
+        if not self.terms:
+            return []
+        if backwards:
+            tweet_ids = matching_tweet_ids(self.terms, since_id=position[0]).reverse()
+        else:
+            max_id = position[0] if position is not None else None
+            tweet_ids = matching_tweet_ids(self.terms, max_id=max_id)
+        tweet_ids = list(tweet_ids[:limit])
+        tweets = Tweet.objects.select_related('user__profile').in_bulk(tweet_ids)
+        return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
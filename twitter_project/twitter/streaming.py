@@ -0,0 +1,253 @@
+"""
+Live timeline updates as Server-Sent Events.
+
+new_tweet and ingest ``publish()`` each tweet to the in-process Broker,
+serialized once as an SSE message. Every connected stream is a Subscriber registered
+under the authors it wants (the users followed, or everybody for the
+public timeline); publishing appends the message to the queues of the
+matching subscribers and wakes only them. An idle connection thus costs a
+blocked thread (or greenlet) and no database access: its connection is
+closed while it waits. A single ticker thread wakes all of them every
+KEEPALIVE seconds to send a comment that keeps proxies from closing them.
+
+A client reconnecting with the ``Last-Event-ID`` header (or ``?since_id=``)
+first gets the tweets it missed, read from the database, then the live
+ones. Streams end after STREAM_DURATION seconds and browsers reconnect on
+their own, which bounds how long a thread is held.
+
+Each open stream holds a thread of the pool that also serves the pages, so
+a process serves at most ``settings.STREAMING_MAX_STREAMS`` streams at
+once and answers the others with a 503; stream.js then tries again later
+with ``?since_id=``, which polls until a stream is free.
+
+The broker only sees the tweets posted through the process it lives in:
+run a single process with many threads (see gunicorn.conf.py).
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import formats, timezone
+
+from twitter import graph, thumbnails
+from twitter.models import Tweet
+from twitter.timeline import get_timeline_store
+
+
+STREAM_DURATION = 5 * 60
+KEEPALIVE = 15
+BACKLOG = 50
+# messages kept for a subscriber that doesn't read them
+MAX_PENDING = 100
+# tell browsers when to reconnect, in milliseconds
+RETRY = 3000
+DEFAULT_MAX_STREAMS = 100
+
+
+class Subscriber(object):
+    """
+    The queue of the messages for one stream.
+    """
+
+    def __init__(self, author_ids=None):
+        # None: every author
+        self.author_ids = author_ids
+        self.messages = deque(maxlen=MAX_PENDING)
+        self.event = threading.Event()
+
+    def put(self, tweet_id, message):
+        self.messages.append((tweet_id, message))
+        self.event.set()
+
+    def wake(self):
+        self.event.set()
+
+    def get(self):
+        """
+        wait for the ``(tweet_id, message)`` pairs published since the last
+        call and return them; the list is empty when woken by a keepalive
+        tick
+        """
+        # waiting without a timeout: Python 2 would poll the lock
+        self.event.wait()
+        self.event.clear()
+        res = []
+        while self.messages:
+            res.append(self.messages.popleft())
+        return res
+
+
+class Broker(object):
+
+    def __init__(self, keepalive=KEEPALIVE):
+        self.lock = threading.Lock()
+        self.by_author = defaultdict(set)
+        self.everyone = set()
+        self.keepalive = keepalive
+        self.ticker = None
+
+    def subscribe(self, author_ids=None, limit=None):
+        """
+        return a new Subscriber to the tweets of ``author_ids``, or None if
+        there are already ``limit`` subscribers
+        """
+        subscriber = Subscriber(author_ids)
+        with self.lock:
+            if limit is not None and len(self.everyone.union(*self.by_author.values())) >= limit:
+                return None
+            if self.ticker is None:
+                self.ticker = threading.Thread(target=self.tick_forever, name='streaming-ticker')
+                self.ticker.daemon = True
+                self.ticker.start()
+            if author_ids is None:
+                self.everyone.add(subscriber)
+            for author_id in author_ids or ():
+                self.by_author[author_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.everyone.discard(subscriber)
+            for author_id in subscriber.author_ids or ():
+                subscribers = self.by_author.get(author_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self.by_author[author_id]
+
+    def publish(self, tweet_id, author_id, message):
+        with self.lock:
+            subscribers = self.everyone | self.by_author.get(author_id, set())
+        for subscriber in subscribers:
+            subscriber.put(tweet_id, message)
+
+    def subscribers(self):
+        with self.lock:
+            return self.everyone.union(*self.by_author.values())
+
+    def count(self):
+        return len(self.subscribers())
+
+    def tick(self):
+        """
+        wake every subscriber, to send keepalives and end expired streams
+        """
+        for subscriber in self.subscribers():
+            subscriber.wake()
+
+    def tick_forever(self):
+        # one thread for all the streams rather than one timeout each
+        while True:
+            time.sleep(self.keepalive)
+            self.tick()
+
+
+broker = Broker()
+
+
+def tweet_data(tweet):
+    return {
+        "id": tweet.id,
+        "user": tweet.user.username,
+        "picture": thumbnails.thumbnail_url(tweet.user.profile, "small"),
+        "html": tweet.pretty_text,
+        "created_date": formats.localize(timezone.template_localtime(tweet.created_date)),
+    }
+
+
+def format_message(tweet):
+    return "id: {}\nevent: tweet\ndata: {}\n\n".format(tweet.id, json.dumps(tweet_data(tweet)))
+
+
+def get_max_streams():
+    return getattr(settings, 'STREAMING_MAX_STREAMS', DEFAULT_MAX_STREAMS)
+
+
+def publish(tweet):
+    """
+    send ``tweet`` to the streams of its author's followers and to the
+    public streams of this process
+    """
+    broker.publish(tweet.id, tweet.user_id, format_message(tweet))
+
+
+def publish_many(tweets):
+    """
+    publish ``tweets``, e.g. a batch written with bulk_create, oldest first
+    as streams skip ids lower than the last one they sent
+    """
+    if not broker.count():
+        return
+    authors = User.objects.select_related('profile').in_bulk(set(tweet.user_id for tweet in tweets))
+    for tweet in sorted(tweets, key=lambda tweet: tweet.id):
+        tweet.user = authors[tweet.user_id]
+        publish(tweet)
+
+
+def backlog(user_id, since_id):
+    """
+    return the tweets after ``since_id`` of ``user_id``'s home timeline (of
+    the public one if ``user_id`` is None), oldest first
+    """
+    tweets = Tweet.objects.select_related('user__profile')
+    if user_id is None:
+        return list(tweets.filter(id__gt=since_id).order_by('id')[:BACKLOG])
+    tweet_ids = get_timeline_store().get_tweet_ids_after(user_id, since_id, BACKLOG)
+    tweets = tweets.in_bulk(tweet_ids)
+    return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
+
+class Stream(object):
+    """
+    The iterable of the SSE messages of one response; ``close()``, called
+    by the server even if the response was never iterated, unsubscribes.
+    """
+
+    def __init__(self, subscriber, user_id, since_id, duration):
+        self.subscriber = subscriber
+        self.user_id = user_id
+        self.since_id = since_id
+        self.duration = duration
+
+    def __iter__(self):
+        try:
+            yield "retry: {}\n\n".format(RETRY)
+            last_id = self.since_id or 0
+            if self.since_id is not None:
+                for tweet in backlog(self.user_id, self.since_id):
+                    yield format_message(tweet)
+                    last_id = tweet.id
+            # don't hold a database connection while idle
+            connection.close()
+            deadline = time.time() + self.duration
+            while time.time() < deadline:
+                messages = self.subscriber.get()
+                if not messages:
+                    yield ": keepalive\n\n"
+                for tweet_id, message in messages:
+                    if tweet_id > last_id:
+                        yield message
+                        last_id = tweet_id
+        finally:
+            self.close()
+
+    def close(self):
+        broker.unsubscribe(self.subscriber)
+
+
+def stream(user_id=None, since_id=None, duration=STREAM_DURATION):
+    """
+    return the Stream of the SSE messages of the home timeline of
+    ``user_id`` (of the public timeline if None), or None if this process
+    already serves ``settings.STREAMING_MAX_STREAMS`` streams
+    """
+    author_ids = None if user_id is None else set(graph.following_ids(user_id))
+    # subscribe before reading the backlog so that nothing falls in between
+    subscriber = broker.subscribe(author_ids, limit=get_max_streams())
+    if subscriber is None:
+        return None
+    return Stream(subscriber, user_id, since_id, duration)
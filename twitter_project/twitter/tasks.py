@@ -0,0 +1,76 @@
+"""
+The tasks run by twitter.jobs after a write.
+
+A task and the deletion of its jobs commit together, so the counter
+deltas they apply are applied once. Timelines are brought in line with the
+current state of the database rather than with the change described by the
+job, so their order doesn't matter. Cached fragments are invalidated after the
+task has committed, so that a page rendered in between can't be cached
+under the new generation with the old rows.
+"""
+from collections import defaultdict
+
+from twitter import counters, fragments, jobs, search, thumbnails
+from twitter.models import Tweet, Relationship
+from twitter.timeline import get_timeline_store
+
+
+@jobs.task('tweet_posted')
+def tweet_posted(payloads):
+    """
+    fan the tweets out to the home timelines of their authors' followers
+    and update their authors' counters
+    """
+    tweets = list(Tweet.objects.in_bulk([payload['tweet_id'] for payload in payloads]).values())
+    if tweets:
+        get_timeline_store().add_tweets(tweets)
+        # the home timelines changed after the post_save invalidation
+        jobs.after_commit(fragments.tweets_changed, tweets)
+    counts = defaultdict(int)
+    for payload in payloads:
+        counts[payload['user_id']] += 1
+    counters.tweets_posted(counts)
+
+
+@jobs.task('relationship_changed')
+def relationship_changed(payloads):
+    """
+    bring the home timeline of the follower in line with whether the
+    relationship exists now, and move the counters of both users
+    """
+    store = get_timeline_store()
+    pairs = set((payload['who_id'], payload['whom_id']) for payload in payloads)
+    existing = set(Relationship.objects.filter(who_id__in=[who_id for who_id, _ in pairs])
+                   .values_list('who_id', 'whom_id'))
+    for who_id, whom_id in pairs:
+        if (who_id, whom_id) in existing:
+            store.follow(who_id, whom_id)
+        else:
+            store.unfollow(who_id, whom_id)
+    user_ids = set(user_id for pair in pairs for user_id in pair)
+    unknown = set()
+    for payload in payloads:
+        if 'followed' not in payload:
+            # queued before the payload said what changed
+            unknown.update([payload['who_id'], payload['whom_id']])
+        elif payload['followed']:
+            counters.followed(payload['who_id'], payload['whom_id'])
+        else:
+            counters.unfollowed(payload['who_id'], payload['whom_id'])
+    if unknown:
+        counters.reconcile(list(unknown))
+    jobs.after_commit(fragments.invalidate, *(
+        [fragments.timeline_key(who_id) for who_id, _ in pairs] +
+        [fragments.profile_key(user_id) for user_id in user_ids]))
+
+
+@jobs.task('index_tweets')
+def index_tweets(payloads):
+    tweets = Tweet.objects.in_bulk([payload['tweet_id'] for payload in payloads])
+    search.index_tweets(tweets.values())
+
+
+@jobs.task('generate_thumbnails')
+def generate_thumbnails(payloads):
+    for profile_id in set(payload['profile_id'] for payload in payloads):
+        thumbnails.generate_for(profile_id)
@@ -1,5 +1,7 @@
 from django import template
 from twitter.models import User,Relationship,UserProfile
+from twitter import counters, fragments, thumbnails
+from twitter.graph import request_cache
 from django.template.defaultfilters import stringfilter
 
 register = template.Library()
@@ -17,23 +19,65 @@ def is_following(who_name,whom_name):
     """
     Build follow or unfllow button.
     """
-    who = User.objects.get(username = who_name)
-    whom = User.objects.get(username = whom_name)
+    return request_cache.is_following(who_name, whom_name)
 
-    following_users = Relationship.objects.filter(who_id = who.id).all()
-    if len(following_users) == 0:
-        return False
-    following_ids = [item.whom_id for item in following_users]
-
-    if whom.id in following_ids:
-        return True
-    return False
 
+@register.assignment_tag
+def following_usernames(who_name):
+    """
+    Return the set of usernames ``who_name`` follows, to test many users
+    against at once, e.g. {% following_usernames request.session.username as followed %}
+    """
+    return request_cache.following_usernames(who_name)
 
 
+@register.assignment_tag
+def profile_counts(user):
+    """
+    Return the counters of ``user`` read from the database, for the cached
+    fragments showing them: the profile loaded with the user may predate the
+    generation the fragment is cached under, e.g.
+    {% profile_counts user as counts %}{{ counts.tweet_count }}
+    """
+    return counters.get_counts(user.pk)
 
 
+class CacheFragmentNode(template.Node):
 
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
 
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return fragments.get_or_render(self.name, vary_on, lambda: self.nodelist.render(context))
 
 
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache the enclosed template until one of its dependencies changes, e.g.
+    {% cachefragment "user_tweets" user.pk request.GET.page %}...{% endcachefragment %}
+    See twitter.fragments for the fragment names.
+    """
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'%s' tag requires a fragment name." % bits[0])
+    name = bits[1].strip('"\'')
+    if name not in fragments.DEPENDENCIES:
+        raise template.TemplateSyntaxError("Unknown fragment %r." % name)
+    return CacheFragmentNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
+
+
+@register.simple_tag
+def thumbnail(profile, size):
+    """
+    Return the URL of a profile picture in one of the sizes of
+    twitter.thumbnails.SIZES, e.g. {% thumbnail tweet.user.profile "small" %}
+    """
+    if size not in thumbnails.SIZES:
+        raise template.TemplateSyntaxError("Unknown thumbnail size %r." % size)
+    return thumbnails.thumbnail_url(profile, size)
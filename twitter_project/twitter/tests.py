@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import F
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from twitter import export, fragments, graph, ingest, jobs, rendering, routers, search, streaming, thumbnails, trends, views
+from twitter.management.commands import benchmark_pages
+from twitter.management.commands.benchmark_pages import SCENARIOS
+from twitter.middleware import user_cache
+from twitter.models import Job, Relationship, SearchTerm, TimelineEntry, Tweet, UserProfile
+from twitter.timeline import DatabaseTimelineStore, get_timeline_store
+
+
+def create_user(username):
+    user = User.objects.create(username=username, password=username)
+    UserProfile.objects.create(user=user)
+    return user
+
+
+class AppTestCase(TestCase):
+
+    def setUp(self):
+        # fragments, rate limit buckets and users are cached across tests
+        caches['default'].clear()
+        user_cache.clear()
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+
+    def login(self, user):
+        self.client.post('/login', {'username': user.username, 'password': user.username})
+
+    def follow(self, user):
+        return self.client.post('/tweets/{}/relationship'.format(user.username), {'meth_type': 'post'})
+
+    def unfollow(self, user):
+        return self.client.post('/tweets/{}/relationship'.format(user.username), {'meth_type': 'delete'})
+
+    def tweet(self, user, text):
+        return self.client.post('/{}/tweets/new'.format(user.username), {'text': text})
+
+    def counters(self, user):
+        profile = UserProfile.objects.get(user=user)
+        return profile.tweet_count, profile.follower_count, profile.following_count
+
+    def home_tweet_ids(self, user):
+        return set(TimelineEntry.objects.filter(user=user).values_list('tweet_id', flat=True))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class RelationshipTests(AppTestCase):
+
+    def test_follow_unfollow(self):
+        tweet = Tweet.objects.create(user=self.bob, text="hello")
+        self.login(self.alice)
+        self.assertEqual(self.follow(self.bob).status_code, 302)
+        self.assertTrue(Relationship.objects.filter(who_id=self.alice.id, whom_id=self.bob.id).exists())
+        self.assertEqual(self.home_tweet_ids(self.alice), set([tweet.id]))
+        self.assertEqual(self.counters(self.alice), (0, 0, 1))
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+        # following again changes nothing
+        self.follow(self.bob)
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+
+        self.unfollow(self.bob)
+        self.assertFalse(Relationship.objects.exists())
+        self.assertEqual(self.home_tweet_ids(self.alice), set())
+        self.assertEqual(self.counters(self.alice), (0, 0, 0))
+        self.assertEqual(self.counters(self.bob), (0, 0, 0))
+
+    def test_new_tweet_fan_out(self):
+        self.login(self.alice)
+        self.follow(self.bob)
+        self.login(self.bob)
+        self.assertEqual(self.tweet(self.bob, "hello").status_code, 200)
+        tweet = Tweet.objects.get()
+        self.assertEqual(self.home_tweet_ids(self.alice), set([tweet.id]))
+        self.assertEqual(self.counters(self.bob), (1, 1, 0))
+
+    def test_edit_profile_keeps_counters(self):
+        self.login(self.alice)
+        self.follow(self.bob)
+        self.login(self.bob)
+        self.assertEqual(self.client.post('/bob/edit', {'username': 'bob', 'password': 'bob'}).status_code, 302)
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={'new_tweet': (2, 60)})
+class RateLimitTests(AppTestCase):
+
+    def test_throttled(self):
+        self.login(self.alice)
+        self.assertEqual(self.tweet(self.alice, "one").status_code, 200)
+        self.assertEqual(self.tweet(self.alice, "two").status_code, 200)
+        response = self.tweet(self.alice, "three")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertEqual(Tweet.objects.count(), 2)
+        # reads aren't limited
+        self.assertEqual(self.client.get('/alice/tweets/new').status_code, 200)
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class ConditionalGetTests(AppTestCase):
+
+    def test_home_timeline(self):
+        self.login(self.alice)
+        self.follow(self.bob)
+        response = self.client.get('/api/1/users/alice/home')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get('/api/1/users/alice/home', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.login(self.bob)
+        self.tweet(self.bob, "hello")
+        response = self.client.get('/api/1/users/alice/home', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b"hello", response.content)
+
+
+class ExportTests(AppTestCase):
+
+    def setUp(self):
+        super(ExportTests, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        Tweet.objects.create(user=self.alice, text="hello")
+        Relationship.objects.create(who_id=self.alice.id, whom_id=self.bob.id)
+
+    def chunk_files(self):
+        user_directory = os.path.join(self.root, str(self.alice.pk))
+        snapshots = os.listdir(user_directory)
+        self.assertEqual(len(snapshots), 1)
+        directory = os.path.join(user_directory, snapshots[0])
+        return dict((filename, os.stat(os.path.join(directory, filename)).st_ino)
+                    for filename in os.listdir(directory) if filename.endswith('.ndjson'))
+
+    def test_resume(self):
+        with self.settings(EXPORT_ROOT=self.root):
+            stream = export.export(self.alice, 'ndjson')
+            # the download is interrupted after the first chunk
+            next(stream)
+            next(stream)
+            stream.close()
+            written = self.chunk_files()
+            self.assertEqual(len(written), 1)
+
+            content = b''.join(export.export(self.alice, 'ndjson'))
+            chunks = self.chunk_files()
+        self.assertIn(b'"text":"hello"', content)
+        self.assertIn(b'"user":"bob"', content)
+        # alice has no followers
+        self.assertEqual(len(chunks), 2)
+        # the first chunk is reused
+        for filename, inode in written.items():
+            self.assertEqual(chunks[filename], inode)
+
+
+@override_settings(JOBS_ASYNC=True, RATE_LIMITS={})
+class JobTests(AppTestCase):
+
+    def test_work(self):
+        self.login(self.alice)
+        self.follow(self.bob)
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(self.counters(self.bob), (0, 0, 0))
+        self.assertEqual(jobs.work(once=True), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+
+    def sidebar_counts(self, response):
+        counts = re.search(r'<td>(\d+)</td>\s*<td>(\d+)</td>\s*<td>(\d+)</td>', response.content.decode('utf-8'))
+        return tuple(int(count) for count in counts.groups())
+
+    def test_sidebar_after_work(self):
+        self.login(self.alice)
+        self.assertEqual(self.sidebar_counts(self.client.get('/tweets/alice')), (0, 0, 0))
+        self.tweet(self.alice, "hello")
+        self.follow(self.bob)
+        # before the worker has run
+        self.assertEqual(self.sidebar_counts(self.client.get('/tweets/alice')), (0, 0, 0))
+        jobs.work(once=True)
+        # the counters moved by the worker are shown, although the user of
+        # the session was cached with its profile before
+        self.assertEqual(self.sidebar_counts(self.client.get('/tweets/alice')), (1, 1, 0))
+        self.assertEqual(self.client.get('/about').wsgi_request.dwitter_user.profile.tweet_count, 1)
+
+    def test_profile_changed_elsewhere(self):
+        self.login(self.alice)
+        user = self.client.get('/about').wsgi_request.dwitter_user
+        # as another process would: no signal reaches this one
+        UserProfile.objects.filter(user=self.alice).update(desc="elsewhere")
+        self.assertIs(self.client.get('/about').wsgi_request.dwitter_user, user)
+        fragments.invalidate(fragments.profile_key(self.alice.pk))
+        self.assertEqual(self.client.get('/about').wsgi_request.dwitter_user.profile.desc, "elsewhere")
+
+    def test_retry(self):
+        Job.objects.create(name='unknown', payload='{}')
+        self.assertEqual(jobs.work(once=True), 0)
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertFalse(job.failed)
+        self.assertIn('unknown', job.last_error)
+        with self.settings(JOBS_MAX_ATTEMPTS=2):
+            jobs.retry(job, "error")
+        self.assertTrue(Job.objects.get().failed)
+
+
+class TimelineStoreTests(AppTestCase):
+
+    def test_trim_unfollow(self):
+        store = DatabaseTimelineStore(max_length=3, trim_every=1)
+        tweets = [Tweet.objects.create(user=user, text=str(i))
+                  for i, user in enumerate([self.bob, self.alice] * 3)]
+        store.push_many([(self.alice.id, tweet.id) for tweet in tweets])
+        self.assertEqual(store.get_tweet_ids(self.alice.id), [tweet.id for tweet in reversed(tweets[-3:])])
+
+        store.unfollow(self.alice.id, self.bob.id)
+        self.assertEqual(store.get_tweet_ids(self.alice.id), [tweets[-1].id, tweets[-3].id])
+
+
+class GraphTests(AppTestCase):
+
+    def setUp(self):
+        super(GraphTests, self).setUp()
+        self.carol = create_user('carol')
+        for who, whom in [(self.alice, self.bob), (self.bob, self.alice), (self.alice, self.carol)]:
+            Relationship.objects.create(who_id=who.id, whom_id=whom.id)
+
+    def test_following_pairs(self):
+        alice, bob, carol = self.alice.id, self.bob.id, self.carol.id
+        with self.assertNumQueries(1):
+            found = graph.following_pairs([(alice, bob), (alice, carol), (bob, carol), (carol, alice)])
+        self.assertEqual(found, set([(alice, bob), (alice, carol)]))
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.following_pairs([]), set())
+
+    def test_adjacency_index(self):
+        alice, bob, carol = self.alice.id, self.bob.id, self.carol.id
+        with self.assertNumQueries(1):
+            index = graph.AdjacencyIndex([alice])
+        with self.assertNumQueries(0):
+            self.assertTrue(index.is_following(alice, carol))
+            self.assertTrue(index.is_following(bob, alice))
+            self.assertFalse(index.is_following(carol, alice))
+            self.assertEqual(index.following_pairs([(alice, bob), (carol, alice)]), set([(alice, bob)]))
+            self.assertEqual(index.following_ids(alice), set([bob, carol]))
+            self.assertEqual(index.follower_ids(alice), set([bob]))
+            self.assertEqual(index.mutual_ids(alice), set([bob]))
+        # relationships between users not loaded aren't known
+        self.assertRaises(KeyError, index.is_following, bob, carol)
+
+    def test_relationship_list(self):
+        self.login(self.bob)
+        response = self.client.get('/tweets/carol/relationship?type=followers')
+        self.assertEqual(response.context['followed_ids'], set([self.alice.id]))
+        self.assertContains(response, '<span class="right">Following</span>', count=1)
+        # the membership of the listed users is checked with one query
+        with self.assertNumQueries(5):
+            self.client.get('/tweets/alice/relationship?type=followers')
+        for i in range(4):
+            Relationship.objects.create(who_id=create_user('user%d' % i).id, whom_id=self.alice.id)
+        with self.assertNumQueries(5):
+            self.client.get('/tweets/alice/relationship?type=followers')
+
+
+class IsFollowingTests(AppTestCase):
+
+    def setUp(self):
+        super(IsFollowingTests, self).setUp()
+        self.carol = create_user('carol')
+        Relationship.objects.create(who_id=self.alice.id, whom_id=self.bob.id)
+        graph.request_cache.clear()
+        self.addCleanup(graph.request_cache.clear)
+
+    def test_memoized(self):
+        template = Template("{% load extra %}{% for name in names %}{{ viewer|is_following:name|yesno:'y,n' }}{% endfor %}")
+        context = Context({'viewer': 'alice', 'names': ['bob', 'carol', 'alice'] * 10})
+        # the followed usernames are loaded once, whatever the number of checks
+        with self.assertNumQueries(1):
+            self.assertEqual(template.render(context), 'ynn' * 10)
+
+    def test_known_user(self):
+        graph.request_cache.remember(self.alice)
+        with self.assertNumQueries(1):
+            self.assertEqual(graph.request_cache.following_usernames('alice'), frozenset(['bob']))
+            self.assertTrue(graph.request_cache.is_following('alice', 'bob'))
+
+    def test_cleared_between_requests(self):
+        graph.request_cache.following_usernames('alice')
+        self.client.get('/about')
+        Relationship.objects.create(who_id=self.alice.id, whom_id=self.carol.id)
+        self.assertTrue(graph.request_cache.is_following('alice', 'carol'))
+
+    def test_sidebar(self):
+        self.login(self.alice)
+        self.assertContains(self.client.get('/tweets/bob'), 'value="UnFollow"')
+        self.assertContains(self.client.get('/tweets/carol'), 'value="Follow"')
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={}, TIMELINE_PAGINATION='cursor')
+class CursorPaginationTests(AppTestCase):
+
+    def setUp(self):
+        super(CursorPaginationTests, self).setUp()
+        self.login(self.alice)
+        self.follow(self.bob)
+        self.tweets = [Tweet.objects.create(user=self.bob, text="tweet %d" % i) for i in range(15)]
+        get_timeline_store().add_tweets(self.tweets)
+
+    def assertPages(self, url):
+        newest = [tweet.id for tweet in reversed(self.tweets)]
+        first = self.client.get(url).context['tweets']
+        self.assertEqual([tweet.id for tweet in first], newest[:10])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        response = self.client.get(url, {'cursor': first.next_cursor()})
+        second = response.context['tweets']
+        self.assertEqual([tweet.id for tweet in second], newest[10:])
+        self.assertFalse(second.has_next())
+        self.assertContains(response, '?cursor={}'.format(second.previous_cursor()))
+        back = self.client.get(url, {'cursor': second.previous_cursor()}).context['tweets']
+        self.assertEqual([tweet.id for tweet in back], newest[:10])
+
+    def test_user_timeline(self):
+        self.assertPages('/tweets/bob')
+
+    def test_home_timeline(self):
+        self.assertPages('/tweets/alice/followings')
+
+    def test_public_timeline(self):
+        self.assertPages('/')
+
+    def test_invalid_cursor(self):
+        # shows the first page
+        for cursor in ('e30', 'garbage', '1'):
+            response = self.client.get('/tweets/bob', {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['tweets'][0], self.tweets[-1])
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class IngestTests(AppTestCase):
+
+    def post_bulk(self, user, lines):
+        return self.client.post('/{}/tweets/bulk'.format(user.username), '\n'.join(lines),
+                                content_type='application/x-ndjson')
+
+    def test_validation(self):
+        lines = [
+            '{"user": "alice", "text": "one"}',
+            '',
+            'not json',
+            '["text"]',
+            '{"user": "alice", "text": "  "}',
+            '{"user": "alice", "text": %s}' % json.dumps("x" * 141),
+            '{"user": "nobody", "text": "two"}',
+            '{"user": "bob", "text": "three"}',
+        ]
+        result = ingest.ingest(lines, batch_size=2)
+        self.assertEqual(result.created, 2)
+        self.assertEqual([error["line"] for error in result.errors], [3, 4, 5, 6, 7])
+        self.assertEqual(sorted(Tweet.objects.values_list('user__username', 'text')),
+                         [('alice', 'one'), ('bob', 'three')])
+
+    def test_ids(self):
+        Tweet.objects.create(user=self.alice, text="same")
+        lines = ['{"user": "%s", "text": "same"}' % name for name in ('alice', 'bob', 'alice', 'alice')]
+        with self.settings(JOBS_ASYNC=True):
+            ingest.ingest(lines)
+        payloads = [json.loads(job.payload) for job in Job.objects.filter(name='tweet_posted').order_by('id')]
+        tweets = Tweet.objects.order_by('id')[1:]
+        # repeated texts get the ids of their own rows
+        self.assertEqual([(payload['tweet_id'], payload['user_id']) for payload in payloads],
+                         [(tweet.id, tweet.user_id) for tweet in tweets])
+        self.assertEqual(Job.objects.filter(name='index_tweets').count(), 4)
+
+    def test_side_effects_are_queued(self):
+        Relationship.objects.create(who_id=self.bob.id, whom_id=self.alice.id)
+        self.login(self.alice)
+        with self.settings(JOBS_ASYNC=True):
+            response = self.post_bulk(self.alice, ['{"text": "#django one"}', '{"text": "two"}'])
+            self.assertEqual(json.loads(response.content.decode()), {"created": 2, "errors": []})
+            self.assertEqual(self.home_tweet_ids(self.bob), set())
+            self.assertEqual(self.counters(self.alice), (0, 0, 0))
+            jobs.work(once=True)
+        self.assertEqual(self.home_tweet_ids(self.bob), set(Tweet.objects.values_list('id', flat=True)))
+        self.assertEqual(self.counters(self.alice)[0], 2)
+        self.assertEqual(list(search.search("django")), list(Tweet.objects.filter(text="#django one")))
+
+    def test_as_another_user(self):
+        self.login(self.alice)
+        self.assertEqual(self.post_bulk(self.bob, ['{"text": "one"}']).status_code, 403)
+        self.assertEqual(self.client.get('/alice/tweets/bulk').status_code, 405)
+        self.assertFalse(Tweet.objects.exists())
+
+    def test_command(self):
+        path = tempfile.mktemp()
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as f:
+            f.write('{"user": "alice", "text": "one"}\n{"user": "nobody", "text": "two"}\n')
+        out = StringIO()
+        call_command('ingest_tweets', path, stdout=out, stderr=StringIO())
+        self.assertIn("Created 1 tweets", out.getvalue())
+        self.assertEqual(self.counters(self.alice), (1, 0, 0))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class SearchTests(AppTestCase):
+
+    def setUp(self):
+        super(SearchTests, self).setUp()
+        self.django = Tweet.objects.create(user=self.alice, text="Learning #Django with @bob")
+        self.python = Tweet.objects.create(user=self.bob, text="python and django")
+        self.other = Tweet.objects.create(user=self.bob, text="djangonauts unite")
+
+    def assertFound(self, query, tweets):
+        self.assertEqual(list(search.search(query)), tweets)
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize("Hello #Django @bob, hello!"),
+                         set(["hello", "#django", "django", "@bob", "bob"]))
+
+    def test_search(self):
+        self.assertFound("django", [self.python, self.django])
+        self.assertFound("#django", [self.django])
+        self.assertFound("DJANGO python", [self.python])
+        self.assertFound("djang*", [self.other, self.python, self.django])
+        self.assertFound("missing", [])
+        self.assertFound("", [])
+
+    def test_incremental(self):
+        self.python.text = "just python"
+        self.python.save()
+        self.assertFound("django", [self.django])
+        self.assertFound("just", [self.python])
+        self.django.delete()
+        self.assertFound("django", [])
+
+    def test_rebuild(self):
+        SearchTerm.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertFound("django", [self.python, self.django])
+
+    def test_view(self):
+        tweets = [Tweet.objects.create(user=self.bob, text="page %d" % i) for i in range(12)]
+        self.login(self.alice)
+        response = self.client.get('/search', {'q': 'page'})
+        first = response.context['tweets']
+        self.assertEqual(list(first), tweets[:-11:-1])
+        response = self.client.get('/search', {'q': 'page', 'cursor': first.next_cursor()})
+        self.assertEqual(list(response.context['tweets']), tweets[1::-1])
+        self.assertContains(self.client.get('/search', {'q': 'page', 'cursor': 'e30'}), "page 11")
+        # the text is shown as rendered
+        self.assertContains(self.client.get('/search', {'q': 'learning'}),
+                            '<a href="/search?q=%23Django">#Django</a>')
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class RenderingTests(AppTestCase):
+
+    def test_linkify(self):
+        self.assertEqual(rendering.linkify('<b>hi</b> @bob #tag http://example.com/?a=1&b="2"'),
+                         '&lt;b&gt;hi&lt;/b&gt; <a href="/tweets/bob">@bob</a> '
+                         '<a href="/search?q=%23tag">#tag</a> '
+                         '<a href="http://example.com/?a=1&amp;b=" rel="nofollow">http://example.com/?a=1&amp;b=</a>'
+                         '&quot;2&quot;')
+        # an entity can't smuggle markup
+        self.assertEqual(rendering.linkify('http://x.io/<script>'),
+                         '<a href="http://x.io/" rel="nofollow">http://x.io/</a>&lt;script&gt;')
+
+    def test_render(self):
+        text = "word " * 20 + "http://example.com/" + "a" * 80 + "\nsecond line"
+        lines = rendering.render(text).split('<br>')
+        self.assertEqual(len(lines), 4)
+        # long words such as URLs aren't split
+        self.assertIn("a" * 80 + '</a>', lines[2])
+        self.assertEqual(lines[3], "second line")
+
+    def test_stored_on_save(self):
+        tweet = Tweet.objects.create(user=self.alice, text="<i>#django</i>")
+        tweet = Tweet.objects.get(pk=tweet.pk)
+        self.assertEqual(tweet.render_version, rendering.RENDER_VERSION)
+        self.assertEqual(tweet.pretty_text, rendering.render("<i>#django</i>"))
+        self.login(self.alice)
+        response = self.client.get('/tweets/alice')
+        self.assertContains(response, '&lt;i&gt;<a href="/search?q=%23django">#django</a>&lt;/i&gt;')
+        self.assertNotContains(response, '<i>#django')
+
+    def test_stale(self):
+        tweet = Tweet.objects.create(user=self.alice, text="@bob")
+        Tweet.objects.filter(pk=tweet.pk).update(rendered_text="old", render_version=0)
+        self.login(self.alice)
+        # rendered on the fly and written back after the response
+        self.assertContains(self.client.get('/tweets/alice'), '<a href="/tweets/bob">@bob</a>')
+        tweet = Tweet.objects.get(pk=tweet.pk)
+        self.assertEqual((tweet.rendered_text, tweet.render_version),
+                         (rendering.render("@bob"), rendering.RENDER_VERSION))
+
+    def test_command(self):
+        tweets = [Tweet.objects.create(user=self.alice, text="#%d" % i) for i in range(3)]
+        Tweet.objects.update(rendered_text="", render_version=0)
+        out = StringIO()
+        call_command('rerender_tweets', stdout=out)
+        self.assertIn("Rendered 3 tweets", out.getvalue())
+        for tweet in tweets:
+            self.assertEqual(Tweet.objects.get(pk=tweet.pk).rendered_text, rendering.render(tweet.text))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class FragmentTests(AppTestCase):
+
+    def setUp(self):
+        super(FragmentTests, self).setUp()
+        self.renders = []
+
+    def render(self, name, *vary_on):
+        return fragments.get_or_render(name, list(vary_on), lambda: self.renders.append(name) or name)
+
+    def test_cached_until_invalidated(self):
+        self.render('user_tweets', self.alice.pk, 1)
+        self.render('user_tweets', self.alice.pk, 1)
+        self.assertEqual(self.renders, ['user_tweets'])
+        # another page is another fragment
+        self.render('user_tweets', self.alice.pk, 2)
+        self.assertEqual(len(self.renders), 2)
+        fragments.invalidate(fragments.tweets_key(self.alice.pk))
+        self.render('user_tweets', self.alice.pk, 1)
+        self.assertEqual(len(self.renders), 3)
+
+    def test_targeted_invalidation(self):
+        Relationship.objects.create(who_id=self.alice.id, whom_id=self.bob.id)
+        carol = create_user('carol')
+        names = [('user_tweets', self.alice.pk), ('user_tweets', self.bob.pk), ('home_tweets', self.alice.pk),
+                 ('home_tweets', carol.pk), ('public_tweets',), ('sidebar', self.bob.pk, carol.pk)]
+        for name in names:
+            self.render(*name)
+        self.renders = []
+        Tweet.objects.create(user=self.bob, text="hello")
+        for name in names:
+            self.render(*name)
+        # bob's tweets, the home timeline of his follower, the public timeline
+        # and bob's sidebar
+        self.assertEqual(self.renders, ['user_tweets', 'home_tweets', 'public_tweets', 'sidebar'])
+
+    def test_pages(self):
+        self.login(self.alice)
+        self.assertNotContains(self.client.get('/tweets/bob'), "first")
+        Tweet.objects.create(user=self.bob, text="first")
+        self.assertContains(self.client.get('/tweets/bob'), "first")
+        self.follow(self.bob)
+        self.assertContains(self.client.get('/tweets/alice/followings'), "first")
+        self.unfollow(self.bob)
+        self.assertNotContains(self.client.get('/tweets/alice/followings'), "first")
+
+    def test_stats(self):
+        fragments.reset_stats()
+        self.render('profile', self.alice.pk)
+        self.render('profile', self.alice.pk)
+        self.render('profile', self.alice.pk)
+        stats = fragments.get_stats()['profile']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        out = StringIO()
+        call_command('fragment_stats', reset=True, stdout=out)
+        self.assertIn("66.7%", out.getvalue())
+        self.assertEqual(fragments.get_stats()['profile']['hit_ratio'], None)
+
+    def test_unknown_fragment(self):
+        self.assertRaises(TemplateSyntaxError, Template,
+                          '{% load extra %}{% cachefragment "missing" %}{% endcachefragment %}')
+
+
+class DwitterUserTests(AppTestCase):
+
+    def get_user(self):
+        return self.client.get('/about').wsgi_request.dwitter_user
+
+    def test_anonymous(self):
+        self.assertEqual(self.get_user(), None)
+
+    def test_logged_in(self):
+        self.login(self.alice)
+        user = self.get_user()
+        self.assertEqual(user, self.alice)
+        # loaded with its profile, then reused by the next requests
+        with self.assertNumQueries(0):
+            user.profile
+        with self.assertNumQueries(1):
+            # the session
+            self.assertIs(self.get_user(), user)
+        self.client.get('/logout')
+        self.assertEqual(self.get_user(), None)
+
+    def test_unknown_user(self):
+        self.login(self.alice)
+        self.alice.delete()
+        self.assertEqual(self.get_user(), None)
+
+    def test_forgotten_on_change(self):
+        self.login(self.alice)
+        user = self.get_user()
+        UserProfile.objects.get(user=self.alice).save()
+        self.assertIsNot(self.get_user(), user)
+        user = self.get_user()
+        Relationship.objects.create(who_id=self.bob.id, whom_id=self.alice.id)
+        self.assertIsNot(self.get_user(), user)
+
+    def test_expiry(self):
+        self.login(self.alice)
+        with self.settings(DWITTER_USER_CACHE_TIMEOUT=0):
+            user = self.get_user()
+            self.assertIsNot(self.get_user(), user)
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class ThumbnailTests(AppTestCase):
+
+    def setUp(self):
+        super(ThumbnailTests, self).setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = self.settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def picture(self, name='picture.png', size=(300, 200)):
+        from PIL import Image
+        content = BytesIO()
+        Image.new('RGB', size, (255, 0, 0)).save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+    def profile(self):
+        return UserProfile.objects.get(user=self.alice)
+
+    def test_upload(self):
+        from PIL import Image
+        self.login(self.alice)
+        self.client.post('/alice/edit', {'username': 'alice', 'password': 'alice', 'picture': self.picture()})
+        profile = self.profile()
+        self.assertTrue(profile.picture_hash)
+        for size, pixels in thumbnails.SIZES.items():
+            url = thumbnails.thumbnail_url(profile, size)
+            self.assertEqual(url, '/media/{}'.format(thumbnails.thumbnail_name(profile.picture_hash, size)))
+            image = Image.open(os.path.join(self.media_root, thumbnails.thumbnail_name(profile.picture_hash, size)))
+            self.assertEqual(image.size, (pixels, pixels))
+        self.assertContains(self.client.get('/tweets/alice'), thumbnails.thumbnail_url(profile, 'medium'))
+
+        response = self.client.get(thumbnails.thumbnail_url(profile, 'small'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age={}'.format(views.THUMBNAIL_MAX_AGE), response['Cache-Control'])
+
+        # a new picture gets new names
+        picture_hash = profile.picture_hash
+        self.client.post('/alice/edit', {'username': 'alice', 'password': 'alice',
+                                         'picture': self.picture(size=(100, 100))})
+        self.assertNotEqual(self.profile().picture_hash, picture_hash)
+
+    def test_pending(self):
+        self.login(self.alice)
+        with self.settings(JOBS_ASYNC=True):
+            self.client.post('/alice/edit', {'username': 'alice', 'password': 'alice', 'picture': self.picture()})
+        profile = self.profile()
+        # the original until the job has run
+        self.assertEqual(thumbnails.thumbnail_url(profile, 'small'), profile.picture.url)
+        jobs.work(once=True)
+        self.assertTrue(self.profile().picture_hash)
+
+    def test_not_an_image(self):
+        profile = self.profile()
+        profile.picture.save('picture.png', ContentFile(b'not an image'))
+        self.assertFalse(thumbnails.generate(profile))
+        self.assertEqual(self.profile().picture_hash, '')
+
+    def test_command(self):
+        profile = self.profile()
+        profile.picture.save('picture.png', self.picture())
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn("Generated the thumbnails of 1 profiles, 0 failed.", out.getvalue())
+        self.assertTrue(self.profile().picture_hash)
+
+
+class SlidingWindowCounterTests(TestCase):
+
+    def test_extract(self):
+        self.assertEqual(trends.extract_hashtags("#Django and #django, a#b http://x.io/#c"), set(["#django"]))
+        self.assertEqual(trends.extract_mentions("@bob e@mail @Alice"), set(["@bob", "@Alice"]))
+
+    def test_window(self):
+        counter = trends.SlidingWindowCounter(window=600, bucket=60, half_life=None, refresh=0)
+        counter.add(["#a", "#b"], timestamp=1000)
+        counter.add(["#a"], timestamp=1100)
+        self.assertEqual(counter.top(now=1100), [("#a", 2), ("#b", 1)])
+        self.assertEqual(counter.top(1, now=1100), [("#a", 2)])
+        # the bucket of 1000 leaves the window
+        self.assertEqual(counter.top(now=1600), [("#a", 1)])
+        self.assertEqual(counter.top(now=1800), [])
+        # too old to count
+        counter.add(["#old"], timestamp=1000)
+        self.assertEqual(counter.top(now=1800), [])
+
+    def test_half_life(self):
+        counter = trends.SlidingWindowCounter(window=3600, bucket=60, half_life=600, refresh=0)
+        counter.add(["#old"], timestamp=0)
+        counter.add(["#old"], timestamp=0)
+        counter.add(["#new"], timestamp=600)
+        scores = dict(counter.top(now=600))
+        self.assertAlmostEqual(scores["#old"], 1)
+        self.assertAlmostEqual(scores["#new"], 1)
+        scores = dict(counter.top(now=1200))
+        self.assertAlmostEqual(scores["#old"], 0.5)
+        self.assertAlmostEqual(scores["#new"], 0.5)
+
+    def test_rebase(self):
+        counter = trends.SlidingWindowCounter(window=3600, bucket=60, half_life=1, refresh=0)
+        counter.add(["#a"], timestamp=1000)
+        counter.add(["#a"], timestamp=1100)
+        # far enough from the origin for the weights to be rebased
+        self.assertEqual(counter.origin, 1100)
+        self.assertAlmostEqual(dict(counter.top(now=1100))["#a"], 1)
+
+    def test_refresh(self):
+        counter = trends.SlidingWindowCounter(window=600, bucket=60, half_life=None, refresh=10)
+        counter.add(["#a"], timestamp=1000)
+        self.assertEqual(counter.top(now=1000), [("#a", 1)])
+        counter.add(["#b"], timestamp=1001)
+        self.assertEqual(counter.top(now=1005), [("#a", 1)])
+        self.assertEqual(sorted(counter.top(now=1010)), [("#a", 1), ("#b", 1)])
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class TrendsTests(AppTestCase):
+
+    def setUp(self):
+        super(TrendsTests, self).setUp()
+        self.reset()
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        for counter in trends.counters.values():
+            counter.clear()
+            counter.refresh = 0
+        trends._loaded = False
+
+    def test_trends(self):
+        old = Tweet.objects.create(user=self.alice, text="#old")
+        Tweet.objects.filter(pk=old.pk).update(created_date=timezone.now() - timedelta(hours=2))
+        Tweet.objects.create(user=self.alice, text="#django @bob")
+        Tweet.objects.create(user=self.bob, text="#Django #python")
+        # the tweets of the last hour are read on first use
+        self.assertEqual([term for term, _ in trends.get_trends('hashtags')], ['#django', '#python'])
+        # then counted as they are saved
+        self.login(self.alice)
+        self.tweet(self.alice, "#python #python")
+        self.tweet(self.alice, "#python")
+        response = self.client.get('/trends')
+        self.assertEqual([trend["term"] for trend in json.loads(response.content.decode())["trends"]],
+                         ['#python', '#django'])
+        response = self.client.get('/trends', {'kind': 'mentions', 'limit': 1})
+        self.assertEqual(json.loads(response.content.decode())["trends"][0]["term"], "@bob")
+
+    def test_bad_request(self):
+        self.assertEqual(self.client.get('/trends', {'kind': 'words'}).status_code, 400)
+        self.assertEqual(self.client.get('/trends', {'limit': 'ten'}).status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_LAG=5)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.addCleanup(routers.state.reset)
+
+    def db_for_read(self, model):
+        return self.router.db_for_read(model)
+
+    def test_outside_requests(self):
+        self.assertEqual(self.db_for_read(Tweet), 'default')
+
+    def test_request(self):
+        routers.start_request(self.request)
+        self.assertIn(self.db_for_read(Tweet), ['replica1', 'replica2'])
+        self.assertIn(self.db_for_read(TimelineEntry), ['replica1', 'replica2'])
+        # models that aren't replicated are left to the default routing
+        self.assertEqual(self.db_for_read(Job), None)
+        self.assertEqual(self.db_for_read(User), None)
+        self.assertEqual(self.router.db_for_write(Tweet), 'default')
+        with transaction.atomic():
+            self.assertEqual(self.db_for_read(Tweet), 'default')
+        with routers.read_from_primary():
+            self.assertEqual(self.db_for_read(Tweet), 'default')
+        self.assertNotEqual(self.db_for_read(Tweet), 'default')
+        routers.state.reset()
+        self.assertEqual(self.db_for_read(Tweet), 'default')
+
+    def test_pinned(self):
+        routers.start_request(self.request)
+        routers.pin_to_primary(self.request)
+        self.assertEqual(self.db_for_read(Tweet), 'default')
+        # the next requests of the session too, until the lag has passed
+        routers.start_request(self.request)
+        self.assertEqual(self.db_for_read(Tweet), 'default')
+        self.request.session[routers.PIN_SESSION_KEY] = time.time() - 1
+        routers.start_request(self.request)
+        self.assertNotEqual(self.db_for_read(Tweet), 'default')
+
+    def test_without_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            routers.start_request(self.request)
+            self.assertEqual(self.db_for_read(Tweet), 'default')
+
+    def test_allow_migrate(self):
+        self.assertEqual(self.router.allow_migrate('replica1', Tweet), False)
+        self.assertEqual(self.router.allow_migrate('default', Tweet), None)
+
+    def test_fragments(self):
+        changed = time.time()
+        self.assertFalse(fragments.may_be_stale(changed))
+        routers.start_request(self.request)
+        # the replicas may not have the change yet
+        self.assertTrue(fragments.may_be_stale(changed))
+        self.assertFalse(fragments.may_be_stale(changed - 5))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class ReplicaRoutingMiddlewareTests(AppTestCase):
+
+    def test_writes_pin_the_session(self):
+        self.login(self.alice)
+        self.client.get('/tweets/bob')
+        self.assertNotIn(routers.PIN_SESSION_KEY, self.client.session)
+        self.follow(self.bob)
+        self.assertTrue(self.client.session[routers.PIN_SESSION_KEY] > time.time())
+        # the state of the request doesn't leak into the next code run by
+        # the thread
+        self.assertFalse(routers.state.use_replicas)
+        self.assertFalse(routers.state.pinned)
+
+
+class BrokerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.broker = streaming.Broker(keepalive=3600)
+
+    def test_publish(self):
+        everyone = self.broker.subscribe()
+        followers = self.broker.subscribe(set([1, 2]))
+        self.broker.publish(10, 1, "first")
+        self.broker.publish(11, 3, "second")
+        self.assertEqual(everyone.get(), [(10, "first"), (11, "second")])
+        self.assertEqual(followers.get(), [(10, "first")])
+        self.assertEqual(self.broker.count(), 2)
+
+    def test_unsubscribe(self):
+        subscriber = self.broker.subscribe(set([1, 2]))
+        self.broker.unsubscribe(subscriber)
+        self.broker.publish(10, 1, "first")
+        self.assertEqual(list(subscriber.messages), [])
+        self.assertEqual(self.broker.count(), 0)
+        self.assertEqual(dict(self.broker.by_author), {})
+
+    def test_limit(self):
+        self.broker.subscribe()
+        self.broker.subscribe(set([1]))
+        self.assertEqual(self.broker.subscribe(limit=2), None)
+        self.assertNotEqual(self.broker.subscribe(limit=3), None)
+
+    def test_tick(self):
+        subscriber = self.broker.subscribe()
+        self.broker.tick()
+        # woken without messages: the stream sends a keepalive
+        self.assertEqual(subscriber.get(), [])
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class StreamTests(TransactionTestCase):
+    # streams close the database connection, which TestCase's transaction
+    # doesn't survive
+
+    def setUp(self):
+        caches['default'].clear()
+        user_cache.clear()
+        self.alice = create_user('alice')
+        self.bob = create_user('bob')
+        self.carol = create_user('carol')
+        self.addCleanup(setattr, streaming, 'broker', streaming.broker)
+        streaming.broker = streaming.Broker(keepalive=3600)
+
+    def login(self, user):
+        self.client.post('/login', {'username': user.username, 'password': user.username})
+
+    def event_ids(self, messages):
+        return [int(re.match(r'id: (\d+)\n', message).group(1)) for message in messages]
+
+    def test_public_stream(self):
+        first = Tweet.objects.create(user=self.bob, text="first")
+        second = Tweet.objects.create(user=self.carol, text="second")
+        events = iter(streaming.stream(since_id=first.id, duration=60))
+        self.assertEqual(next(events), "retry: {}\n\n".format(streaming.RETRY))
+        # the backlog, then the live tweets not already sent
+        message = next(events)
+        self.assertEqual(self.event_ids([message]), [second.id])
+        data = json.loads(message.split("data: ", 1)[1])
+        self.assertEqual(data["user"], "carol")
+        self.assertEqual(data["html"], second.pretty_text)
+        third = Tweet.objects.create(user=self.alice, text="third")
+        streaming.publish(second)
+        streaming.publish(third)
+        self.assertEqual(self.event_ids([next(events)]), [third.id])
+        streaming.broker.tick()
+        self.assertEqual(next(events), ": keepalive\n\n")
+        # leaving the stream early unsubscribes
+        events.close()
+        self.assertEqual(streaming.broker.count(), 0)
+
+    def test_home_stream(self):
+        Relationship.objects.create(who_id=self.alice.id, whom_id=self.bob.id)
+        events = streaming.stream(self.alice.id, duration=60)
+        iterator = iter(events)
+        next(iterator)
+        streaming.publish(Tweet.objects.create(user=self.carol, text="not followed"))
+        tweet = Tweet.objects.create(user=self.bob, text="followed")
+        streaming.publish(tweet)
+        self.assertEqual(self.event_ids([next(iterator)]), [tweet.id])
+        events.close()
+        self.assertEqual(streaming.broker.count(), 0)
+
+    def test_end(self):
+        events = streaming.stream(duration=0)
+        self.assertEqual(list(events), ["retry: {}\n\n".format(streaming.RETRY)])
+        self.assertEqual(streaming.broker.count(), 0)
+
+    def test_publish_many(self):
+        subscriber = streaming.broker.subscribe()
+        tweets = [Tweet.objects.create(user=self.bob, text="one"),
+                  Tweet.objects.create(user=self.carol, text="two")]
+        streaming.publish_many([Tweet.objects.get(id=tweet.id) for tweet in reversed(tweets)])
+        self.assertEqual(self.event_ids(message for _, message in subscriber.get()),
+                         [tweet.id for tweet in tweets])
+
+    def test_view(self):
+        self.assertEqual(self.client.get('/stream').status_code, 403)
+        self.login(self.alice)
+        tweet = Tweet.objects.create(user=self.bob, text="hello")
+        response = self.client.get('/stream', HTTP_LAST_EVENT_ID=str(tweet.id - 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        self.assertIn('no-cache', response['Cache-Control'])
+        content = iter(response.streaming_content)
+        next(content)
+        self.assertEqual(self.event_ids([next(content)]), [tweet.id])
+        response.close()
+        self.assertEqual(streaming.broker.count(), 0)
+
+    def test_new_tweet(self):
+        subscriber = streaming.broker.subscribe(set([self.alice.id]))
+        self.login(self.alice)
+        self.client.post('/alice/tweets/new', {'text': 'live'})
+        tweet = Tweet.objects.get(text='live')
+        self.assertEqual(self.event_ids(message for _, message in subscriber.get()), [tweet.id])
+
+    def test_bad_since_id(self):
+        self.login(self.alice)
+        response = self.client.get('/tweets/alice/followings/stream?since_id=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(streaming.broker.count(), 0)
+
+    def test_too_many_streams(self):
+        self.login(self.alice)
+        with self.settings(STREAMING_MAX_STREAMS=1):
+            streaming.broker.subscribe()
+            response = self.client.get('/stream')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(views.STREAM_RETRY_AFTER))
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={})
+class FollowingsTimelineTests(AppTestCase):
+
+    def test_own_timeline(self):
+        self.login(self.alice)
+        self.follow(self.bob)
+        Tweet.objects.create(user=self.alice, text="mine")
+        self.login(self.bob)
+        self.tweet(self.bob, "followed")
+        self.login(self.alice)
+        response = self.client.get('/tweets/alice/followings')
+        self.assertContains(response, "followed")
+        self.assertNotContains(response, "mine")
+
+    def test_empty_timeline_of_another_user(self):
+        self.login(self.alice)
+        response = self.client.get('/tweets/bob/followings')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.bob)
+
+
+@override_settings(JOBS_ASYNC=False, RATE_LIMITS={'new_tweet': (2, 60)})
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        user_cache.clear()
+
+    def test_generate_load_data(self):
+        call_command('generate_load_data', users=20, tweets=200, followings=3, days=7, stdout=StringIO())
+        users = User.objects.filter(username__startswith='load')
+        self.assertEqual(users.count(), 20)
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 20)
+        self.assertEqual(Tweet.objects.count(), 200)
+        self.assertFalse(Relationship.objects.filter(who_id=F('whom_id')).exists())
+        # the first users are the most followed ones
+        follower_counts = list(UserProfile.objects.order_by('user_id').values_list('follower_count', flat=True))
+        self.assertTrue(sum(follower_counts[:5]) > sum(follower_counts[-5:]))
+        # counters, timelines and the search index are up to date
+        for user in users:
+            self.assertEqual(user.profile.tweet_count, Tweet.objects.filter(user=user).count())
+            self.assertEqual(user.profile.following_count, Relationship.objects.filter(who_id=user.id).count())
+        for who_id, whom_id in Relationship.objects.values_list('who_id', 'whom_id')[:10]:
+            self.assertTrue(self.home_tweet_ids_of(who_id) >= set(
+                Tweet.objects.filter(user_id=whom_id).values_list('id', flat=True)))
+        self.assertTrue(SearchTerm.objects.exists())
+        # ids follow the dates, within the last days
+        dates = list(Tweet.objects.order_by('id').values_list('created_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertTrue(dates[0] > timezone.now() - timedelta(days=7))
+        self.assertTrue(all(tweet.pretty_text for tweet in Tweet.objects.all()))
+        # a second run adds users under new names
+        call_command('generate_load_data', users=5, tweets=10, followings=2, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='load').count(), 25)
+
+    def test_generate_load_data_existing_users(self):
+        create_user('load0')
+        User.objects.filter(username='load0').update(username='load1')
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', users=5, tweets=10, stdout=StringIO())
+
+    def home_tweet_ids_of(self, user_id):
+        return set(TimelineEntry.objects.filter(user_id=user_id).values_list('tweet_id', flat=True))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark_pages.percentile(values, 0.5), 51)
+        self.assertEqual(benchmark_pages.percentile(values, 0.99), 100)
+        self.assertEqual(benchmark_pages.percentile([3], 0.95), 3)
+
+    def test_benchmark_pages_report(self):
+        call_command('generate_load_data', users=5, tweets=20, followings=2, stdout=StringIO())
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'run.json')
+        call_command('benchmark_pages', requests=3, users=2, scenarios=['index', 'relationship'],
+                     output=output, stdout=StringIO())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(sorted(report['results']), ['index', 'relationship'])
+        self.assertEqual(report['users'], 5)
+        self.assertEqual(report['requests'], 3)
+        for result in report['results'].values():
+            self.assertTrue(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] <= result['max_ms'])
+            self.assertTrue(result['queries'] > 0)
+            self.assertTrue(result['max_rss_kb'] > 0)
+
+        out = StringIO()
+        call_command('benchmark_pages', requests=3, users=2, scenarios=['index'], compare=output,
+                     tolerance=1000, stdout=out)
+        self.assertIn('index                p50_ms', out.getvalue())
+        self.assertNotIn('REGRESSION', out.getvalue())
+        # a baseline made much faster
+        for result in report['results'].values():
+            result['queries'] /= 100
+        with open(output, 'w') as f:
+            json.dump(report, f)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('benchmark_pages', requests=3, users=2, scenarios=['index'], compare=output,
+                         stdout=out)
+        self.assertIn('REGRESSION', out.getvalue())
+
+    def test_benchmark_pages_errors(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_pages', stdout=StringIO())
+        create_user('load0')
+        with self.assertRaises(CommandError):
+            call_command('benchmark_pages', scenarios=['timeline'], stdout=StringIO())
+
+    def test_benchmark_pages(self):
+        call_command('generate_load_data', users=5, tweets=50, followings=2, stdout=StringIO())
+        tweets = Tweet.objects.count()
+        out = StringIO()
+        # every request is made as the same user, above the write limits
+        call_command('benchmark_pages', requests=5, users=1, stdout=out)
+        for name in SCENARIOS:
+            self.assertIn(name, out.getvalue())
+        # the tweets of new_tweet are rolled back
+        self.assertEqual(Tweet.objects.count(), tweets)
@@ -0,0 +1,118 @@
+"""
+Profile picture thumbnails.
+
+Uploaded pictures are kept as they are; square thumbnails of each of SIZES
+are generated from them and stored as
+``thumbnails/<hash>-<size>.jpg``, where the hash is computed from the
+picture's content. Names change whenever the content does, so thumbnails
+can be served with a far-future Cache-Control header (see
+``twitter.views.thumbnail``).
+
+Generation reads and re-encodes images, so views only ``schedule()`` it as
+a job (see twitter.jobs). Until it has run, and for profiles saved before
+this existed, templates show the original picture; the generate_thumbnails
+command backfills those.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+
+from twitter import jobs
+from twitter.models import UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+# name => width and height in pixels
+SIZES = {
+    'small': 48,
+    'medium': 128,
+}
+DIRECTORY = 'thumbnails'
+JPEG_QUALITY = 85
+
+
+def thumbnail_name(picture_hash, size):
+    return '{}/{}-{}.jpg'.format(DIRECTORY, picture_hash, SIZES[size])
+
+
+def thumbnail_url(profile, size):
+    """
+    return the URL of the ``size`` thumbnail of ``profile``, or of the
+    original picture if it hasn't been generated yet
+    """
+    if not profile.picture:
+        return ''
+    if profile.picture_hash:
+        return settings.MEDIA_URL + thumbnail_name(profile.picture_hash, size)
+    return profile.picture.url
+
+
+def make_thumbnail(image, pixels):
+    """
+    return the JPEG bytes of ``image`` cropped to a square and resized to
+    ``pixels`` x ``pixels``
+    """
+    from PIL import Image, ImageOps
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    thumbnail = ImageOps.fit(image, (pixels, pixels), Image.ANTIALIAS)
+    output = BytesIO()
+    thumbnail.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def generate(profile):
+    """
+    write the thumbnails of ``profile`` and record their hash; return False
+    if the picture can't be read as an image
+    """
+    from PIL import Image
+    storage = profile.picture.storage
+    name = profile.picture.name
+    with storage.open(name, 'rb') as f:
+        content = f.read()
+    if get_image_dimensions(BytesIO(content)) is None:
+        logger.warning("Profile %s: %s is not an image.", profile.pk, name)
+        return False
+    picture_hash = hashlib.sha1(content).hexdigest()[:20]
+    image = Image.open(BytesIO(content))
+    for size, pixels in SIZES.items():
+        thumbnail = thumbnail_name(picture_hash, size)
+        if not storage.exists(thumbnail):
+            storage.save(thumbnail, ContentFile(make_thumbnail(image, pixels)))
+    # the picture may have been replaced meanwhile
+    current = UserProfile.objects.filter(pk=profile.pk).first()
+    if current is not None and current.picture.name == name:
+        current.picture_hash = picture_hash
+        # save() rather than update() so cached pages showing the profile
+        # are invalidated
+        current.save(update_fields=['picture_hash'])
+    return True
+
+
+def generate_for(profile_id):
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is not None and profile.picture:
+        generate(profile)
+
+
+def set_picture(profile, picture):
+    """
+    replace the picture of ``profile``; the old thumbnails stop being used
+    """
+    profile.picture = picture
+    profile.picture_hash = ''
+
+
+def schedule(profile):
+    """
+    generate the thumbnails of ``profile`` off the request path
+    """
+    if profile.picture and not profile.picture_hash:
+        # see twitter.tasks.generate_thumbnails
+        jobs.enqueue('generate_thumbnails', profile_id=profile.pk)
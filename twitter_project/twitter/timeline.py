@@ -0,0 +1,359 @@
+"""
+Materialized home timelines (fan-out on write).
+
+Every user owns a capped list of tweet ids, newest first, made of the tweets
+of the users they follow. The list is written when a tweet is posted and when
+a relationship changes, so reading a page of the home timeline only touches
+that page instead of every tweet in the database.
+
+The storage is pluggable through ``settings.TIMELINE_BACKEND``; use
+``get_timeline_store()`` to get the configured backend.
+"""
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import CursorPaginator
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from twitter import graph, routers
+from twitter.models import Tweet, TimelineEntry
+
+
+DEFAULT_BACKEND = 'twitter.timeline.DatabaseTimelineStore'
+DEFAULT_MAX_LENGTH = 800
+
+
+class BaseTimelineStore(object):
+    """
+    Interface shared by the timeline backends.
+
+    Tweet ids are kept in descending order; as ids are handed out in
+    insertion order this is the same as newest first.
+    """
+
+    def __init__(self, max_length=None):
+        if max_length is None:
+            max_length = getattr(settings, 'TIMELINE_MAX_LENGTH', DEFAULT_MAX_LENGTH)
+        self.max_length = max_length
+
+    def recent_tweet_ids(self, user_ids):
+        """
+        return the newest tweet ids written by any of ``user_ids``
+        """
+        if not user_ids:
+            return []
+        return list(Tweet.objects.filter(user_id__in=user_ids)
+                    .order_by('-id').values_list('id', flat=True)[:self.max_length])
+
+    def add_tweet(self, tweet, follower_ids=None):
+        """
+        push ``tweet`` to the timeline of every follower of its author
+        """
+        if follower_ids is None:
+            follower_ids = list(graph.follower_ids(tweet.user_id))
+        self.push(tweet.id, follower_ids)
+
+    def add_tweets(self, tweets):
+        """
+        push many tweets at once, looking up the followers of all their
+        authors with a single query
+        """
+        followers = graph.follower_ids_map(set(tweet.user_id for tweet in tweets))
+        self.push_many([(follower_id, tweet.id)
+                        for tweet in tweets for follower_id in set(followers[tweet.user_id])])
+
+    def remove_tweet(self, tweet, follower_ids=None):
+        if follower_ids is None:
+            follower_ids = list(graph.follower_ids(tweet.user_id))
+        self.discard([tweet.id], follower_ids)
+
+    def follow(self, user_id, followed_id):
+        """
+        merge the recent tweets of ``followed_id`` into ``user_id``'s timeline
+        """
+        self.merge(user_id, self.recent_tweet_ids([followed_id]))
+
+    def unfollow(self, user_id, followed_id):
+        """
+        remove the tweets of ``followed_id`` from ``user_id``'s timeline
+        """
+        # only the tweets in the timeline, which is capped, not all of them
+        tweet_ids = Tweet.objects.filter(id__in=self.get_tweet_ids(user_id), user_id=followed_id)
+        self.discard(list(tweet_ids.values_list('id', flat=True)), [user_id])
+
+    def rebuild(self, user_id):
+        """
+        recompute ``user_id``'s timeline from Relationship and Tweet
+        """
+        self.replace(user_id, self.recent_tweet_ids(list(graph.following_ids(user_id))))
+
+    def count(self, user_id):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a count() method')
+
+    def get_tweet_ids(self, user_id, start=0, stop=None):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a get_tweet_ids() method')
+
+    def get_tweet_ids_before(self, user_id, max_id=None, count=None):
+        """
+        return up to ``count`` tweet ids lower than ``max_id``, newest first
+        """
+        tweet_ids = self.get_tweet_ids(user_id)
+        if max_id is not None:
+            tweet_ids = [tweet_id for tweet_id in tweet_ids if tweet_id < max_id]
+        return tweet_ids[:count]
+
+    def get_tweet_ids_after(self, user_id, since_id, count=None):
+        """
+        return up to ``count`` tweet ids greater than ``since_id``, oldest first
+        """
+        tweet_ids = [tweet_id for tweet_id in reversed(self.get_tweet_ids(user_id))
+                     if tweet_id > since_id]
+        return tweet_ids[:count]
+
+    def push(self, tweet_id, user_ids):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a push() method')
+
+    def push_many(self, entries):
+        """
+        add many ``(user_id, tweet_id)`` entries
+        """
+        tweet_user_ids = defaultdict(list)
+        for user_id, tweet_id in entries:
+            tweet_user_ids[tweet_id].append(user_id)
+        for tweet_id, user_ids in sorted(tweet_user_ids.items()):
+            self.push(tweet_id, user_ids)
+
+    def merge(self, user_id, tweet_ids):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a merge() method')
+
+    def discard(self, tweet_ids, user_ids):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a discard() method')
+
+    def replace(self, user_id, tweet_ids):
+        raise NotImplementedError('subclasses of BaseTimelineStore must provide a replace() method')
+
+    def trim(self, user_id):
+        pass
+
+
+class DatabaseTimelineStore(BaseTimelineStore):
+    """
+    Keeps timelines in the TimelineEntry table.
+
+    Counting the entries of every follower on each push would cost more
+    than the push, so a timeline may grow past ``max_length``: ``merge()``
+    trims the timeline it wrote to, and ``push_many()`` trims each timeline
+    it wrote to with a probability of ``1 / trim_every``, i.e. about every
+    ``trim_every`` pushes. Counts and offset reads ignore the excess.
+    """
+    trim_every = 50
+
+    def __init__(self, max_length=None, trim_every=None):
+        super(DatabaseTimelineStore, self).__init__(max_length)
+        if trim_every is not None:
+            self.trim_every = trim_every
+
+    def entries(self, user_id):
+        return TimelineEntry.objects.filter(user_id=user_id).order_by('-tweet_id')
+
+    def count(self, user_id):
+        return min(self.entries(user_id).count(), self.max_length)
+
+    def get_tweet_ids(self, user_id, start=0, stop=None):
+        if stop is None or stop > self.max_length:
+            stop = self.max_length
+        return list(self.entries(user_id).values_list('tweet_id', flat=True)[start:stop])
+
+    def get_tweet_ids_before(self, user_id, max_id=None, count=None):
+        entries = self.entries(user_id)
+        if max_id is not None:
+            entries = entries.filter(tweet_id__lt=max_id)
+        return list(entries.values_list('tweet_id', flat=True)[:count])
+
+    def get_tweet_ids_after(self, user_id, since_id, count=None):
+        entries = self.entries(user_id).filter(tweet_id__gt=since_id).order_by('tweet_id')
+        return list(entries.values_list('tweet_id', flat=True)[:count])
+
+    def push(self, tweet_id, user_ids):
+        self.push_many([(user_id, tweet_id) for user_id in user_ids])
+
+    def push_many(self, entries):
+        entries = set(entries)
+        # entries already added, e.g. by follow(), are skipped so that
+        # pushing again is harmless
+        existing = set(TimelineEntry.objects.filter(tweet_id__in=set(tweet_id for _, tweet_id in entries))
+                       .values_list('user_id', 'tweet_id'))
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, tweet_id=tweet_id) for user_id, tweet_id in entries - existing
+        ])
+        for user_id in set(user_id for user_id, _ in entries):
+            if random.randrange(self.trim_every) == 0:
+                self.trim(user_id)
+
+    def merge(self, user_id, tweet_ids):
+        existing = set(TimelineEntry.objects.filter(user_id=user_id, tweet_id__in=tweet_ids)
+                       .values_list('tweet_id', flat=True))
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, tweet_id=tweet_id)
+            for tweet_id in tweet_ids if tweet_id not in existing
+        ])
+        self.trim(user_id)
+
+    def unfollow(self, user_id, followed_id):
+        self.entries(user_id).filter(tweet__user_id=followed_id).delete()
+
+    def discard(self, tweet_ids, user_ids):
+        if tweet_ids and user_ids:
+            TimelineEntry.objects.filter(user_id__in=user_ids, tweet_id__in=tweet_ids).delete()
+
+    def replace(self, user_id, tweet_ids):
+        with transaction.atomic():
+            self.entries(user_id).delete()
+            self.merge(user_id, tweet_ids)
+
+    def trim(self, user_id):
+        oldest = self.entries(user_id).values_list('tweet_id', flat=True)[self.max_length:self.max_length + 1]
+        if oldest:
+            self.entries(user_id).filter(tweet_id__lte=oldest[0]).delete()
+
+
+class CacheTimelineStore(BaseTimelineStore):
+    """
+    Keeps timelines as lists of tweet ids in ``django.core.cache``.
+
+    The cache alias is taken from ``settings.TIMELINE_CACHE`` (``default`` if
+    unset). A timeline missing from the cache is rebuilt from the database
+    the next time it is read, so evictions only cost a slower request.
+    Concurrent writers to the same timeline may lose an update; run the
+    rebuild_timelines command to repair a timeline.
+    """
+    key_prefix = 'timeline:'
+
+    def __init__(self, max_length=None, cache_alias=None):
+        super(CacheTimelineStore, self).__init__(max_length)
+        if cache_alias is None:
+            cache_alias = getattr(settings, 'TIMELINE_CACHE', 'default')
+        self.cache = caches[cache_alias]
+
+    def make_key(self, user_id):
+        return '{}{}'.format(self.key_prefix, user_id)
+
+    def load(self, user_id):
+        tweet_ids = self.cache.get(self.make_key(user_id))
+        if tweet_ids is None:
+            # a replica may miss the latest tweets, which would then be
+            # missing from the cached timeline
+            with routers.read_from_primary():
+                self.rebuild(user_id)
+            tweet_ids = self.cache.get(self.make_key(user_id), [])
+        return tweet_ids
+
+    def count(self, user_id):
+        return len(self.load(user_id))
+
+    def get_tweet_ids(self, user_id, start=0, stop=None):
+        return self.load(user_id)[start:stop]
+
+    def push(self, tweet_id, user_ids):
+        keys = dict((self.make_key(user_id), user_id) for user_id in user_ids)
+        # timelines that are not cached yet are rebuilt on their next read
+        cached = self.cache.get_many(list(keys))
+        updated = {}
+        for key, tweet_ids in cached.items():
+            if tweet_id not in tweet_ids:
+                updated[key] = sorted([tweet_id] + tweet_ids, reverse=True)[:self.max_length]
+        if updated:
+            self.cache.set_many(updated, None)
+
+    def push_many(self, entries):
+        user_tweet_ids = defaultdict(set)
+        for user_id, tweet_id in entries:
+            user_tweet_ids[self.make_key(user_id)].add(tweet_id)
+        cached = self.cache.get_many(list(user_tweet_ids))
+        updated = dict((key, sorted(user_tweet_ids[key] | set(tweet_ids), reverse=True)[:self.max_length])
+                       for key, tweet_ids in cached.items())
+        if updated:
+            self.cache.set_many(updated, None)
+
+    def merge(self, user_id, tweet_ids):
+        key = self.make_key(user_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            merged = sorted(set(cached) | set(tweet_ids), reverse=True)[:self.max_length]
+            self.cache.set(key, merged, None)
+
+    def discard(self, tweet_ids, user_ids):
+        tweet_ids = set(tweet_ids)
+        cached = self.cache.get_many([self.make_key(user_id) for user_id in user_ids])
+        updated = dict((key, [tweet_id for tweet_id in cached_ids if tweet_id not in tweet_ids])
+                       for key, cached_ids in cached.items())
+        if updated:
+            self.cache.set_many(updated, None)
+
+    def replace(self, user_id, tweet_ids):
+        self.cache.set(self.make_key(user_id), sorted(tweet_ids, reverse=True)[:self.max_length], None)
+
+
+class TimelineSequence(object):
+    """
+    A read-only sequence over a user's home timeline, suitable for Paginator.
+
+    Only the requested slice of tweet ids is read from the store and turned
+    into Tweet instances.
+    """
+
+    def __init__(self, store, user_id):
+        self.store = store
+        self.user_id = user_id
+
+    def count(self):
+        return self.store.count(self.user_id)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            tweet_ids = self.store.get_tweet_ids(self.user_id, k.start or 0, k.stop)
+            tweets = Tweet.objects.select_related('user__profile').in_bulk(tweet_ids)
+            # tweets deleted since they were pushed are skipped
+            return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+        return self[k:k + 1][0]
+
+
+class TimelinePaginator(CursorPaginator):
+    """
+    Cursor pagination over a user's home timeline, reading tweet ids from
+    the store with the same cursors as a Tweet QuerySet ordered by '-id'.
+    """
+
+    def __init__(self, store, user_id, per_page):
+        super(TimelinePaginator, self).__init__(Tweet.objects.all(), per_page, ordering=('-id',))
+        self.store = store
+        self.user_id = user_id
+
+    def get_objects(self, position, backwards, limit):
+        if backwards:
+            tweet_ids = self.store.get_tweet_ids_after(self.user_id, position[0], limit)
+        else:
+            max_id = position[0] if position is not None else None
+            tweet_ids = self.store.get_tweet_ids_before(self.user_id, max_id, limit)
+        tweets = Tweet.objects.select_related('user__profile').in_bulk(tweet_ids)
+        return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
+
+_store = None
+
+
+def get_timeline_store():
+    """
+    return the backend configured by ``settings.TIMELINE_BACKEND``
+    """
+    global _store
+    if _store is None:
+        backend = getattr(settings, 'TIMELINE_BACKEND', DEFAULT_BACKEND)
+        _store = import_string(backend)()
+    return _store
@@ -0,0 +1,252 @@
+"""
+Trending hashtags and mentions.
+
+Every tweet saved is scanned for ``#hashtags`` and ``@mentions`` (the
+post_save receiver below; bulk writers call ``tweets_posted()``), which are
+counted in a SlidingWindowCounter per kind kept in the memory of the
+process:
+
+* counts are kept in per-minute buckets arranged in a ring covering the
+  window (an hour by default); when a minute falls out of the window its
+  bucket is subtracted from the running totals, so the totals always
+  describe the window without rescanning anything;
+* with a half-life, each occurrence is weighted by how recent it is, so a
+  tag that was popular 50 minutes ago ranks below one that is popular now;
+* the ranking is recomputed from the totals at most once per
+  ``refresh`` seconds, so answering "top N over the last hour" is a lookup.
+
+A process starts with an empty window and fills it from the tweets of the
+last hour on first use, reading only those. Each process then counts the
+tweets it saves itself: with several worker processes, the trends of one
+process are a sample of the whole stream.
+"""
+from __future__ import division
+
+import calendar
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from twitter.models import Tweet
+
+
+HASHTAG_RE = re.compile(r'(?<![\w#/])#(\w+)', re.UNICODE)
+MENTION_RE = re.compile(r'(?<![\w@])@(\w+)', re.UNICODE)
+
+KINDS = ('hashtags', 'mentions')
+WINDOW = 60 * 60
+BUCKET = 60
+HALF_LIFE = 30 * 60
+
+
+def extract_hashtags(text):
+    return set('#' + tag.lower() for tag in HASHTAG_RE.findall(text))
+
+
+def extract_mentions(text):
+    return set('@' + name for name in MENTION_RE.findall(text))
+
+
+class SlidingWindowCounter(object):
+    """
+    Decayed counts of terms over the last ``window`` seconds, in buckets of
+    ``bucket`` seconds.
+
+    With a ``half_life`` an occurrence counts for 1 when it happens and half
+    as much ``half_life`` seconds later. To avoid touching every count as
+    time passes, weights are stored relative to a fixed origin: an
+    occurrence at ``t`` adds ``2 ** ((t - origin) / half_life)``, and scores
+    are divided by the weight of "now" when they are read. The origin is
+    moved forward before the weights get too large.
+    """
+    max_exponent = 64
+
+    def __init__(self, window=WINDOW, bucket=BUCKET, half_life=HALF_LIFE, refresh=1):
+        self.bucket = bucket
+        self.length = int(math.ceil(window / bucket))
+        self.half_life = half_life
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.buckets = [defaultdict(float) for _ in range(self.length)]
+            # the bucket number held by each slot of the ring
+            self.slots = [None] * self.length
+            self.newest = None
+            self.totals = defaultdict(float)
+            self.origin = None
+            self.ranking = []
+            self.ranked_at = None
+            self.ranking_size = 0
+
+    def weight(self, timestamp):
+        if not self.half_life:
+            return 1.0
+        return 2 ** ((timestamp - self.origin) / self.half_life)
+
+    def add(self, terms, timestamp=None):
+        """
+        count one occurrence of each of ``terms`` at ``timestamp`` (now by
+        default); occurrences older than the window are ignored
+        """
+        if not terms:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        number = int(timestamp // self.bucket)
+        with self.lock:
+            self._advance(number)
+            slot = number % self.length
+            if self.slots[slot] != number:
+                return
+            self._check_origin(timestamp)
+            weight = self.weight(timestamp)
+            bucket = self.buckets[slot]
+            for term in terms:
+                bucket[term] += weight
+                self.totals[term] += weight
+
+    def top(self, n=10, now=None):
+        """
+        return the ``n`` terms with the highest scores as ``(term, score)``
+        pairs; the ranking is at most ``refresh`` seconds old
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if (self.ranked_at is None or now - self.ranked_at >= self.refresh
+                    or n > self.ranking_size):
+                self._advance(int(now // self.bucket))
+                self._check_origin(now)
+                scale = self.weight(now)
+                size = max(n, 100)
+                self.ranking = [
+                    (term, score / scale)
+                    for term, score in heapq.nlargest(size, self.totals.items(), key=lambda item: item[1])
+                ]
+                self.ranked_at = now
+                self.ranking_size = size
+            return self.ranking[:n]
+
+    def _advance(self, number):
+        """
+        make the bucket ``number`` the newest one, expiring the buckets that
+        fall out of the window
+        """
+        if self.newest is not None and number <= self.newest:
+            return
+        start = number - self.length + 1
+        if self.newest is not None:
+            start = max(start, self.newest + 1)
+        for n in range(start, number + 1):
+            slot = n % self.length
+            if self.slots[slot] is not None:
+                self._expire(slot)
+            self.slots[slot] = n
+        self.newest = number
+
+    def _expire(self, slot):
+        totals = self.totals
+        for term, weight in self.buckets[slot].items():
+            total = totals[term] - weight
+            # drop terms whose occurrences all left the window, allowing
+            # for rounding errors
+            if total <= weight * 1e-9:
+                del totals[term]
+            else:
+                totals[term] = total
+        self.buckets[slot] = defaultdict(float)
+
+    def _check_origin(self, timestamp):
+        if self.origin is None:
+            self.origin = timestamp
+        elif self.half_life and abs(timestamp - self.origin) / self.half_life > self.max_exponent:
+            self._rebase(timestamp)
+
+    def _rebase(self, timestamp):
+        factor = 2 ** ((self.origin - timestamp) / self.half_life)
+        for bucket in self.buckets:
+            for term in bucket:
+                bucket[term] *= factor
+        for term in self.totals:
+            self.totals[term] *= factor
+        self.origin = timestamp
+
+
+counters = dict((kind, SlidingWindowCounter(
+    window=getattr(settings, 'TRENDS_WINDOW', WINDOW),
+    half_life=getattr(settings, 'TRENDS_HALF_LIFE', HALF_LIFE),
+)) for kind in KINDS)
+
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def count_tweet(text, timestamp=None):
+    counters['hashtags'].add(extract_hashtags(text), timestamp)
+    counters['mentions'].add(extract_mentions(text), timestamp)
+
+
+def tweets_posted(tweets):
+    """
+    count ``tweets``; bulk writers call it themselves as bulk_create sends
+    no signals
+    """
+    if not _loaded:
+        # load_recent() will read them
+        return
+    for tweet in tweets:
+        count_tweet(tweet.text)
+
+
+def to_timestamp(value):
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1000000
+
+
+def load_recent():
+    """
+    count the tweets of the last window; the scan stops at the newest tweet
+    older than the window, so it only reads the window's tweets
+    """
+    window = getattr(settings, 'TRENDS_WINDOW', WINDOW)
+    cutoff = timezone.now() - timedelta(seconds=window)
+    last_old_id = (Tweet.objects.filter(created_date__lt=cutoff).order_by('-id')
+                   .values_list('id', flat=True).first()) or 0
+    rows = Tweet.objects.filter(id__gt=last_old_id).values_list('text', 'created_date')
+    for text, created_date in rows.iterator():
+        count_tweet(text, to_timestamp(created_date))
+
+
+def ensure_loaded():
+    global _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                load_recent()
+                _loaded = True
+
+
+def get_trends(kind, n=10):
+    """
+    return the top ``n`` terms of ``kind`` (one of KINDS) over the window
+    as ``(term, score)`` pairs
+    """
+    ensure_loaded()
+    return counters[kind].top(n)
+
+
+@receiver(post_save, sender=Tweet, dispatch_uid='twitter.trends.tweet_saved')
+def tweet_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        tweets_posted([instance])
@@ -1,5 +1,5 @@
 from django.conf.urls import url, include, patterns
-from twitter import views
+from twitter import api, views
 
 
 urlpatterns = patterns('',
@@ -7,12 +7,22 @@ urlpatterns = patterns('',
                        url(r'^login$', views.user_login, name='login'),
                        url(r'^(?P<user_name>(\w)+)/edit$',views.user_edit,name='edit_user'),
                        url(r'^(?P<user_name>(\w)+)/tweets/new$', views.new_tweet, name='new_tweet'),
+                       url(r'^(?P<user_name>(\w)+)/tweets/bulk$', views.bulk_tweets, name='bulk_tweets'),
+                       url(r'^(?P<user_name>(\w)+)/export$', views.user_export, name='user_export'),
                        url(r'^logout$', views.user_logout, name='logout'),
                        url(r'^register$', views.user_register, name='register'),
                        url(r'^tweets/(?P<user_name>(\w)+)$', views.user_timeline, name='a'),
                        # url(r'^tweets/(?P<user_name>(\w)+)/followers$',views.followers_timeline,name='followers_timeline'),
                        url(r'^tweets/(?P<user_name>(\w)+)/followings$',views.followings_timeline,name='followers_timeline'),
+                       url(r'^tweets/(?P<user_name>(\w)+)/followings/stream$',views.tweet_stream,name='followings_stream'),
                        url(r'^tweets/(?P<user_name>(\w)+)/relationship$',views.relationship,name='relationship'),
+                       url(r'^search$',views.tweet_search,name='search'),
+                       url(r'^stream$',views.tweet_stream,name='stream'),
+                       url(r'^trends$',views.trending,name='trends'),
+                       url(r'^api/1/tweets$',api.public_timeline,name='api_public_timeline'),
+                       url(r'^api/1/users/(?P<user_name>\w+)$',api.profile,name='api_profile'),
+                       url(r'^api/1/users/(?P<user_name>\w+)/tweets$',api.user_timeline,name='api_user_timeline'),
+                       url(r'^api/1/users/(?P<user_name>\w+)/home$',api.home_timeline,name='api_home_timeline'),
                        url(r'^about$',views.about)
                        )
 
@@ -2,40 +2,79 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.contrib.messages.storage import session
-from django.http import HttpResponse,HttpResponseRedirect
+from django.http import HttpResponse,HttpResponseRedirect,HttpResponseForbidden,HttpResponseNotAllowed,JsonResponse,StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.template.defaultfilters import register
 from twitter.forms import UserForm, UserProfileForm,TweetForm
+from twitter import counters, export, graph, ingest, jobs, routers, search, streaming, thumbnails, trends
 from twitter.models import Tweet, UserProfile,Relationship
+from twitter.timeline import get_timeline_store, TimelineSequence, TimelinePaginator
 from django.template.defaultfilters import register
 from django.template.defaultfilters import stringfilter
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import Paginator, CursorPaginator, EmptyPage, InvalidPage, PageNotAnInteger
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.http import Http404
 from django.core.exceptions import  ObjectDoesNotExist
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+import os
 
 
 
 PER_TWEET = 10
+PER_USER = 20
+MAX_TRENDS = 50
+TWEET_ORDERING = ("-created_date", "-id")
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+STREAM_RETRY_AFTER = 30
+
+
+def cursor_pagination():
+    """
+    Timelines are paginated with ?cursor= instead of ?page= when
+    settings.TIMELINE_PAGINATION is "cursor".
+    """
+    return getattr(settings, "TIMELINE_PAGINATION", "page") == "cursor"
+
+
+def get_page(request, paginator):
+    if isinstance(paginator, CursorPaginator):
+        try:
+            return paginator.page(request.GET.get('cursor'))
+        except InvalidPage:
+            return paginator.page()
+    page = request.GET.get('page') or 1
+    try:
+        return paginator.page(page)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def get_user(request, user_name):
+    """
+    return the User named ``user_name``, reusing the logged-in user
+    """
+    user = request.dwitter_user
+    if user is not None and user.username == user_name:
+        return user
+    return User.objects.select_related('profile').get(username = user_name)
 
 
 def index(request):
-    _tweets = Tweet.objects.order_by("-created_date").all()
+    _tweets = Tweet.objects.select_related('user__profile').order_by("-created_date")
     # show 2 tweets per page
-    paginator = Paginator(_tweets,PER_TWEET)
-    page = request.GET.get('page') or 1
-
-    try:
+    if cursor_pagination():
+        paginator = CursorPaginator(_tweets,PER_TWEET,ordering=TWEET_ORDERING)
+    else:
+        paginator = Paginator(_tweets,PER_TWEET)
 
-        #show public timeline
-        tweets = paginator.page(page)
-    except EmptyPage:
-        tweets = paginator.page(paginator.num_pages)
+    #show public timeline
+    tweets = get_page(request, paginator)
 
 
 
-    if request.session.get("username") is None:
+    if request.dwitter_user is None:
         title = "Dwitter - About"
         return render(request,"twitter/about.html",{
             "title": title
@@ -43,7 +82,7 @@ def index(request):
     else:
 
         title = "Timeline - Dwitter"
-        user =  User.objects.get(username = request.session.get("username"))
+        user = request.dwitter_user
         return render(request, "twitter/index.html",
             {
                 "title": title,
@@ -86,40 +125,33 @@ def user_edit(request,user_name):
             print("INVALID")
 
         if profile_form.is_valid():
-            profile_form.save()
+            profile_form.save(commit=False)
 
         if 'picture' in request.FILES:
-            user.profile.picture = request.FILES['picture']
-        user.profile.save()
+            thumbnails.set_picture(user.profile, request.FILES['picture'])
+        # not save(), which would write back the counters read above
+        counters.save_profile(user.profile)
+        thumbnails.schedule(user.profile)
 
         return redirect("/{}/edit".format(user.username))
 
 
 def followings_timeline(request,user_name):
-    user = User.objects.get(username = user_name)
-    login_user =  User.objects.get(username = request.session.get("username"))
-    # follower's users
-    users = user.profile.followings()
-    __tweets = Tweet.objects.order_by("-created_date").all()
-    _tweets = [tweet for tweet in __tweets if tweet.user in users]
-
-    paginator = Paginator(_tweets,PER_TWEET)
-    page = request.GET.get('page') or 1
-    title = "Timeline - Dwitter"
-    try:
-        tweets = paginator.page(page)
-    except EmptyPage:
-        tweets =   paginator.page(paginator.num_pages)
-
-    if user_name == request.session.get("username"):
-        user = login_user
+    user = get_user(request, user_name)
+    login_user = request.dwitter_user
+    # tweets of the users followed, read from the materialized home timeline
+    if cursor_pagination():
+        paginator = TimelinePaginator(get_timeline_store(), user.id, PER_TWEET)
     else:
-        user = tweets[0].user
+        paginator = Paginator(TimelineSequence(get_timeline_store(), user.id),PER_TWEET)
+    title = "Timeline - Dwitter"
+    tweets = get_page(request, paginator)
     return render(request, "twitter/index.html",
         {
             "tweets": tweets,
             "login_user": login_user,
             "user": user,
+            "timeline_user": user,
             "title": title
         })
 
@@ -141,8 +173,9 @@ def user_register(request):
             profile = profile_form.save(commit=False)
             profile.user = user
             if 'picture' in request.FILES:
-                profile.picture = request.FILES['picture']
+                thumbnails.set_picture(profile, request.FILES['picture'])
             profile.save()
+            thumbnails.schedule(profile)
         else:
             print("Error")
             print(profile_form.errors)
@@ -161,37 +194,53 @@ def user_register(request):
         })
 
 def relationship(request,user_name):
-    whom_user = User.objects.get(username = user_name)
+    whom_user = get_user(request, user_name)
     whom_id = whom_user.id
 
-    who_user =  User.objects.get(username = request.session.get("username"))
+    who_user = request.dwitter_user
 
     who_id = who_user.id
     if request.method == "POST":
+        # decide from the primary, and show the change on the next pages
+        routers.pin_to_primary(request)
 
         meth_type = request.POST.get("meth_type")
         if meth_type == "post":
             # follow
-            relationship = Relationship.objects.create(who_id=who_id, whom_id = whom_id)
-            relationship.save()
+            # (who_id, whom_id) is unique, so a repeated follow is a no-op
+            relationship, created = Relationship.objects.get_or_create(who_id=who_id, whom_id = whom_id)
+            if created:
+                jobs.enqueue("relationship_changed", who_id=who_id, whom_id=whom_id, followed=True)
             return HttpResponseRedirect("/tweets/{}".format(user_name))
         else:
             # unfollow
             relationship = Relationship.objects.filter(who_id = who_id,whom_id = whom_id).first()
-            relationship.delete()
+            if relationship is not None:
+                relationship.delete()
+                jobs.enqueue("relationship_changed", who_id=who_id, whom_id=whom_id, followed=False)
             return HttpResponseRedirect("/tweets/{}".format(user_name))
     elif request.method == "GET":
-        user =  User.objects.get(username =  user_name)
+        user = whom_user
         #  show follower/followings by keyward of url.
         _type = request.GET.get("type")
         if _type == "followers":
-            rel_users = user.profile.followers()
+            _rel_users = graph.followers(user.id)
         else:
-            rel_users = user.profile.followings()
+            _rel_users = graph.followings(user.id)
+
+        paginator = Paginator(_rel_users,PER_USER)
+        page = request.GET.get('page') or 1
+        try:
+            rel_users = paginator.page(page)
+        except EmptyPage:
+            rel_users = paginator.page(paginator.num_pages)
+        # which of the listed users the logged-in user follows, in one query
+        followed = graph.following_pairs((who_id, rel_user.id) for rel_user in rel_users)
 
         return  render(request,"twitter/relationship_list.html",{
             "login_user": user,
             "rel_users": rel_users,
+            "followed_ids": set(whom_id for _, whom_id in followed),
             "type": _type
         })
 
@@ -210,9 +259,92 @@ def new_tweet(request,user_name):
         tweet = tweet_form.save(commit=False)
         tweet.user = user
         tweet.save()
+        routers.pin_to_primary(request)
+        # fan-out and counters, see twitter.tasks
+        jobs.enqueue("tweet_posted", tweet_id=tweet.id, user_id=user.id)
+        streaming.publish(tweet)
         return HttpResponse("success")
 
 
+def tweet_stream(request, user_name=None):
+    """
+    Stream the new tweets of the public timeline (of the home timeline of
+    ``user_name``) as Server-Sent Events, starting after ?since_id= or the
+    Last-Event-ID of a reconnecting client.
+    """
+    if request.dwitter_user is None:
+        return HttpResponseForbidden()
+    user_id = None if user_name is None else get_user(request, user_name).id
+    since_id = request.META.get("HTTP_LAST_EVENT_ID") or request.GET.get("since_id")
+    try:
+        since_id = int(since_id) if since_id else None
+    except ValueError:
+        return HttpResponse("Bad since_id.", status=400)
+    events = streaming.stream(user_id, since_id)
+    if events is None:
+        # every stream holds a thread, keep some for the pages
+        response = HttpResponse("Too many open streams, try again later.", status=503,
+                                content_type="text/plain")
+        response["Retry-After"] = STREAM_RETRY_AFTER
+        return response
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    patch_cache_control(response, no_cache=True)
+    # don't let nginx buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def tweet_search(request):
+    query = request.GET.get("q", "")
+    login_user = request.dwitter_user
+    paginator = search.SearchPaginator(query,PER_TWEET)
+    try:
+        tweets = paginator.page(request.GET.get("cursor"))
+    except InvalidPage:
+        tweets = paginator.page()
+    return render(request, "twitter/search.html",
+        {
+            "title": "Search - Dwitter",
+            "query": query,
+            "tweets": tweets,
+            "login_user": login_user
+        })
+
+
+def trending(request):
+    """
+    Return the top hashtags (or mentions with ?kind=mentions) of the last
+    hour as JSON, e.g. {"kind": "hashtags", "trends": [{"term": "#django",
+    "score": 12.5}]}.
+    """
+    kind = request.GET.get("kind", "hashtags")
+    if kind not in trends.KINDS:
+        return JsonResponse({"error": "'kind' must be one of %s." % ", ".join(trends.KINDS)}, status=400)
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), MAX_TRENDS)
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be an integer."}, status=400)
+    return JsonResponse({
+        "kind": kind,
+        "trends": [{"term": term, "score": round(score, 2)} for term, score in trends.get_trends(kind, limit)],
+    })
+
+
+@csrf_exempt
+def bulk_tweets(request,user_name):
+    """
+    Create the tweets of a newline-delimited JSON request body, e.g.
+    {"text": "hello"} on each line, as the logged-in user.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    if user_name != request.session.get("username"):
+        return HttpResponseForbidden()
+    user = request.dwitter_user
+    result = ingest.ingest(request, user=user)
+    return JsonResponse(result.as_dict())
+
+
 def user_login(request):
     if request.method == "POST":
         username = request.POST["username"]
@@ -244,19 +376,21 @@ def user_logout(request):
 
 
 def user_timeline(request,user_name):
-    login_user = User.objects.get(username = request.session.get("username"))
+    login_user = request.dwitter_user
 
 
     try:
-        user= User.objects.get(username = user_name)
+        user = get_user(request, user_name)
         title = "{} - Dwitter".format(user.username)
     except ObjectDoesNotExist:
         title = None
         raise Http404
     _tweets = user.tweets.order_by("-created_date").all()
-    paginator = Paginator(_tweets,PER_TWEET)
-    page = request.GET.get('page') or 1
-    tweets = paginator.page(page)
+    if cursor_pagination():
+        paginator = CursorPaginator(_tweets,PER_TWEET,ordering=TWEET_ORDERING)
+    else:
+        paginator = Paginator(_tweets,PER_TWEET)
+    tweets = get_page(request, paginator)
     return render(request,"twitter/user.html",{
         "tweets": tweets,
         "user_tweets": user.tweets,
@@ -264,3 +398,29 @@ def user_timeline(request,user_name):
         "user": user,
         "login_user": login_user
     })
+
+
+def user_export(request,user_name):
+    """
+    Download the tweets, followings and followers of the logged-in user as
+    a zip archive, or as NDJSON with ?format=ndjson.
+    """
+    if user_name != request.session.get("username"):
+        return HttpResponseForbidden()
+    format = request.GET.get("format", "zip")
+    if format not in export.FORMATS:
+        return HttpResponse("Unknown format.", status=400)
+    _, content_type, extension = export.FORMATS[format]
+    response = StreamingHttpResponse(export.export(request.dwitter_user, format), content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="dwitter-{}.{}"'.format(user_name, extension)
+    return response
+
+
+def thumbnail(request, path):
+    """
+    Serve a profile picture thumbnail. Their names contain the hash of their
+    content, so they can be cached forever.
+    """
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, thumbnails.DIRECTORY))
+    patch_cache_control(response, public=True, max_age=THUMBNAIL_MAX_AGE)
+    return response
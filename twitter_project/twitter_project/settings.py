@@ -53,14 +53,22 @@ dependencies = [
 ]
 
 MIDDLEWARE_CLASSES = (
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'twitter.middleware.ReplicaRoutingMiddleware',
+    'twitter.middleware.DwitterUserMiddleware',
+    'twitter.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
 
+if DEBUG:
+    # Log the N+1 queries of each request, see django/db/nplusone.py
+    MIDDLEWARE_CLASSES += ('django.middleware.nplusone.NPlusOneMiddleware',)
+
 ROOT_URLCONF = 'twitter_project.urls'
 
 WSGI_APPLICATION = 'twitter_project.wsgi.application'
@@ -114,3 +122,63 @@ STATICFILES_DIRS = (
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(PROJECT_PATH,'media')
 
+
+# Materialized home timelines, see twitter/timeline.py
+TIMELINE_BACKEND = 'twitter.timeline.DatabaseTimelineStore'
+TIMELINE_MAX_LENGTH = 800
+# "page" for ?page= numbers, "cursor" for keyset pagination with ?cursor=
+TIMELINE_PAGINATION = 'page'
+
+# Template fragment caching, see twitter/fragments.py. Hit/miss statistics
+# are kept in the same cache, so use a shared backend to see them from the
+# fragment_stats command.
+FRAGMENT_CACHE = 'default'
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# How long request.dwitter_user is reused by each process, see
+# twitter/middleware.py
+DWITTER_USER_CACHE_TIMEOUT = 10
+
+# Trending hashtags and mentions, see twitter/trends.py: the window and the
+# half-life of the weight of an occurrence, in seconds
+TRENDS_WINDOW = 60 * 60
+TRENDS_HALF_LIFE = 30 * 60
+
+# Side effects of writes are queued in the Job table and run by the
+# run_jobs command, which must run next to the web server (restart.sh starts
+# it); set to False to run them during the request instead. See
+# twitter/jobs.py
+JOBS_ASYNC = True
+JOBS_MAX_ATTEMPTS = 5
+
+# Live timelines, see twitter/streaming.py: how many streams a process
+# serves at once, each holding one of the threads of gunicorn.conf.py
+STREAMING_MAX_STREAMS = 150
+
+# Read replicas of the default database, see twitter/routers.py. Each alias
+# must also be defined in DATABASES, e.g. for local testing with SQLite
+# copies refreshed by the sync_replicas command:
+#     DATABASES['replica1'] = {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': os.path.join(BASE_DIR, 'db.replica1.sqlite3'),
+#         'TEST': {'MIRROR': 'default'},
+#     }
+#     DATABASE_REPLICAS = ['replica1']
+DATABASE_ROUTERS = ['twitter.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+# seconds during which a user who wrote reads from the primary
+DATABASE_REPLICA_LAG = 5
+
+# Write rate limits, see twitter/ratelimit.py: URL name => (burst, period in
+# seconds), i.e. up to burst requests at once and burst per period after that
+RATE_LIMITS = {
+    'new_tweet': (10, 60),
+    'bulk_tweets': (5, 60),
+    'relationship': (30, 60),
+}
+RATE_LIMIT_CACHE = 'default'
+
+# Data exports, see twitter/export.py: where their chunks are generated, and
+# for how many seconds a download reuses them
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+EXPORT_MAX_AGE = 24 * 60 * 60
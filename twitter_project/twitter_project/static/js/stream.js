@@ -0,0 +1,51 @@
+
+$(document).ready(function(){
+
+  // prepend the tweets posted since the page was rendered
+  if (!window.EventSource || !window.streamUrl){
+    return;
+  }
+  // milliseconds before trying again when the server has no stream free
+  var busyDelay = 30000;
+
+  function connect(){
+    var first = $(".tweet").first();
+    var url = window.streamUrl;
+    if (first.length){
+      url += "?since_id=" + first.data("id");
+    }
+    var source = new EventSource(url);
+    source.addEventListener("tweet", showTweet);
+    source.onerror = function(){
+      // EventSource gives up on an error status such as 503
+      if (source.readyState === EventSource.CLOSED){
+        setTimeout(connect, busyDelay);
+      }
+    };
+  }
+
+  function showTweet(e){
+    var tweet = JSON.parse(e.data);
+    if ($(".tweet[data-id=" + tweet.id + "]").length){
+      return;
+    }
+    var div = $("<div class='tweet'/>").attr("data-id", tweet.id);
+    if (tweet.picture){
+      $("<img/>").attr("src", tweet.picture).appendTo(div);
+    }
+    $("<span class='username'/>").append(
+      $("<a/>").attr("href", "/tweets/" + tweet.user).text(tweet.user)
+    ).appendTo(div);
+    $("<span class='date right'/>").text(tweet.created_date).appendTo(div);
+    // already escaped, see twitter.rendering
+    $("<p class='text clear'/>").html(tweet.html).appendTo(div);
+    var newest = $(".tweet").first();
+    if (newest.length){
+      div.insertBefore(newest);
+    } else {
+      div.insertAfter($(".inner-area"));
+    }
+  }
+
+  connect();
+});
@@ -9,6 +9,7 @@ print(settings.STATIC_ROOT)
 urlpatterns = [
     url(r'', include('twitter.urls')),
     url(r'^admin/',include(admin.site.urls)),
+    url(r'^media/thumbnails/(?P<path>.*)$', 'twitter.views.thumbnail'),
     url(r'media/(?P<path>.*)', django.views.static.serve,
      {'document_root': settings.MEDIA_ROOT}),
     url(r'^static/(?P<path>.*)$', 'django.views.static.serve', {'document_root' : settings.STATIC_ROOT})